@@ -0,0 +1,182 @@
+"""
+Maintenance commands for the quiz backend.
+
+Usage (from the backend/ directory):
+    python -m app.cli parity <quiz_id>
+    python -m app.cli rebuild-features [--quiz-id N] [--check]
+    python -m app.cli ensure-indexes [--verify]
+    python -m app.cli export-emotion-onnx [--output PATH] [--quantize]
+    python -m app.cli archive-cleanup [--retention-days N]
+    python -m app.cli rebuild-results [--user-id ID]
+    python -m app.cli migrate-emotions [--batch-size N] [--dry-run]
+    python -m app.cli export {responses,summaries} [--quiz-id N] [--since ISO] [--until ISO]
+                             [--format ndjson|csv|parquet] [--compression none|gzip|zstd] [--output PATH]
+"""
+import argparse
+import json
+import sys
+from datetime import datetime
+
+
+def cmd_parity(args) -> int:
+    from app.routers.analysis import check_aggregation_parity
+
+    report = check_aggregation_parity(args.quiz_id)
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if report["mismatches"] else 0
+
+
+def cmd_rebuild_features(args) -> int:
+    from app.models.database import get_db
+    from app.routers.analysis import FEATURE_PROJECTION, check_accumulator_consistency
+    from app.services.feature_store import rebuild_accumulators
+
+    db = get_db()
+    rebuilt = rebuild_accumulators(db, FEATURE_PROJECTION, args.quiz_id)
+    print(json.dumps({"rebuilt": rebuilt}, indent=2))
+    if not args.check:
+        return 0
+
+    failed = 0
+    for quiz_id in rebuilt:
+        report = check_accumulator_consistency(quiz_id)
+        failed += len(report["mismatches"])
+        print(json.dumps(report, indent=2, default=str))
+    return 1 if failed else 0
+
+
+def cmd_ensure_indexes(args) -> int:
+    from app.models.database import get_db
+    from app.models.indexes import ensure_indexes, verify_query_plans
+
+    db = get_db()
+    report = ensure_indexes(db)
+    print(json.dumps(report, indent=2))
+    failed = any(r["error"] for r in report.values())
+    if args.verify:
+        plans = verify_query_plans(db)
+        print(json.dumps(plans, indent=2))
+        failed = failed or not plans["ok"]
+    return 1 if failed else 0
+
+
+def cmd_export_emotion_onnx(args) -> int:
+    from app.core.config import settings
+    from app.services.emotion_backends import export_onnx
+
+    path = export_onnx(args.output or settings.FER_ONNX_PATH, quantize=args.quantize)
+    print(json.dumps({"exported": path}, indent=2))
+    return 0
+
+
+def cmd_archive_cleanup(args) -> int:
+    from app.core.config import settings
+    from app.services.image_archive import cleanup
+
+    days = args.retention_days if args.retention_days is not None else settings.IMAGE_ARCHIVE_RETENTION_DAYS
+    print(json.dumps(cleanup(days), indent=2))
+    return 0
+
+
+def cmd_rebuild_results(args) -> int:
+    from app.models.database import get_db
+    from app.services.results_view import rebuild_results, rebuild_user_results
+
+    db = get_db()
+    if args.user_id is not None:
+        rebuilt = 0 if rebuild_user_results(db, args.user_id) is None else 1
+    else:
+        rebuilt = rebuild_results(db)
+    print(json.dumps({"users": rebuilt}, indent=2))
+    return 0
+
+
+def cmd_migrate_emotions(args) -> int:
+    from app.models.database import get_db
+    from app.services.emotion_codec import migrate_responses
+
+    db = get_db()
+    report = migrate_responses(db, batch_size=args.batch_size, dry_run=args.dry_run)
+    print(json.dumps({**report, "dry_run": args.dry_run}, indent=2))
+    return 0
+
+
+def cmd_export(args) -> int:
+    from app.core.config import settings
+    from app.models.database import get_db
+    from app.routers.analysis import CAT_FEATURES, NUM_FEATURES
+    from app.services.export import build_export
+
+    db = get_db()
+    chunks, _, filename = build_export(
+        db, args.dataset, args.format, args.compression, NUM_FEATURES, CAT_FEATURES,
+        quiz_id=args.quiz_id, since=args.since, until=args.until,
+        batch_size=settings.EXPORT_BATCH_SIZE,
+        row_group_size=settings.EXPORT_ROW_GROUP_SIZE,
+    )
+    path = args.output or filename
+    written = 0
+    with (sys.stdout.buffer if path == "-" else open(path, "wb")) as out:
+        for chunk in chunks:
+            out.write(chunk)
+            written += len(chunk)
+    if path != "-":
+        print(json.dumps({"output": path, "bytes": written}, indent=2))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("parity", help="Check single-pass quiz aggregation against the per-user path")
+    p.add_argument("quiz_id", type=int)
+    p.set_defaults(func=cmd_parity)
+
+    p = sub.add_parser("rebuild-features", help="Backfill/repair quiz_user_features from raw responses")
+    p.add_argument("--quiz-id", type=int, default=None, help="Only this quiz (default: every quiz)")
+    p.add_argument("--check", action="store_true", help="Verify against aggregate_user_quiz_features afterwards")
+    p.set_defaults(func=cmd_rebuild_features)
+
+    p = sub.add_parser("ensure-indexes", help="Create the declared indexes (idempotent)")
+    p.add_argument("--verify", action="store_true", help="Fail if any hot query plans a COLLSCAN")
+    p.set_defaults(func=cmd_ensure_indexes)
+
+    p = sub.add_parser("export-emotion-onnx", help="Export the deepface emotion model to ONNX for FER_MODEL_BACKEND=onnx")
+    p.add_argument("--output", default=None, help="Target .onnx file (default: FER_ONNX_PATH)")
+    p.add_argument("--quantize", action="store_true", help="Also write an int8 dynamically quantized copy (<name>.int8.onnx)")
+    p.set_defaults(func=cmd_export_emotion_onnx)
+
+    p = sub.add_parser("archive-cleanup", help="Delete archived frames past retention")
+    p.add_argument("--retention-days", type=float, default=None, help="Default: IMAGE_ARCHIVE_RETENTION_DAYS")
+    p.set_defaults(func=cmd_archive_cleanup)
+
+    p = sub.add_parser("rebuild-results", help="Backfill user_results from user_recommendations")
+    p.add_argument("--user-id", default=None, help="Only this student (default: every student)")
+    p.set_defaults(func=cmd_rebuild_results)
+
+    p = sub.add_parser("migrate-emotions", help="Rewrite legacy averaged_emotions/dominant_emotion as emotion_vector/dominant_code")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--dry-run", action="store_true", help="Only report what would change")
+    p.set_defaults(func=cmd_migrate_emotions)
+
+    p = sub.add_parser("export", help="Stream responses or per-student summaries to a file")
+    p.add_argument("dataset", choices=["responses", "summaries"])
+    p.add_argument("--quiz-id", type=int, default=None, help="Only this quiz (default: every quiz)")
+    p.add_argument("--since", type=datetime.fromisoformat, default=None, help="Inclusive lower bound (ISO 8601)")
+    p.add_argument("--until", type=datetime.fromisoformat, default=None, help="Exclusive upper bound (ISO 8601)")
+    p.add_argument("--format", choices=["ndjson", "csv", "parquet"], default="ndjson")
+    p.add_argument("--compression", choices=["none", "gzip", "zstd"], default="none")
+    p.add_argument("--output", default=None, help="Target file, - for stdout (default: <dataset>_<scope>.<ext>)")
+    p.set_defaults(func=cmd_export)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
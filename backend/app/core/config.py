@@ -8,9 +8,93 @@ class Settings(BaseSettings):
         env="MONGODB_URI"
     )
     DATABASE_NAME: str = Field(..., env="DATABASE_NAME")
+
+    # Shared MongoClient pool sizing and timeouts
+    MONGO_MAX_POOL_SIZE: int = Field(100, env="MONGO_MAX_POOL_SIZE")
+    MONGO_MIN_POOL_SIZE: int = Field(0, env="MONGO_MIN_POOL_SIZE")
+    MONGO_MAX_IDLE_TIME_MS: int = Field(60000, env="MONGO_MAX_IDLE_TIME_MS")
+    MONGO_WAIT_QUEUE_TIMEOUT_MS: int = Field(2000, env="MONGO_WAIT_QUEUE_TIMEOUT_MS")
+    MONGO_CONNECT_TIMEOUT_MS: int = Field(5000, env="MONGO_CONNECT_TIMEOUT_MS")
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = Field(5000, env="MONGO_SERVER_SELECTION_TIMEOUT_MS")
   
     MODEL_PATH: str = Field(..., env="MODEL_PATH")
     STORAGE_PATH: str = Field(..., env="STORAGE_PATH")
+
+    # FER micro-batching: frames from concurrent submissions share one model call
+    FER_BATCH_MAX_FRAMES: int = Field(32, env="FER_BATCH_MAX_FRAMES")
+    FER_BATCH_WINDOW_MS: float = Field(15, env="FER_BATCH_WINDOW_MS")
+
+    # Frame ingestion limits and reduced-size grayscale decoding
+    FER_MAX_FRAME_BYTES: int = Field(512 * 1024, env="FER_MAX_FRAME_BYTES")
+    FER_MAX_FRAME_PIXELS: int = Field(1920 * 1080, env="FER_MAX_FRAME_PIXELS")
+    FER_MAX_PACKED_FACES: int = Field(16, env="FER_MAX_PACKED_FACES")
+    FER_DECODE_MIN_SIDE: int = Field(160, env="FER_DECODE_MIN_SIDE")
+
+    # Face detection: deepface detector backend, and box tracking across one answer's frames
+    # (FER_FACE_TRACKING: "off" | "roi" | "reuse")
+    FER_DETECTOR_BACKEND: str = Field("opencv", env="FER_DETECTOR_BACKEND")
+    FER_FACE_TRACKING: str = Field("roi", env="FER_FACE_TRACKING")
+    FER_TRACK_MARGIN: float = Field(0.5, env="FER_TRACK_MARGIN")
+    FER_TRACK_MIN_CONFIDENCE: float = Field(0.5, env="FER_TRACK_MIN_CONFIDENCE")
+
+    # Emotion classifier backend: "keras" (deepface) or "onnx" (exported, optionally int8, onnxruntime CPU)
+    FER_MODEL_BACKEND: str = Field("keras", env="FER_MODEL_BACKEND")
+    FER_ONNX_PATH: str = Field("app/model_artifacts/emotion.onnx", env="FER_ONNX_PATH")
+    FER_ONNX_THREADS: int = Field(1, env="FER_ONNX_THREADS")
+
+    # FER inference executor: worker processes (0 = run in the API process) and admission limit
+    FER_WORKERS: int = Field(2, env="FER_WORKERS")
+    FER_MAX_QUEUE: int = Field(64, env="FER_MAX_QUEUE")
+    FER_RETRY_AFTER_S: int = Field(2, env="FER_RETRY_AFTER_S")
+
+    # Two-stage submit-answer: persist as "pending" and fill emotions in the background
+    FER_ASYNC_MODE: bool = Field(False, env="FER_ASYNC_MODE")
+    FER_PIPELINE_BATCH: int = Field(16, env="FER_PIPELINE_BATCH")
+    # a batch that raises is re-queued after FER_RETRY_AFTER_S, doubling up to the cap, this many times
+    FER_PIPELINE_MAX_ATTEMPTS: int = Field(5, env="FER_PIPELINE_MAX_ATTEMPTS")
+    FER_PIPELINE_MAX_BACKOFF_S: float = Field(60, env="FER_PIPELINE_MAX_BACKOFF_S")
+
+    # WebSocket emotion streaming: per-connection buffer and frame rate, finalize wait, idle expiry
+    FER_STREAM_BUFFER: int = Field(4, env="FER_STREAM_BUFFER")
+    FER_STREAM_MAX_FPS: float = Field(2, env="FER_STREAM_MAX_FPS")
+    FER_STREAM_FINALIZE_TIMEOUT_S: float = Field(1.0, env="FER_STREAM_FINALIZE_TIMEOUT_S")
+    FER_STREAM_IDLE_TTL_S: float = Field(300, env="FER_STREAM_IDLE_TTL_S")
+
+    # Raw frame archive under STORAGE_PATH/archive (content-addressed, written in the background)
+    IMAGE_ARCHIVE_ENABLED: bool = Field(False, env="IMAGE_ARCHIVE_ENABLED")
+    IMAGE_ARCHIVE_QUEUE: int = Field(256, env="IMAGE_ARCHIVE_QUEUE")
+    IMAGE_ARCHIVE_RETENTION_DAYS: float = Field(30, env="IMAGE_ARCHIVE_RETENTION_DAYS")
+    IMAGE_ARCHIVE_CLEANUP_INTERVAL_S: float = Field(3600, env="IMAGE_ARCHIVE_CLEANUP_INTERVAL_S")
+
+    # analyze_quiz: upserts per bulk_write round-trip
+    ANALYSIS_WRITE_CHUNK_SIZE: int = Field(500, env="ANALYSIS_WRITE_CHUNK_SIZE")
+
+    # Streaming exports: rows per cursor batch / encoded chunk, rows per Parquet row group
+    EXPORT_BATCH_SIZE: int = Field(1000, env="EXPORT_BATCH_SIZE")
+    EXPORT_ROW_GROUP_SIZE: int = Field(50000, env="EXPORT_ROW_GROUP_SIZE")
+
+    # Read-through cache for quiz definitions (per process)
+    QUIZ_CACHE_MAX_ENTRIES: int = Field(256, env="QUIZ_CACHE_MAX_ENTRIES")
+    QUIZ_CACHE_TTL_S: float = Field(30, env="QUIZ_CACHE_TTL_S")
+
+    # Lifespan warm-up of the recommendation model (FER workers always warm up when spawned)
+    WARMUP_ON_STARTUP: bool = Field(True, env="WARMUP_ON_STARTUP")
+
+    # Recommendation model registry: versions used when MODEL_ARTIFACT_DIR/active.json is absent
+    # ("" = the top-level artifact / no shadow), hot-reload polling (0 = off), mmap'd joblib loading
+    MODEL_VERSION: str = Field("", env="MODEL_VERSION")
+    MODEL_SHADOW_VERSION: str = Field("", env="MODEL_SHADOW_VERSION")
+    MODEL_WATCH_INTERVAL_S: float = Field(10, env="MODEL_WATCH_INTERVAL_S")
+    MODEL_MMAP: bool = Field(True, env="MODEL_MMAP")
+
+    # Opt-in pyinstrument profiling: sample this share of requests, keep profiles slower than PROFILE_SLOW_MS (0 = off)
+    PROFILE_SLOW_MS: float = Field(0, env="PROFILE_SLOW_MS")
+    PROFILE_SAMPLE_RATE: float = Field(0.1, env="PROFILE_SAMPLE_RATE")
+    PROFILE_INTERVAL_S: float = Field(0.001, env="PROFILE_INTERVAL_S")
+
+    # Index provisioning at startup; verification refuses to start on any COLLSCAN
+    MONGO_ENSURE_INDEXES: bool = Field(True, env="MONGO_ENSURE_INDEXES")
+    MONGO_VERIFY_QUERY_PLANS: bool = Field(False, env="MONGO_VERIFY_QUERY_PLANS")
     
     class Config:
         env_file = ".env"
@@ -0,0 +1,65 @@
+"""
+Startup profile: how long the process spent importing and warming up, and
+whether it is ready to take traffic.
+
+Heavy stacks (deepface/TensorFlow, OpenCV, joblib/sklearn, pandas) are
+imported lazily by the code that needs them; each of those imports and every
+warm-up step is recorded here as a named stage. ``/ready`` reports this.
+"""
+import importlib
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+_started = time.perf_counter()
+
+
+class StartupProfile:
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.ready = False
+        self.ready_after_ms: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block under ``name``; errors are recorded and re-raised"""
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except Exception as exc:
+            error = f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            with self._lock:
+                self.stages[name] = {
+                    "ms": round((time.perf_counter() - started) * 1000, 1),
+                    "ok": error is None,
+                    "error": error,
+                }
+
+    def mark_ready(self):
+        self.ready = True
+        self.ready_after_ms = round((time.perf_counter() - _started) * 1000, 1)
+
+    def mark_stopping(self):
+        self.ready = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {k: dict(v) for k, v in self.stages.items()}
+        return {"ready": self.ready, "ready_after_ms": self.ready_after_ms, "stages": stages}
+
+
+startup = StartupProfile()
+
+
+def lazy_import(module: str):
+    """Import ``module`` on first use, timing the first import as ``import:<module>``"""
+    if module in sys.modules:
+        return sys.modules[module]
+    with startup.stage(f"import:{module}"):
+        return importlib.import_module(module)
@@ -1,13 +1,69 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from starlette.middleware.sessions import SessionMiddleware  # ✅ Add this
-from app.routers import quiz, recommendations, login, admin_login, analysis
+from app.core.config import settings
+from app.core.startup import startup
+from app.services.profiling import RequestTimingMiddleware
 
-app = FastAPI()
+with startup.stage("import:app"):
+    from app.models.database import get_db, init_client, close_client, init_async_client, close_async_client
+    from app.models.indexes import ensure_indexes, verify_query_plans
+    from app.routers import quiz, recommendations, login, admin_login, analysis, metrics, export
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # ✅ One shared MongoClient per process: connect once, close on shutdown
+    with startup.stage("connect:mongodb"):
+        await asyncio.to_thread(init_client)
+        await init_async_client()
+
+    # ✅ Make sure every hot query has its index before serving
+    if settings.MONGO_ENSURE_INDEXES:
+        with startup.stage("ensure_indexes"):
+            await asyncio.to_thread(ensure_indexes, get_db())
+    if settings.MONGO_VERIFY_QUERY_PLANS:
+        plans = await asyncio.to_thread(verify_query_plans, get_db())
+        if not plans["ok"]:
+            raise RuntimeError(f"Queries would run a COLLSCAN: {plans['collscans']}")
+
+    # ✅ Spawn and warm the FER worker pool before accepting traffic
+    with startup.stage("warmup:fer"):
+        await asyncio.to_thread(quiz.emotion_capture.start)
+    if settings.FER_ASYNC_MODE:
+        await quiz.emotion_pipeline.start()
+    await quiz.image_archive.start()
+
+    # ✅ Load and exercise the recommendation model once instead of on the first /analyze
+    if settings.WARMUP_ON_STARTUP:
+        with startup.stage("warmup:recommendation_model"):
+            await asyncio.to_thread(analysis.warm_up)
+    # ✅ Pick up newly activated/retrained model versions without a restart
+    analysis.registry.start_watcher(settings.MODEL_WATCH_INTERVAL_S)
+
+    startup.mark_ready()
+    yield
+    startup.mark_stopping()
+    analysis.registry.stop_watcher()
+    await quiz.emotion_pipeline.stop()
+    quiz.emotion_streams.close()
+    await quiz.image_archive.stop()
+    quiz.emotion_capture.shutdown()
+    close_client()
+    await close_async_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # ✅ Add Session Middleware BEFORE routers
 app.add_middleware(SessionMiddleware, secret_key="dev-secret")  # Replace with secure key
 
+# ✅ Request start stamp for stage timings, optional slow-request profiler
+app.add_middleware(RequestTimingMiddleware)
+
 # ✅ CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -53,6 +109,17 @@ app.include_router(
     prefix="/api/quizzes",
     tags=["Analysis"]
 )
+app.include_router(
+    metrics.router,
+    prefix="/api/metrics",
+    tags=["Metrics"]
+)
+app.include_router(metrics.prometheus_router)
+app.include_router(
+    export.router,
+    prefix="/api/export",
+    tags=["Export"]
+)
 
 
 
@@ -68,7 +135,20 @@ def health_check():
             "submit_answer": "/api/quiz/submit-answer",
             "get_recommendations": "/api/recommendations/{user_id}",
             "login": "/api/auth/login",
-            "admin_login": "/api/admin/login"
+            "admin_login": "/api/admin/login",
+            "ready": "/ready",
+            "fer_metrics": "/api/metrics/fer",
+            "prometheus": "/metrics",
+            "export": "/api/export/{responses|summaries}",
+            "db_pool": "/api/metrics/db-pool"
 
         }
     }
+
+
+# ✅ Readiness: 503 until the lifespan warm-up has finished
+@app.get("/ready", tags=["Health Check"])
+def readiness():
+    report = startup.snapshot()
+    report["fer_workers"] = quiz.emotion_capture.status()["workers"]
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
@@ -0,0 +1,66 @@
+from typing import Callable, Optional
+
+from pymongo import ReturnDocument
+from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+# One document per sequence: {"_id": <name>, "seq": <last allocated id>}
+COUNTERS = "counters"
+
+
+def _seed(db: Database, name: str, current_max: Callable[[], Optional[int]]) -> bool:
+    """
+    Make sure the counter starts at or above the ids already in use.
+    $max is atomic and idempotent, so racing seeders cannot move it backwards.
+    Runs before every allocation (both queries are indexed and ids are only
+    allocated by lecturer writes), so a new database or a dropped counters
+    collection is re-seeded rather than trusted from a per-process cache.
+    Returns False when current_max() reports that the owner does not exist.
+    """
+    value = current_max()
+    if value is None:
+        return False
+    db[COUNTERS].update_one({"_id": name}, {"$max": {"seq": int(value)}}, upsert=True)
+    return True
+
+
+def allocate(db: Database, name: str, n: int = 1) -> int:
+    """Atomically reserve n consecutive ids from a sequence; returns the first one"""
+    for attempt in range(2):
+        try:
+            doc = db[COUNTERS].find_one_and_update(
+                {"_id": name},
+                {"$inc": {"seq": n}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            return doc["seq"] - n + 1
+        except DuplicateKeyError:
+            # two first-time upserts raced; the document exists now
+            if attempt:
+                raise
+
+
+def allocate_quiz_id(db: Database) -> int:
+    def current_max():
+        last = db.quizzes.find_one({}, {"_id": 0, "quizId": 1}, sort=[("quizId", -1)])
+        return last["quizId"] if last else 0
+
+    _seed(db, "quizId", current_max)
+    return allocate(db, "quizId")
+
+
+def allocate_question_ids(db: Database, quiz_id: int, n: int = 1) -> Optional[int]:
+    """First of n new questionIds for a quiz, or None if the quiz does not exist"""
+    def current_max():
+        doc = db.quizzes.find_one(
+            {"quizId": quiz_id},
+            {"_id": 0, "max_qid": {"$max": "$questions.questionId"}},
+        )
+        if doc is None:
+            return None
+        return doc.get("max_qid") or 0
+
+    if not _seed(db, f"quiz:{quiz_id}:questions", current_max):
+        return None
+    return allocate(db, f"quiz:{quiz_id}:questions", n)
@@ -1,16 +1,123 @@
-import certifi
-from pymongo import MongoClient
+import threading
+from typing import Dict, Optional
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.monitoring import ConnectionPoolListener
 from app.core.config import settings
 
-def get_db():
-    client = MongoClient(
-        settings.MONGODB_URI.get_secret_value(),  # Retrieve MongoDB URI from settings
-      
-        connectTimeoutMS=5000,  # Connection timeout in ms
-        serverSelectionTimeoutMS=5000  # Timeout for server selection
+
+class PoolStats(ConnectionPoolListener):
+    """Connection-pool event counters for the shared client (exposed on /api/metrics/db-pool)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.created = 0
+        self.closed = 0
+        self.checked_out = 0
+        self.checked_in = 0
+        self.checkout_failed = 0
+        self.pool_cleared = 0
+
+    def _bump(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def pool_cleared(self, event): self._bump("pool_cleared")
+    def connection_created(self, event): self._bump("created")
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._bump("closed")
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): self._bump("checkout_failed")
+    def connection_checked_out(self, event): self._bump("checked_out")
+    def connection_checked_in(self, event): self._bump("checked_in")
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "open_connections": self.created - self.closed,
+                "in_use": self.checked_out - self.checked_in,
+                "created": self.created,
+                "closed": self.closed,
+                "checkouts": self.checked_out,
+                "checkout_failed": self.checkout_failed,
+                "pool_cleared": self.pool_cleared,
+                "max_pool_size": settings.MONGO_MAX_POOL_SIZE,
+                "min_pool_size": settings.MONGO_MIN_POOL_SIZE,
+            }
+
+
+pool_stats = PoolStats()
+_client: Optional[MongoClient] = None
+_async_client: Optional[AsyncMongoClient] = None
+_client_lock = threading.Lock()
+
+
+def _client_options() -> Dict[str, object]:
+    return dict(
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,  # Connection timeout in ms
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,  # Timeout for server selection
+        event_listeners=[pool_stats],
     )
-    # Test the connection to MongoDB
-    client.admin.command('ping')
-    return client[settings.DATABASE_NAME]  # Return the database specified in settings
 
-db = get_db()  # Initialize the database connection
+
+def get_client() -> MongoClient:
+    """The application-wide client; its connection pool is shared by every request"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = MongoClient(
+                    settings.MONGODB_URI.get_secret_value(),  # Retrieve MongoDB URI from settings
+                    **_client_options(),
+                )
+    return _client
+
+
+def get_async_client() -> AsyncMongoClient:
+    """Non-blocking client for the async routes (same pool settings as the sync one)"""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncMongoClient(
+            settings.MONGODB_URI.get_secret_value(),
+            **_client_options(),
+        )
+    return _async_client
+
+
+def init_client():
+    """Called from the lifespan hook: connect and test the connection once at startup"""
+    get_client().admin.command('ping')
+
+
+async def init_async_client():
+    await get_async_client().admin.command('ping')
+
+
+def close_client():
+    """Called from the lifespan hook on shutdown; a later get_client() connects afresh"""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+async def close_async_client():
+    global _async_client
+    client, _async_client = _async_client, None
+    if client is not None:
+        await client.close()
+
+
+def get_db():
+    return get_client()[settings.DATABASE_NAME]  # Return the database specified in settings
+
+def get_async_db() -> AsyncDatabase:
+    return get_async_client()[settings.DATABASE_NAME]
@@ -0,0 +1,118 @@
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.database import Database
+from pymongo.errors import OperationFailure
+
+# ——— Required indexes per collection ———
+# Every router query below is expected to be served by one of these.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "responses": [
+        # find {quiz_id, user_id}, find {quiz_id}, distinct("user_id", {quiz_id})
+        IndexModel([("quiz_id", ASCENDING), ("user_id", ASCENDING)], name="quiz_user"),
+    ],
+    "quizzes": [
+        # lookups by quizId and the "latest quizId" sort in create_quiz
+        IndexModel([("quizId", DESCENDING)], name="quizId_unique", unique=True),
+    ],
+    "students": [
+        IndexModel([("username", ASCENDING)], name="username_unique", unique=True),
+    ],
+    "lecturers": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "user_recommendations": [
+        # {user_id, quiz_id} upserts and {user_id} result reads
+        IndexModel([("user_id", ASCENDING), ("quiz_id", ASCENDING)], name="user_quiz_unique", unique=True),
+    ],
+    "quiz_summary_scores": [
+        IndexModel([("user_id", ASCENDING), ("quiz_id", ASCENDING)], name="user_quiz_unique", unique=True),
+    ],
+    "quiz_user_features": [
+        IndexModel([("quiz_id", ASCENDING), ("user_id", ASCENDING)], name="quiz_user_unique", unique=True),
+    ],
+    "quiz_feature_state": [
+        # one reconciliation marker per quiz (feature_store.ensure_quiz_accumulators)
+        IndexModel([("quiz_id", ASCENDING)], name="quiz_unique", unique=True),
+    ],
+    "user_results": [
+        # one materialized results document per student
+        IndexModel([("user_id", ASCENDING)], name="user_unique", unique=True),
+    ],
+}
+
+
+def ensure_indexes(db: Database) -> Dict[str, Dict[str, Any]]:
+    """
+    Create every declared index (create_indexes is a no-op for existing ones).
+    Failures such as duplicate keys blocking a unique index are reported, not raised.
+    """
+    report: Dict[str, Dict[str, Any]] = {}
+    for name, models in INDEXES.items():
+        try:
+            created = db[name].create_indexes(models)
+            report[name] = {"indexes": created, "error": None}
+        except OperationFailure as exc:
+            report[name] = {"indexes": [], "error": str(exc)}
+    return report
+
+
+# ——— Query-plan verification ———
+def _representative_queries(db: Database):
+    """(label, explain thunk) for each hot router query"""
+    def find(coll, flt, sort=None, limit=0):
+        def run():
+            cursor = db[coll].find(flt)
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            return cursor.explain()
+        return run
+
+    def distinct(coll, key, flt):
+        def run():
+            return db.command("explain", {"distinct": coll, "key": key, "query": flt})
+        return run
+
+    return [
+        ("responses by quiz+user", find("responses", {"quiz_id": 1, "user_id": "1"})),
+        ("responses by quiz", find("responses", {"quiz_id": 1})),
+        ("responses distinct user_id", distinct("responses", "user_id", {"quiz_id": 1})),
+        ("quizzes by quizId", find("quizzes", {"quizId": 1})),
+        ("quizzes latest quizId", find("quizzes", {}, sort=[("quizId", DESCENDING)], limit=1)),
+        ("students by username", find("students", {"username": "x"})),
+        ("lecturers by email", find("lecturers", {"email": "x"})),
+        ("user_recommendations by user+quiz", find("user_recommendations", {"user_id": "1", "quiz_id": 1})),
+        ("user_recommendations by user", find("user_recommendations", {"user_id": "1"})),
+        ("quiz_summary_scores by user+quiz", find("quiz_summary_scores", {"user_id": "1", "quiz_id": 1})),
+        ("quiz_user_features by quiz", find("quiz_user_features", {"quiz_id": 1})),
+        ("user_results by user", find("user_results", {"user_id": "1"})),
+    ]
+
+
+def _stages(plan: Any) -> List[str]:
+    """All plan stage names found anywhere in an explain document"""
+    found: List[str] = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            found.append(plan["stage"])
+        for value in plan.values():
+            found.extend(_stages(value))
+    elif isinstance(plan, list):
+        for value in plan:
+            found.extend(_stages(value))
+    return found
+
+
+def verify_query_plans(db: Database) -> Dict[str, Any]:
+    """Explain every hot query and flag the ones whose winning plan is a COLLSCAN"""
+    checks, failures = [], []
+    for label, explain in _representative_queries(db):
+        planner = explain().get("queryPlanner", {})
+        stages = _stages(planner.get("winningPlan", {}))
+        entry = {"query": label, "stages": stages}
+        checks.append(entry)
+        if "COLLSCAN" in stages:
+            failures.append(label)
+    return {"ok": not failures, "collscans": failures, "checks": checks}
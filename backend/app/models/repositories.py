@@ -0,0 +1,146 @@
+"""
+Async data layer for the async routes.
+
+Each repository wraps one collection of the AsyncMongoClient database so
+route handlers await their DB round-trips instead of blocking the event loop.
+Offline jobs and the sync routes keep using app.models.database.get_db.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from fastapi import Depends
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import DuplicateKeyError
+
+from app.models.database import get_async_db
+from app.services.feature_store import (
+    COLLECTION as FEATURES, STATE_COLLECTION as FEATURE_STATE, REBUILD_FIELD, finished_change, pending_change,
+)
+from app.services.results_view import COLLECTION as RESULTS, results_entry
+
+logger = logging.getLogger(__name__)
+
+
+class QuizRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.col = db.quizzes
+
+    async def get(self, quiz_id: int, projection: Optional[Dict[str, int]] = None) -> Optional[Dict[str, Any]]:
+        return await self.col.find_one({"quizId": quiz_id}, projection or {"_id": 0})
+
+
+class ResponseRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.col = db.responses
+
+    async def insert(self, record: Dict[str, Any]) -> str:
+        result = await self.col.insert_one(record)
+        return str(result.inserted_id)
+
+    async def emotion_status(self, response_id: ObjectId) -> Optional[Dict[str, Any]]:
+        return await self.col.find_one(
+            {"_id": response_id},
+            {"_id": 0, "emotion_status": 1, "emotion_vector": 1, "dominant_code": 1, "dominant_emotion": 1, "emotion_error": 1},
+        )
+
+
+class FeatureRepository:
+    """Async counterpart of feature_store.record_response / record_pending"""
+
+    def __init__(self, db: AsyncDatabase):
+        self.col = db[FEATURES]
+        self.state = db[FEATURE_STATE]
+
+    async def _apply(self, change):
+        filter_, update, transition = change
+        for _ in range(3):
+            try:
+                await self.col.update_one(filter_, update, upsert=True)
+                return
+            except DuplicateKeyError:
+                # row under rebuild: hand the change to the rebuild's journal
+                journaled = await self.state.update_one(
+                    {"quiz_id": filter_["quiz_id"], REBUILD_FIELD: {"$exists": True}},
+                    {"$push": {"journal": transition}},
+                )
+                if journaled.matched_count:
+                    return
+        logger.warning("accumulator change for quiz %s dropped after repeated conflicts", filter_["quiz_id"])
+
+    async def record_response(self, record: Dict[str, Any]):
+        """record must be inserted already (it carries its _id)"""
+        await self._apply(finished_change(record))
+
+    async def record_pending(self, quiz_id: int, user_id: str, response_id: str):
+        await self._apply(pending_change(quiz_id, user_id, response_id))
+
+
+class StudentRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.col = db.students
+
+    async def by_username(self, username: str) -> Optional[Dict[str, Any]]:
+        return await self.col.find_one({"username": username})
+
+
+class LecturerRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.col = db.lecturers
+
+    async def by_email(self, email: str) -> Optional[Dict[str, Any]]:
+        return await self.col.find_one({"email": email})
+
+
+class RecommendationRepository:
+    def __init__(self, db: AsyncDatabase):
+        self.col = db.user_recommendations
+
+    async def for_user(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.col.find({"user_id": user_id}, {"_id": 0}).to_list(None)
+
+
+class ResultsRepository:
+    """Materialized per-student results (see services.results_view)"""
+
+    def __init__(self, db: AsyncDatabase):
+        self.col = db[RESULTS]
+        self.recommendations = db.user_recommendations
+
+    async def for_user(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        The student's results document. Until it has been backfilled (by
+        analyze_quiz or the rebuild-results command), the quizzes from
+        user_recommendations that it lacks are merged in on read, without
+        writing. This covers students not analyzed since the upgrade and
+        documents holding only the quizzes analyzed since then.
+        """
+        doc = await self.col.find_one({"user_id": user_id}, {"_id": 0})
+        if doc is not None and doc.get("backfilled"):
+            return doc
+        quizzes = (doc or {}).get("quizzes", {})
+        missing = {
+            str(reco["quiz_id"]): results_entry(reco["quiz_id"], reco)
+            async for reco in self.recommendations.find({"user_id": user_id}, {"_id": 0})
+            if str(reco["quiz_id"]) not in quizzes
+        }
+        if doc is None and not missing:
+            return None
+        # entries analyze_quiz already wrote are as new or newer
+        return {**(doc or {"user_id": user_id}), "quizzes": {**missing, **quizzes}}
+
+
+class Repositories:
+    def __init__(self, db: AsyncDatabase):
+        self.quizzes = QuizRepository(db)
+        self.responses = ResponseRepository(db)
+        self.features = FeatureRepository(db)
+        self.students = StudentRepository(db)
+        self.lecturers = LecturerRepository(db)
+        self.recommendations = RecommendationRepository(db)
+        self.results = ResultsRepository(db)
+
+
+def get_repos(db: AsyncDatabase = Depends(get_async_db)) -> Repositories:
+    """FastAPI dependency for the async routes"""
+    return Repositories(db)
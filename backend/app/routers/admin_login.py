@@ -1,7 +1,6 @@
 
 from fastapi import APIRouter, HTTPException, Form, Depends, Request
-from pymongo.database import Database
-from app.models.database import get_db
+from app.models.repositories import Repositories, get_repos
 
 router = APIRouter()
 
@@ -10,9 +9,9 @@ async def admin_login(
     request: Request,
     email: str = Form(...),
     password: str = Form(...),
-    db: Database = Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
-    lecturer = db.lecturers.find_one({"email": email})
+    lecturer = await repos.lecturers.by_email(email)
 
     if not lecturer or lecturer["password"] != password:
         raise HTTPException(status_code=401, detail="Invalid email or password")
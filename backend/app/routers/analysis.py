@@ -1,11 +1,21 @@
 # app/routers/analysis.py
 from fastapi import APIRouter, HTTPException
-from typing import Dict, Any, List
-from app.models.database import db
+from pydantic import BaseModel
+from typing import Dict, Any, List, Optional
+from pymongo import UpdateOne
+from app.core.config import settings
+from app.models.database import get_db
+from app.services.bulk_writer import chunked_bulk_write
+from app.services.feature_store import (
+      CAT_FEATURE_NAMES, NUM_FEATURE_NAMES, FeatureAccumulator,
+      accumulate_responses, ensure_quiz_accumulators, load_quiz_accumulators,
+)
+from app.services.model_registry import ModelRegistry, ModelVersion, UnknownModelVersion
+from app.services.results_view import COLLECTION as RESULTS, backfill_ops, results_entry, results_update
+from app.services.profiling import profiled
+from app.services.stage_metrics import StageTimer
 
-import os, json, joblib
-import numpy as np
-import pandas as pd
+import os, json
 
 router = APIRouter()
 
@@ -21,11 +31,25 @@ if not os.path.exists(MODEL_PATH):
 if not os.path.exists(META_PATH):
       raise RuntimeError(f"Metadata not found at: {META_PATH}")
 
-# Load model + metadata once at import
-model = joblib.load(MODEL_PATH)
+# Top-level metadata is read at import (the feature contract below); the sklearn
+# pipelines (joblib/sklearn/pandas) are loaded by the registry on first use or by
+# warm_up() from the app lifespan, and hot-swapped when another version is activated
 with open(META_PATH, "r", encoding="utf-8") as f:
       metadata = json.load(f)
 
+registry = ModelRegistry(
+      ARTIFACT_DIR,
+      NUM_FEATURE_NAMES + CAT_FEATURE_NAMES,
+      live_version=settings.MODEL_VERSION,
+      shadow_version=settings.MODEL_SHADOW_VERSION,
+      mmap=settings.MODEL_MMAP,
+)
+
+
+def get_model():
+      """The live sklearn pipeline"""
+      return registry.live().model
+
 # metadata.json uses "labels"
 LABELS = metadata.get("labels", [
       "BALANCED_IMPROVEMENT_NEEDED",
@@ -38,15 +62,6 @@ NUM_FEATURES = metadata.get(
 )
 CAT_FEATURES = metadata.get("cat_features", ["dominant_emotion"])
 
-# ---------------------------
-# Scoring constants
-# ---------------------------
-EMOTION_WEIGHTS = {
-      "neutral": 1, "happy": 0, "sad": 3, "angry": 4,
-      "fear": 5, "surprise": 0, "disgust": 4
-}
-NEG_EMOTIONS = {"sad", "angry", "fear", "disgust"}
-
 LABEL_HEADLINE = {
       "LOW_STRESS_GOOD_PROGRESS": "Low stress and steady accuracy — great trajectory.",
       "BALANCED_IMPROVEMENT_NEEDED": "Balanced progress — a bit more speed and accuracy will help.",
@@ -56,104 +71,94 @@ LABEL_HEADLINE = {
 # ---------------------------
 # Feature aggregation per (quiz, user)
 # ---------------------------
-def aggregate_user_quiz_features(quiz_id: int, user_id: str) -> Dict[str, Any]:
-      attempts = list(db.responses.find({"quiz_id": quiz_id, "user_id": user_id}))
-      if not attempts:
-            return {}
-
-      total = len(attempts)
-      wrong = 0
-      total_time = 0.0
-      over15 = 0
-      neg_count = 0
-
-      emo_counts: Dict[str, int] = {}
-      per_q_stress: List[float] = []
-
-      for a in attempts:
-            # dominant_emotion can be dict {"emotion": "..."} or a string
-            dom_emo = "neutral"
-            de = a.get("dominant_emotion")
-            if isinstance(de, dict):
-                  dom_emo = de.get("emotion", "neutral") or "neutral"
-            elif isinstance(de, str):
-                  dom_emo = de or "neutral"
-
-            time_taken = float(a.get("time_taken", 0))
-            is_correct = bool(a.get("is_correct", False))
-
-            total_time += time_taken
-            if time_taken > 15:
-                  over15 += 1
-            if not is_correct:
-                  wrong += 1
-            if dom_emo in NEG_EMOTIONS:
-                  neg_count += 1
-
-            emo_counts[dom_emo] = emo_counts.get(dom_emo, 0) + 1
-
-            # stress score = base(by emotion) + 0.5 if time>15 + 1 if wrong
-            base = EMOTION_WEIGHTS.get(dom_emo, 1)
-            stress = base + (0.5 if time_taken > 15 else 0) + (0 if is_correct else 1)
-            per_q_stress.append(stress)
-
-      avg_stress = round(float(np.mean(per_q_stress)), 4) if per_q_stress else 0.0
-      avg_time = round(total_time / total, 4) if total else 0.0
-      wrong_ratio = round(wrong / total, 4) if total else 0.0
-      time_over_15_ratio = round(over15 / total, 4) if total else 0.0
-      neg_emotion_ratio = round(neg_count / total, 4) if total else 0.0
-
-      dominant_emotion = max(emo_counts.items(), key=lambda kv: kv[1])[0] if emo_counts else "neutral"
+# Only the fields the features need; keeps the quiz-wide cursor small
+FEATURE_PROJECTION = {
+      "_id": 0, "user_id": 1, "dominant_code": 1, "dominant_emotion": 1, "time_taken": 1,
+      "is_correct": 1, "emotion_status": 1, "timestamp": 1,
+}
 
-      return {
-            "features": {
-                  "avg_stress": avg_stress,
-                  "wrong_ratio": wrong_ratio,
-                  "avg_time": avg_time,
-                  "time_over_15_ratio": time_over_15_ratio,
-                  "neg_emotion_ratio": neg_emotion_ratio,
-                  "dominant_emotion": dominant_emotion,
-            },
-            "summary": {
-                  "avg_stress_score": avg_stress,
-                  "avg_time": avg_time,
-                  "wrong_answers": wrong,
-                  "emotion_counts": emo_counts if emo_counts else {},
-                  "total_questions": total
-            }
-      }
+def aggregate_user_quiz_features(quiz_id: int, user_id: str) -> Dict[str, Any]:
+      # Responses still waiting for the emotion pipeline have no dominant emotion yet,
+      # so they are left out of the features and only reported as a count.
+      db = get_db()
+      acc = FeatureAccumulator()
+      for a in db.responses.find({
+            "quiz_id": quiz_id, "user_id": user_id, "emotion_status": {"$ne": "pending"}
+      }):
+            acc.add(a)
+      acc.pending = db.responses.count_documents({
+            "quiz_id": quiz_id, "user_id": user_id, "emotion_status": "pending"
+      })
+      return acc.result()
+
+def aggregate_quiz_features(quiz_id: int) -> Dict[str, Dict[str, Any]]:
+      """
+      Features for every user of a quiz from one streamed cursor.
+      Same accumulator as aggregate_user_quiz_features, and per-user response order
+      is preserved, so results (including dominant-emotion tie-breaks) are identical.
+      """
+      cursor = get_db().responses.find({"quiz_id": quiz_id}, FEATURE_PROJECTION, batch_size=1000)
+      return _results(accumulate_responses(cursor))
+
+def _results(accs: Dict[str, FeatureAccumulator]) -> Dict[str, Dict[str, Any]]:
+      results = {}
+      for uid, acc in accs.items():
+            agg = acc.result()
+            if agg:
+                  results[uid] = agg
+      return results
+
+def load_quiz_features(quiz_id: int) -> Dict[str, Dict[str, Any]]:
+      """
+      Features from the pre-aggregated quiz_user_features rows (kept current with $inc
+      by submit-answer). A quiz whose rows do not account for all of its responses
+      (answered before the accumulators existed) is rebuilt on first use.
+      """
+      return _results(ensure_quiz_accumulators(get_db(), quiz_id, FEATURE_PROJECTION))
+
+def check_aggregation_parity(quiz_id: int) -> Dict[str, Any]:
+      """Compare the single-pass aggregation against the per-user path for one quiz."""
+      batched = aggregate_quiz_features(quiz_id)
+      user_ids = get_db().responses.distinct("user_id", {"quiz_id": quiz_id})
+      mismatches = []
+      checked = 0
+      for uid in user_ids:
+            expected = aggregate_user_quiz_features(quiz_id, uid)
+            got = batched.get(uid, {})
+            checked += 1
+            if expected != got:
+                  mismatches.append({"user_id": uid, "expected": expected, "got": got})
+      return {"quiz_id": quiz_id, "users_checked": checked, "mismatches": mismatches}
+
+def check_accumulator_consistency(quiz_id: int) -> Dict[str, Any]:
+      """
+      Compare stored accumulators with aggregate_user_quiz_features for one quiz.
+      """
+      db = get_db()
+      stored = load_quiz_accumulators(db, quiz_id)
+      user_ids = set(stored) | set(db.responses.distinct("user_id", {"quiz_id": quiz_id}))
+      mismatches = []
+      for uid in sorted(user_ids, key=str):
+            expected = aggregate_user_quiz_features(quiz_id, uid)
+            got = stored[uid].result() if uid in stored else {}
+            if expected != got:
+                  mismatches.append({"user_id": uid, "expected": expected, "got": got})
+      return {"quiz_id": quiz_id, "users_checked": len(user_ids), "mismatches": mismatches}
 
 # ---------------------------
 # Hybrid decision (model + rules)
 # ---------------------------
-def decide_final_label(feats: Dict[str, Any], raw_label: str, raw_conf: float) -> Dict[str, Any]:
+def score_quiz_features(feature_rows: List[Dict[str, Any]], model: Optional[ModelVersion] = None) -> List[Dict[str, Any]]:
       """
-      Hybrid logic:
-         1) Extreme content gap → HIGH_CONTENT_GAP
-         2) Very strong performance → LOW_STRESS_GOOD_PROGRESS
-         3) Low confidence → middle class, unless rules fired
-         4) Otherwise → model label
+      Batch-score feature dicts with the live (or given) model version (one predict_proba for all rows).
+      The hybrid rules (content gap → good progress → low confidence → model label)
+      are applied by scoring.decide_final_labels.
       """
-      wrong_ratio = float(feats.get("wrong_ratio", 0))
-      avg_time      = float(feats.get("avg_time", 0))
-      t_ratio       = float(feats.get("time_over_15_ratio", 0))
-      avg_stress   = float(feats.get("avg_stress", 0))
-
-      # Strong content-gap overrides
-      if wrong_ratio >= 0.8:
-            return {"final_label": "HIGH_CONTENT_GAP", "overridden_by_rules": True}
-      if wrong_ratio >= 0.6 and (avg_time >= 20 or t_ratio >= 0.4 or avg_stress >= 2.5):
-            return {"final_label": "HIGH_CONTENT_GAP", "overridden_by_rules": True}
+      return (model or registry.live()).score(feature_rows)
 
-      # Very strong performance
-      if wrong_ratio <= 0.2 and avg_stress < 2.0 and t_ratio <= 0.3:
-            return {"final_label": "LOW_STRESS_GOOD_PROGRESS", "overridden_by_rules": True}
-
-      # Low confidence → safer middle class
-      if raw_conf < 0.65 and raw_label not in {"HIGH_CONTENT_GAP", "LOW_STRESS_GOOD_PROGRESS"}:
-            return {"final_label": "BALANCED_IMPROVEMENT_NEEDED", "overridden_by_rules": True}
-
-      return {"final_label": raw_label, "overridden_by_rules": False}
+def warm_up():
+      """Load the live and shadow pipelines (each scores one dummy row) so the first /analyze call is not the slow one"""
+      registry.active()
 
 # ---------------------------
 # Tailored recommendation builder
@@ -203,56 +208,101 @@ def build_recommendation(label: str, feats: Dict[str, Any]) -> List[str]:
 # ---------------------------
 @router.get("/model-info")
 def model_info():
+      live, shadow = registry.active()
       return {
             "model": "LogisticRegression pipeline (scikit-learn)",
-            "labels": LABELS,
-            "num_features": NUM_FEATURES,
-            "cat_features": CAT_FEATURES,
+            "version": live.version,
+            "shadow_version": shadow.version if shadow else None,
+            "labels": live.labels,
+            "num_features": live.num_features,
+            "cat_features": live.cat_features,
       }
 
+class ModelSelection(BaseModel):
+      live: Optional[str] = None        # None → the top-level artifact
+      shadow: Optional[str] = None      # None → no shadow scoring
+
+# "/models" alone would be routed to the quiz router's GET /{quiz_id}
+@router.get("/models/status")
+def model_status():
+      """Live and shadow versions, available versions, swap and shadow counters"""
+      return registry.status()
+
+@router.post("/models/reload")
+def reload_models():
+      """Re-read the artifact directory now instead of waiting for the watcher"""
+      try:
+            return registry.reload()
+      except UnknownModelVersion as exc:
+            raise HTTPException(status_code=404, detail=f"Unknown model version: {exc.args[0]}")
+      except (OSError, ValueError) as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+
+@router.post("/models/activate")
+def activate_model(selection: ModelSelection):
+      """Switch the live/shadow versions for every worker (via active.json)"""
+      try:
+            return registry.activate(selection.live, selection.shadow)
+      except UnknownModelVersion as exc:
+            raise HTTPException(status_code=404, detail=f"Unknown model version: {exc.args[0]}")
+      except (OSError, ValueError) as exc:
+            raise HTTPException(status_code=422, detail=str(exc))
+
 @router.post("/analyze/{quiz_id}")
 def analyze_quiz(quiz_id: int):
+      # runs in the threadpool, so it is profiled here rather than by the middleware
+      with profiled(f"analyze_quiz_{quiz_id}"):
+            return run_quiz_analysis(quiz_id)
+
+def run_quiz_analysis(quiz_id: int) -> Dict[str, Any]:
+      timer = StageTimer("analyze_quiz")
+      db = get_db()
+
       # Quiz title
       quiz = db.quizzes.find_one({"quizId": quiz_id}, {"_id": 0, "title": 1})
       if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
       quiz_title = quiz.get("title", f"Quiz {quiz_id}")
+      timer.mark("load_quiz")
 
-      # Distinct user ids for this quiz
-      user_ids = db.responses.distinct("user_id", {"quiz_id": quiz_id})
-      if not user_ids:
+      # All users' features from the pre-aggregated accumulators
+      aggregates = load_quiz_features(quiz_id)
+      if not aggregates:
             raise HTTPException(status_code=404, detail="No responses found for this quiz")
-
-      # Model classes order (for confidence extraction)
-      if hasattr(model, "named_steps") and "classifier" in model.named_steps:
-            model_classes = model.named_steps["classifier"].classes_.tolist()
-      else:
-            model_classes = getattr(model, "classes_", LABELS)
+      timer.mark("feature_aggregation")
+
+      # Score every student with one predict_proba call; one (live, shadow) pair for the whole quiz
+      live, shadow = registry.active()
+      feature_rows = [agg["features"] for agg in aggregates.values()]
+      scores = score_quiz_features(feature_rows, live)
+      timer.mark("scoring")
+
+      # ✅ Shadow candidate scores the same rows; only its disagreement is stored, the UI keeps the live label
+      shadow_scores: List[Optional[Dict[str, Any]]] = [None] * len(scores)
+      shadow_report = None
+      if shadow is not None:
+            shadow_scores = score_quiz_features(feature_rows, shadow)
+            disagreed = sum(s["model_label"] != c["model_label"] for s, c in zip(scores, shadow_scores))
+            registry.record_shadow(len(scores), disagreed)
+            shadow_report = {
+                  "version": shadow.version,
+                  "scored": len(scores),
+                  "disagreed": disagreed,
+                  "disagreement_rate": round(disagreed / len(scores), 4),
+            }
+            timer.mark("shadow_scoring")
 
       results = []
+      summary_ops: List[UpdateOne] = []
+      reco_ops: List[UpdateOne] = []
+      results_ops: List[UpdateOne] = []
 
-      for uid in user_ids:
-            agg = aggregate_user_quiz_features(quiz_id, uid)
-            if not agg:
-                  continue
-
+      for (uid, agg), scored, candidate in zip(aggregates.items(), scores, shadow_scores):
             feats = agg["features"]
-            row = {**{k: feats[k] for k in NUM_FEATURES},
-                       **{k: feats[k] for k in CAT_FEATURES}}
-            X = pd.DataFrame([row])
-
-            # Raw prediction
-            raw_pred = model.predict(X)[0]
-            proba = model.predict_proba(X)[0]
-            if raw_pred in model_classes:
-                  raw_conf = float(proba[model_classes.index(raw_pred)])
-            else:
-                  raw_conf = float(np.max(proba))
-
-            # Hybrid decision
-            hybrid = decide_final_label(feats, raw_pred, raw_conf)
-            final_label = hybrid["final_label"]
-            overridden = bool(hybrid["overridden_by_rules"])
+            raw_pred = scored["raw_model_label"]
+            raw_conf = scored["raw_model_confidence"]
+            final_label = scored["model_label"]
+            overridden = scored["overridden_by_rules"]
 
             # Tailored recommendations
             recommendations = build_recommendation(final_label, feats)
@@ -261,39 +311,49 @@ def analyze_quiz(quiz_id: int):
             summary = agg["summary"]
 
             # Store per-user summary (keep both raw & final to aid debugging)
-            db.quiz_summary_scores.update_one(
-                  {"user_id": uid, "quiz_id": quiz_id},
-                  {"$set": {
-                        "avg_stress_score": summary["avg_stress_score"],
-                        "avg_time": summary["avg_time"],
-                        "wrong_answers": summary["wrong_answers"],
-                        "emotion_counts": summary["emotion_counts"],
-                        "total_questions": summary["total_questions"],
-                        "raw_model_label": raw_pred,
-                        "raw_model_confidence": round(raw_conf, 4),
-                        "model_label": final_label,                     # final label for UI
-                        "overridden_by_rules": overridden,
-                        "recommendation": recommendation_text,
-                        "recommendations": recommendations,
-                  }},
-                  upsert=True
-            )
+            summary_update: Dict[str, Any] = {"$set": {
+                  "avg_stress_score": summary["avg_stress_score"],
+                  "avg_time": summary["avg_time"],
+                  "wrong_answers": summary["wrong_answers"],
+                  "emotion_counts": summary["emotion_counts"],
+                  "total_questions": summary["total_questions"],
+                  "pending_responses": summary["pending_responses"],
+                  "raw_model_label": raw_pred,
+                  "raw_model_confidence": round(raw_conf, 4),
+                  "model_label": final_label,                     # final label for UI
+                  "overridden_by_rules": overridden,
+                  "recommendation": recommendation_text,
+                  "recommendations": recommendations,
+                  "model_version": live.version,
+            }}
+            if candidate is not None:
+                  summary_update["$set"]["shadow"] = {
+                        "version": shadow.version,
+                        "raw_model_label": candidate["raw_model_label"],
+                        "raw_model_confidence": round(candidate["raw_model_confidence"], 4),
+                        "model_label": candidate["model_label"],
+                        "disagrees": candidate["model_label"] != final_label,
+                        "quiz_disagreement_rate": shadow_report["disagreement_rate"],
+                  }
+            else:
+                  summary_update["$unset"] = {"shadow": ""}
+            summary_ops.append(UpdateOne({"user_id": uid, "quiz_id": quiz_id}, summary_update, upsert=True))
 
             # Store final recommendation doc used by frontend
-            db.user_recommendations.update_one(
-                  {"user_id": uid, "quiz_id": quiz_id},
-                  {"$set": {
-                        "quiz_title": quiz_title,
-                        "avg_stress_score": summary["avg_stress_score"],
-                        "model_label": final_label,                     # final label for UI
-                        "raw_model_label": raw_pred,
-                        "model_confidence": round(raw_conf, 4),
-                        "overridden_by_rules": overridden,
-                        "recommendation": recommendation_text,
-                        "recommendations": recommendations
-                  }},
-                  upsert=True
-            )
+            reco = {
+                  "quiz_title": quiz_title,
+                  "avg_stress_score": summary["avg_stress_score"],
+                  "model_label": final_label,                     # final label for UI
+                  "raw_model_label": raw_pred,
+                  "model_confidence": round(raw_conf, 4),
+                  "overridden_by_rules": overridden,
+                  "recommendation": recommendation_text,
+                  "recommendations": recommendations
+            }
+            reco_ops.append(UpdateOne({"user_id": uid, "quiz_id": quiz_id}, {"$set": reco}, upsert=True))
+
+            # Keep the student's materialized results document current
+            results_ops.append(results_update(uid, results_entry(quiz_id, reco)))
 
             results.append({
                   "user_id": uid,
@@ -308,7 +368,28 @@ def analyze_quiz(quiz_id: int):
                   "recommendations": recommendations
             })
 
+      timer.mark("recommendations")
+
+      # Flush all upserts in a handful of unordered bulk_write round-trips
+      chunk_size = settings.ANALYSIS_WRITE_CHUNK_SIZE
+      writes = {
+            "quiz_summary_scores": chunked_bulk_write(db.quiz_summary_scores, summary_ops, chunk_size),
+            "user_recommendations": chunked_bulk_write(db.user_recommendations, reco_ops, chunk_size),
+            RESULTS: chunked_bulk_write(db[RESULTS], results_ops, chunk_size),
+      }
+      # after the entries above, so each student's document exists and holds this quiz
+      backfill = backfill_ops(db, [r["user_id"] for r in results])
+      if backfill:
+            writes[f"{RESULTS}_backfill"] = chunked_bulk_write(db[RESULTS], backfill, chunk_size)
+
+      timer.mark("writes")
+      timer.observe()
+
       return {
             "message": f"Analysis completed for quiz {quiz_id}",
-            "results": results
+            "results": results,
+            "writes": writes,
+            "model_version": live.version,
+            "shadow": shadow_report,
+            "timings_ms": timer.as_dict()
       }
@@ -0,0 +1,57 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from app.core.config import settings
+from app.models.database import get_db
+from app.routers.analysis import CAT_FEATURES, NUM_FEATURES
+from app.services.export import build_export
+
+router = APIRouter()
+
+Format = Literal["ndjson", "csv", "parquet"]
+Compression = Literal["none", "gzip", "zstd"]
+
+
+def _stream(dataset: str, quiz_id, since, until, format, compression) -> StreamingResponse:
+    # sync route: the export generator is iterated in the threadpool, one cursor batch at a time
+    try:
+        chunks, media_type, filename = build_export(
+            get_db(), dataset, format, compression, NUM_FEATURES, CAT_FEATURES,
+            quiz_id=quiz_id, since=since, until=until,
+            batch_size=settings.EXPORT_BATCH_SIZE,
+            row_group_size=settings.EXPORT_ROW_GROUP_SIZE,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@router.get("/responses")
+def export_responses(
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = Query(None, description="timestamp >= since (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="timestamp < until (ISO 8601)"),
+    format: Format = "ndjson",
+    compression: Compression = "none",
+):
+    """Raw answers with their emotion vector, streamed straight from the cursor"""
+    return _stream("responses", quiz_id, since, until, format, compression)
+
+
+@router.get("/summaries")
+def export_summaries(
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = Query(None, description="last answer >= since (ISO 8601)"),
+    until: Optional[datetime] = Query(None, description="last answer < until (ISO 8601)"),
+    format: Format = "ndjson",
+    compression: Compression = "none",
+):
+    """Per-(quiz, student) model features (NUM_FEATURES + CAT_FEATURES) with the stored labels"""
+    return _stream("summaries", quiz_id, since, until, format, compression)
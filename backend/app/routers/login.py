@@ -1,7 +1,6 @@
 # app/routers/login.py
 from fastapi import APIRouter, HTTPException, Form, Depends, Request
-from pymongo.database import Database
-from app.models.database import get_db
+from app.models.repositories import Repositories, get_repos
 
 router = APIRouter()
 
@@ -10,9 +9,9 @@ async def login(
     request: Request,  # ✅ Needed to access session
     username: str = Form(...),
     password: str = Form(...),
-    db: Database = Depends(get_db)
+    repos: Repositories = Depends(get_repos)
 ):
-    student = db.students.find_one({"username": username})
+    student = await repos.students.by_username(username)
 
     if not student or student["password"] != password:
         raise HTTPException(status_code=401, detail="Invalid username or password")
@@ -0,0 +1,58 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.models.database import pool_stats
+from app.routers.analysis import registry as model_registry
+from app.routers.quiz import emotion_capture, emotion_pipeline, emotion_streams, image_archive, quiz_cache
+
+from app.services.stage_metrics import counter_lines, gauge_lines, stage_histograms
+
+router = APIRouter()
+# mounted at the app root: Prometheus scrapes /metrics
+prometheus_router = APIRouter()
+
+
+@router.get("/fer")
+def fer_metrics():
+    """Per-request latency, batch-size and queue stats for the FER executor"""
+    return {
+        **emotion_capture.status(),
+        "pipeline_pending": emotion_pipeline.pending(),
+        "streams": emotion_streams.stats(),
+    }
+
+
+@router.get("/db-pool")
+def db_pool_metrics():
+    """Connection-pool usage of the shared MongoClient"""
+    return pool_stats.snapshot()
+
+
+@router.get("/quiz-cache")
+def quiz_cache_metrics():
+    """Hit/miss/eviction counters of the quiz definition cache"""
+    return quiz_cache.stats()
+
+
+@router.get("/image-archive")
+def image_archive_metrics():
+    """Background frame archive: writes, dedup hits, drops and the last retention sweep"""
+    return image_archive.stats()
+
+
+@prometheus_router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def prometheus_metrics():
+    """Stage-timing histograms plus a few FER and pool gauges, in the Prometheus text format"""
+    fer = emotion_capture.status()
+    pool = pool_stats.snapshot()
+    lines = stage_histograms.render()
+    lines += counter_lines("quiz_fer_requests_total", "Requests answered by the FER batcher", fer["requests"])
+    lines += counter_lines("quiz_fer_frames_total", "Frames run through the emotion model", fer["frames"])
+    lines += counter_lines("quiz_fer_batches_total", "Model batches", fer["batches"])
+    lines += gauge_lines("quiz_fer_inflight_requests", "Requests admitted and waiting for FER", fer["inflight_requests"])
+    lines += gauge_lines("quiz_fer_queue_depth", "Requests queued for the next batch", fer["queue_depth"])
+    lines += gauge_lines("quiz_fer_pipeline_pending", "Responses waiting in the async emotion pipeline", emotion_pipeline.pending())
+    lines += gauge_lines("quiz_mongo_pool_checked_out", "MongoDB connections currently checked out", pool["in_use"])
+    lines += counter_lines("quiz_model_swaps_total", "Recommendation model hot swaps in this process", model_registry.swaps)
+    lines += counter_lines("quiz_model_shadow_scored_total", "Students scored by the shadow model", model_registry.shadow_scored)
+    lines += counter_lines("quiz_model_shadow_disagreed_total", "Shadow labels that differ from the live label", model_registry.shadow_disagreed)
+    return "\n".join(lines) + "\n"
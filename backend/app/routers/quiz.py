@@ -1,13 +1,32 @@
-from fastapi import APIRouter, HTTPException, Depends, Form, File, UploadFile
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Depends, Form, File, UploadFile, Request, Response, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Dict, Optional, Literal
 from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
 from pymongo.database import Database
+from app.core.config import settings
+from app.models.counters import allocate_question_ids, allocate_quiz_id
 from app.models.database import get_db
-from app.services.fer_service import EmotionCapture
+from app.models.repositories import Repositories, get_repos
+from app.services.emotion_codec import EMOTION_LABELS, dominant_emotion, summarize_frames
+from app.services.fer_service import EmotionCapture, FrameTooLarge, unpack_faces
+from app.services.emotion_pipeline import EmotionPipeline
+from app.services.emotion_stream import EmotionStreams, parse_frame
+from app.services.image_archive import ImageArchive
+from app.services.inference_executor import InferenceQueueFull
+from app.services.quiz_cache import CachedBody, QuizCache, etag_matches
+from app.services.results_view import entries, user_results_row
+from app.services.stage_metrics import StageTimer
 
 router = APIRouter()
 emotion_capture = EmotionCapture()
+emotion_pipeline = EmotionPipeline(emotion_capture)
+emotion_streams = EmotionStreams(emotion_capture)
+image_archive = ImageArchive()
+quiz_cache = QuizCache(settings.QUIZ_CACHE_MAX_ENTRIES, settings.QUIZ_CACHE_TTL_S)
+QUIZ_LIST_KEY = ("list",)
 
 # ——— Models ———
 class QuizCreate(BaseModel):
@@ -38,13 +57,42 @@ class QuizOut(BaseModel):
     question_count: Optional[int] = None
 
 
+class QuizSummaryOut(BaseModel):
+    quizId: int
+    title: str
+    createdAt: datetime
+    question_count: int
+    questions_added: int
+
+
+_quiz_list_adapter = TypeAdapter(List[QuizOut])
+
+# Summary view: computed server-side so the questions array never leaves MongoDB
+_questions_size = {"$size": {"$ifNull": ["$questions", []]}}
+SUMMARY_PROJECTION = {
+    "_id": 0,
+    "quizId": 1,
+    "title": 1,
+    "createdAt": 1,
+    "question_count": {"$ifNull": ["$question_count", _questions_size]},
+    "questions_added": _questions_size,
+}
+
+
+def _cached_json(entry: CachedBody, request: Request) -> Response:
+    """Serve a cached body, or a bare 304 when the client already has this version"""
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
 # ——— 1) Create a new quiz ———
 @router.post("", response_model=dict, tags=["Quizzes"])
 @router.post("/", response_model=dict, tags=["Quizzes"])
 def create_quiz(payload: QuizCreate, db: Database = Depends(get_db)):
-    # auto-increment quizId
-    last = db.quizzes.find_one(sort=[("quizId", -1)])
-    next_id = (last["quizId"] if last else 0) + 1
+    # auto-increment quizId (atomic counter, safe with parallel admins)
+    next_id = allocate_quiz_id(db)
 
     quiz_doc = {
         "quizId": next_id,
@@ -54,6 +102,7 @@ def create_quiz(payload: QuizCreate, db: Database = Depends(get_db)):
         "questions": []
     }
     db.quizzes.insert_one(quiz_doc)
+    quiz_cache.invalidate(QUIZ_LIST_KEY)
     return {"quizId": next_id}
 
 
@@ -61,76 +110,196 @@ def create_quiz(payload: QuizCreate, db: Database = Depends(get_db)):
 @router.post("/{quiz_id}/questions", tags=["Quizzes"])
 @router.post("/{quiz_id}/questions/", tags=["Quizzes"])
 def add_question(quiz_id: int, payload: QuestionIn, db: Database = Depends(get_db)):
-    quiz = db.quizzes.find_one({"quizId": quiz_id})
-    if not quiz:
-        raise HTTPException(404, "Quiz not found")
+    ids = _push_questions(db, quiz_id, [payload])
+    return {"questionId": ids[0]}
 
-    qlist = quiz.get("questions", [])
-    next_qid = (qlist[-1]["questionId"] if qlist else 0) + 1
 
-    qdoc = {
-        "questionId": next_qid,
-        "text": payload.text,
-        "options": payload.options,
-        "correct": payload.correct,
-        "topic": payload.topic
-    }
+# ——— 2b) Add several questions in one update ———
+@router.post("/{quiz_id}/questions/bulk", tags=["Quizzes"])
+def add_questions_bulk(quiz_id: int, payload: List[QuestionIn], db: Database = Depends(get_db)):
+    if not payload:
+        raise HTTPException(400, "No questions supplied")
+    return {"questionIds": _push_questions(db, quiz_id, payload)}
 
-    db.quizzes.update_one(
+
+def _push_questions(db: Database, quiz_id: int, questions: List[QuestionIn]) -> List[int]:
+    """Reserve an id range from the quiz's counter and $push all questions at once"""
+    first = allocate_question_ids(db, quiz_id, len(questions))
+    if first is None:
+        raise HTTPException(404, "Quiz not found")
+
+    qdocs = [
+        {
+            "questionId": first + i,
+            "text": q.text,
+            "options": q.options,
+            "correct": q.correct,
+            "topic": q.topic
+        }
+        for i, q in enumerate(questions)
+    ]
+
+    result = db.quizzes.update_one(
         {"quizId": quiz_id},
-        {"$push": {"questions": qdoc}}
+        {"$push": {"questions": {"$each": qdocs}}}
     )
-    return {"questionId": next_qid}
+    if result.matched_count == 0:
+        raise HTTPException(404, "Quiz not found")
+    quiz_cache.invalidate(("quiz", quiz_id), QUIZ_LIST_KEY)
+    return [q["questionId"] for q in qdocs]
 
 
 # ——— 3) List all quizzes ———
 @router.get("", response_model=List[QuizOut], tags=["Quizzes"])
 @router.get("/", response_model=List[QuizOut], tags=["Quizzes"])
-def list_quizzes(db: Database = Depends(get_db)):
-    docs = db.quizzes.find({}, {"_id": 0})
-    return list(docs)
+def list_quizzes(request: Request, db: Database = Depends(get_db)):
+    def load():
+        docs = list(db.quizzes.find({}, {"_id": 0}))
+        return _quiz_list_adapter.dump_json(_quiz_list_adapter.validate_python(docs))
+
+    return _cached_json(quiz_cache.get_or_load(QUIZ_LIST_KEY, load), request)
+
+
+# ——— 3b) Paginated catalog (cursor on quizId, streamed) ———
+@router.get("/catalog", tags=["Quizzes"])
+def list_quizzes_page(
+    after: Optional[int] = Query(None, description="quizId of the last item of the previous page"),
+    limit: int = Query(50, ge=1, le=500),
+    view: Literal["summary", "full"] = "summary",
+    order: Literal["desc", "asc"] = "desc",
+    db: Database = Depends(get_db)
+):
+    query = {}
+    if after is not None:
+        query["quizId"] = {"$lt": after} if order == "desc" else {"$gt": after}
+    projection = SUMMARY_PROJECTION if view == "summary" else {"_id": 0}
+    model = QuizSummaryOut if view == "summary" else QuizOut
+
+    # one extra row tells us whether there is a next page
+    cursor = (
+        db.quizzes.find(query, projection)
+        .sort("quizId", -1 if order == "desc" else 1)
+        .limit(limit + 1)
+        .batch_size(min(limit + 1, 101))
+    )
+
+    def stream():
+        last_id, sent = None, 0
+        try:
+            yield b'{"items":['
+            for doc in cursor:
+                if sent == limit:
+                    break
+                if view == "full" and "question_count" not in doc:
+                    doc["question_count"] = len(doc.get("questions", []))
+                yield (b"," if sent else b"") + model.model_validate(doc).model_dump_json().encode()
+                last_id = doc["quizId"]
+                sent += 1
+            else:
+                last_id = None  # cursor exhausted: no next page
+            yield b'],"next_after":' + (str(last_id).encode() if last_id is not None else b"null") + b"}"
+        finally:
+            cursor.close()
+
+    return StreamingResponse(stream(), media_type="application/json")
 
 
 # ——— 4) Get one quiz by ID ———
 @router.get("/{quiz_id}", response_model=QuizOut, tags=["Quizzes"])
 @router.get("/{quiz_id}/", response_model=QuizOut, tags=["Quizzes"])
-def get_quiz(quiz_id: int, db: Database = Depends(get_db)):
-    quiz = db.quizzes.find_one({"quizId": quiz_id}, {"_id": 0})
-    if not quiz:
-        raise HTTPException(404, "Quiz not found")
+def get_quiz(quiz_id: int, request: Request, db: Database = Depends(get_db)):
+    def load():
+        quiz = db.quizzes.find_one({"quizId": quiz_id}, {"_id": 0})
+        if not quiz:
+            return None
 
-    # ✅ Safety: if old quizzes don’t have question_count, fallback to len(questions)
-    if "question_count" not in quiz:
-        quiz["question_count"] = len(quiz.get("questions", []))
+        # ✅ Safety: if old quizzes don’t have question_count, fallback to len(questions)
+        if "question_count" not in quiz:
+            quiz["question_count"] = len(quiz.get("questions", []))
 
-    return quiz
+        return QuizOut.model_validate(quiz).model_dump_json().encode()
+
+    entry = quiz_cache.get_or_load(("quiz", quiz_id), load)
+    if entry is None:
+        raise HTTPException(404, "Quiz not found")
+    return _cached_json(entry, request)
 
 
 # ——— 5) Submit answer (FER service integration) ———
 @router.post("/submit-answer", tags=["Quizzes"])
 async def submit_answer(
+    request: Request,
     quiz_id: int = Form(...),
     user_id: str = Form(...),
     question_id: int = Form(...),
     selected_answer: str = Form(...),
     is_correct: bool = Form(...),
     topic: str = Form(...),
-    images: List[UploadFile] = File(...),
     time_taken: int = Form(...),
-    db: Database = Depends(get_db)
+    images: Optional[List[UploadFile]] = File(None),
+    faces: Optional[UploadFile] = File(None),
+    repos: Repositories = Depends(get_repos)
 ):
-    all_emotions = []
-    for img in images:
-        contents = await img.read()
-        ems = emotion_capture.capture_emotions(contents)
-        if not isinstance(ems, list):
-            raise HTTPException(500, "Invalid emotion format")
-        all_emotions.extend(ems)
-
-    if not all_emotions:
-        raise HTTPException(400, "No emotions detected")
+    # Stage timings go into analysis_metadata and the /metrics histograms.
+    # Until here the time went to receiving and parsing the multipart body.
+    timer = StageTimer("submit_answer", getattr(request.state, "started_at", None))
+    timer.add("multipart_read", timer.elapsed_ms())
+
+    # ✅ Emotions streamed over the WebSocket while the question was shown: just finalize them
+    with timer.stage("stream_finalize"):
+        stream = await emotion_streams.finalize((quiz_id, user_id, question_id))
+    if stream is not None:
+        record = {
+            "quiz_id": quiz_id,
+            "user_id": user_id,
+            "question_id": question_id,
+            "selected_answer": selected_answer,
+            "is_correct": is_correct,
+            "topic": topic,
+            "time_taken": time_taken,
+            "emotion_samples": stream.frames,
+            "timestamp": datetime.utcnow(),
+            "analysis_metadata": {
+                "model": "VGG-FER",
+                "backend": emotion_capture.model_backend,
+                "source": "stream",
+                "dropped_frames": stream.dropped,
+                "processing_time_ms": timer.elapsed_ms(),
+                "stages_ms": timer.as_dict(),
+            },
+            "emotion_status": "done",
+            **stream.summary(),
+        }
+        with timer.stage("mongo_insert"):
+            await repos.responses.insert(record)
+            await repos.features.record_response(record)
+        timer.observe()
+        return {
+            "status": "success",
+            "dominant_emotion": dominant_emotion(record),
+            "sample_size": stream.frames
+        }
+
+    # Frames arrive as encoded images (ideally downscaled grayscale JPEGs) and/or
+    # one "faces" part of packed N x 48 x 48 uint8 crops made on the client.
+    frames = []
+    try:
+        with timer.stage("multipart_read"):
+            for img in images or []:
+                data = await img.read()
+                if len(data) > settings.FER_MAX_FRAME_BYTES:
+                    raise FrameTooLarge(f"Frame larger than {settings.FER_MAX_FRAME_BYTES} bytes")
+                frames.append(data)
+            if faces is not None:
+                frames.extend(unpack_faces(await faces.read()))
+    except FrameTooLarge as exc:
+        raise HTTPException(413, str(exc))
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    if not frames:
+        raise HTTPException(400, "No frames supplied")
+    frame_hashes = image_archive.submit(frames)
 
-    dominant = max(all_emotions, key=lambda e: e["confidence"])
     record = {
         "quiz_id": quiz_id,
         "user_id": user_id,
@@ -139,33 +308,122 @@ async def submit_answer(
         "is_correct": is_correct,
         "topic": topic,
         "time_taken": time_taken,
-        "emotion_samples": len(images),
-        "averaged_emotions": all_emotions,
-        "dominant_emotion": dominant,
+        "emotion_samples": len(frames),
         "timestamp": datetime.utcnow(),
-        "analysis_metadata": {"model": "VGG-FER", "processing_time_ms": 1400}
+        "analysis_metadata": {"model": "VGG-FER", "backend": emotion_capture.model_backend}
     }
-    db.responses.insert_one(record)
+    if frame_hashes:
+        record["frame_hashes"] = frame_hashes
+
+    # ✅ Two-stage mode: store the answer now, emotions are filled in by the pipeline
+    if settings.FER_ASYNC_MODE:
+        record.update({"emotion_status": "pending", "emotion_vector": None, "dominant_code": None})
+        # the pipeline adds its FER stages under analysis_metadata.fer_stages_ms
+        record["analysis_metadata"].update({
+            "processing_time_ms": timer.elapsed_ms(),
+            "stages_ms": timer.as_dict(),
+        })
+        with timer.stage("mongo_insert"):
+            response_id = await repos.responses.insert(record)
+            await repos.features.record_pending(quiz_id, user_id, response_id)
+        with timer.stage("spool"):
+            await emotion_pipeline.enqueue(response_id, frames)
+        timer.observe()
+        return {
+            "status": "accepted",
+            "response_id": response_id,
+            "emotion_status": "pending",
+            "sample_size": len(frames)
+        }
+
+    try:
+        probs, fer_stages = await emotion_capture.analyze_frames_timed(frames)
+    except InferenceQueueFull as exc:
+        raise HTTPException(503, str(exc), headers={"Retry-After": str(exc.retry_after)})
+    except FrameTooLarge as exc:
+        raise HTTPException(413, str(exc))
+    except ValueError as exc:
+        raise HTTPException(400, str(exc))
+    timer.update(fer_stages)
+
+    if probs.ndim != 2 or probs.shape[1] != len(EMOTION_LABELS):
+        raise HTTPException(500, "Invalid emotion format")
+    if not len(probs):
+        raise HTTPException(400, "No emotions detected")
+    # ✅ One 7-float mean vector + dominant code instead of every frame's emotion list
+    with timer.stage("averaging"):
+        emotions = summarize_frames(probs)
+
+    # processing_time_ms covers everything before the insert; mongo_insert
+    # itself is only in the histograms (it cannot time its own document)
+    record["analysis_metadata"].update({
+        "processing_time_ms": timer.elapsed_ms(),
+        "stages_ms": timer.as_dict(),
+    })
+    record.update({"emotion_status": "done", **emotions})
+    with timer.stage("mongo_insert"):
+        await repos.responses.insert(record)
+        await repos.features.record_response(record)
+    timer.observe()
     return {
         "status": "success",
-        "dominant_emotion": dominant,
-        "sample_size": len(images)
+        "dominant_emotion": dominant_emotion(record),
+        "sample_size": len(frames)
     }
 
 
-@router.get("/results/{user_id}")
-def get_user_results(user_id: str, db: Database = Depends(get_db)):
-    scores = list(db.stress_scores.find({"user_id": user_id}))
-    recommendations = list(db.user_recommendations.find({"user_id": user_id}))
-
-    results = []
-    for score in scores:
-        rec = next((r for r in recommendations if r["quiz_id"] == score["quiz_id"]), {})
-        results.append({
-            "quiz_id": score["quiz_id"],
-            "stress_score": score["stress_score"],
-            "recommendations": rec.get("recommendations", [])
-        })
+@router.websocket("/emotion-stream/{quiz_id}/{user_id}/{question_id}")
+async def emotion_stream(websocket: WebSocket, quiz_id: int, user_id: str, question_id: int):
+    """
+    Receive frames (binary messages: one JPEG/PNG, or packed 48x48 uint8 faces)
+    while the question is on screen. Every message is answered with the
+    running average so far. submit-answer with the same ids finalizes it.
+    """
+    await websocket.accept()
+    key = (quiz_id, user_id, question_id)
+    session = emotion_streams.open(key)
+    try:
+        while True:
+            data = await websocket.receive_bytes()
+            try:
+                frames = parse_frame(data)
+            except ValueError as exc:
+                await websocket.send_json({"error": str(exc)})
+                continue
+            image_archive.submit(frames)
+            # a submit already finalized this session: frames go to a fresh one
+            if session.finalized:
+                session = emotion_streams.open(key)
+            for frame in frames:
+                session.offer(frame)
+            await websocket.send_json(session.progress())
+    except WebSocketDisconnect:
+        # keep the session: submit-answer usually arrives right after the socket closes
+        pass
+
 
-    return results
+@router.get("/responses/{response_id}/emotion-status", tags=["Quizzes"])
+async def get_emotion_status(response_id: str, repos: Repositories = Depends(get_repos)):
+    try:
+        oid = ObjectId(response_id)
+    except InvalidId:
+        raise HTTPException(400, "Invalid response id")
 
+    doc = await repos.responses.emotion_status(oid)
+    if not doc:
+        raise HTTPException(404, "Response not found")
+
+    return {
+        "response_id": response_id,
+        # responses stored before the two-stage pipeline are always complete
+        "emotion_status": doc.get("emotion_status", "done"),
+        "dominant_emotion": dominant_emotion(doc),
+        "emotion_error": doc.get("emotion_error"),
+    }
+
+
+@router.get("/results/{user_id}")
+async def get_user_results(user_id: str, repos: Repositories = Depends(get_repos)):
+    # ✅ One indexed read of the materialized results document, constant work per quiz
+    doc = await repos.results.for_user(user_id)
+    return [user_results_row(entry) for entry in entries(doc)]
@@ -1,18 +1,16 @@
-from fastapi import APIRouter, HTTPException
-from pymongo import MongoClient
-from app.models.database import db 
+from fastapi import APIRouter, HTTPException, Depends
+from app.models.repositories import Repositories, get_repos
+from app.services.results_view import entries, recommendation_row
 router = APIRouter()
 
 
 
 @router.get("/results/{user_id}")
-async def get_quiz_results(user_id: int):  # accept as int if you want
+async def get_quiz_results(user_id: int, repos: Repositories = Depends(get_repos)):  # accept as int if you want
     user_id_str = str(user_id)  # convert int to string
-    recs = list(db.user_recommendations.find({"user_id": user_id_str}, {"_id": 0}))
-    if not recs:
+    # ✅ One indexed read of the materialized results document
+    doc = await repos.results.for_user(user_id_str)
+    if not doc:
         raise HTTPException(status_code=404, detail="No recommendations found")
 
-    for rec in recs:
-        rec["recommendations"] = [rec.pop("recommendation")]
-        rec["stress_score"] = rec.pop("avg_stress_score")
-    return recs
+    return [recommendation_row(user_id_str, entry) for entry in entries(doc)]
@@ -0,0 +1,49 @@
+from typing import Any, Dict, List
+
+from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
+
+
+def chunked_bulk_write(collection: Collection, ops: List[Any], chunk_size: int) -> Dict[str, Any]:
+    """
+    Flush write models through unordered bulk_write calls of at most chunk_size ops.
+
+    A failing op does not stop the rest of its chunk (unordered) or later chunks;
+    each chunk reports its own counts and errors so callers can surface them.
+    """
+    chunk_size = max(1, chunk_size)
+    report: Dict[str, Any] = {
+        "collection": collection.name,
+        "ops": len(ops),
+        "matched": 0,
+        "modified": 0,
+        "upserted": 0,
+        "errors": 0,
+        "chunks": [],
+    }
+
+    for start in range(0, len(ops), chunk_size):
+        chunk = ops[start:start + chunk_size]
+        entry: Dict[str, Any] = {"offset": start, "ops": len(chunk), "errors": []}
+        try:
+            res = collection.bulk_write(chunk, ordered=False)
+            entry.update(matched=res.matched_count, modified=res.modified_count, upserted=res.upserted_count)
+        except BulkWriteError as bwe:
+            details = bwe.details
+            entry.update(
+                matched=details.get("nMatched", 0),
+                modified=details.get("nModified", 0),
+                upserted=details.get("nUpserted", 0),
+                errors=[
+                    {"index": start + e.get("index", 0), "code": e.get("code"), "message": e.get("errmsg")}
+                    for e in details.get("writeErrors", [])
+                ],
+            )
+
+        report["matched"] += entry["matched"]
+        report["modified"] += entry["modified"]
+        report["upserted"] += entry["upserted"]
+        report["errors"] += len(entry["errors"])
+        report["chunks"].append(entry)
+
+    return report
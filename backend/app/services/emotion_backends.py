@@ -0,0 +1,92 @@
+"""
+Emotion classifier backends for EmotionCapture.
+
+Every backend maps a (N, 48, 48, 1) float32 batch of grayscale faces in [0, 1]
+to (N, 7) scores in EMOTION_LABELS order, so the stored emotion_vector does
+not depend on which one runs.
+
+- "keras": the VGG-style model deepface builds (TensorFlow).
+- "onnx":  the same network exported to ONNX (optionally int8-quantized) and
+           run on onnxruntime's CPU provider. The Keras graph is never built;
+           deepface is still imported for face detection unless every frame
+           arrives pre-cropped.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.core.startup import lazy_import, startup
+
+ONNX_INPUT_NAME = "input"
+
+
+class KerasEmotionBackend:
+    name = "keras"
+
+    def __init__(self):
+        DeepFace = lazy_import("deepface.DeepFace")
+        with startup.stage("load:emotion_model"):
+            self.model = DeepFace.build_model(task="facial_attribute", model_name="Emotion").model
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch), dtype=np.float64)
+
+
+class OnnxEmotionBackend:
+    name = "onnx"
+
+    def __init__(self, path: Optional[str] = None, threads: Optional[int] = None):
+        ort = lazy_import("onnxruntime")
+        self.path = path or settings.FER_ONNX_PATH
+        if not os.path.exists(self.path):
+            raise RuntimeError(f"ONNX emotion model not found at: {self.path}. Run `python -m app.cli export-emotion-onnx`.")
+
+        options = ort.SessionOptions()
+        # one intra-op thread per worker process by default; the executor already runs workers in parallel
+        options.intra_op_num_threads = threads or settings.FER_ONNX_THREADS
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        with startup.stage("load:emotion_model"):
+            self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        (probs,) = self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})
+        return np.asarray(probs, dtype=np.float64)
+
+
+BACKENDS = {
+    KerasEmotionBackend.name: KerasEmotionBackend,
+    OnnxEmotionBackend.name: OnnxEmotionBackend,
+}
+
+
+def build_backend(name: Optional[str] = None):
+    name = name or settings.FER_MODEL_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown FER_MODEL_BACKEND {name!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+def export_onnx(output_path: str, quantize: bool = False, opset: int = 13) -> str:
+    """
+    Export deepface's Keras emotion model to ONNX with a dynamic batch axis.
+    With quantize=True the weights are additionally int8-quantized (dynamic
+    quantization) and the quantized file is returned.
+    """
+    tf = lazy_import("tensorflow")
+    tf2onnx = lazy_import("tf2onnx")
+
+    model = KerasEmotionBackend().model
+    spec = (tf.TensorSpec((None, 48, 48, 1), tf.float32, name=ONNX_INPUT_NAME),)
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+    if not quantize:
+        return output_path
+
+    quantization = lazy_import("onnxruntime.quantization")
+    root, ext = os.path.splitext(output_path)
+    quantized_path = f"{root}.int8{ext}"
+    quantization.quantize_dynamic(output_path, quantized_path, weight_type=quantization.QuantType.QInt8)
+    return quantized_path
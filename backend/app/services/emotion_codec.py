@@ -0,0 +1,163 @@
+"""
+Compact emotion encoding for response documents.
+
+    "emotion_vector": [7 floats]   mean per-emotion probability over the frames,
+                                   in EMOTION_LABELS order
+    "dominant_code":  int 0..6     index into EMOTION_LABELS
+
+replaces the legacy
+    "averaged_emotions": [{"emotion", "confidence"}, ...]   (every frame's entries)
+    "dominant_emotion":  {"emotion", "confidence"}
+
+The vector is a plain array (not packed float32) so aggregations can still
+reach individual emotions with $arrayElemAt. Readers go through the shims
+below, which accept both layouts.
+"""
+from typing import Any, Dict, List, Optional
+
+import bson
+import numpy as np
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+# Output order of the deepface "Emotion" model head
+EMOTION_LABELS = ["angry", "disgust", "fear", "happy", "sad", "surprise", "neutral"]
+EMOTION_CODES = {label: code for code, label in enumerate(EMOTION_LABELS)}
+
+
+def average_vector(probs: np.ndarray) -> np.ndarray:
+    """Mean of (n_frames, 7) probabilities across frames"""
+    return np.asarray(probs, dtype=np.float64).mean(axis=0)
+
+
+def peak_code(peaks: np.ndarray) -> int:
+    """Emotion with the single most confident frame (the legacy dominant_emotion rule)"""
+    return int(np.argmax(peaks))
+
+
+def encode(vector: np.ndarray, dominant_code: int) -> Dict[str, Any]:
+    return {
+        "emotion_vector": [round(float(v), 4) for v in vector],
+        "dominant_code": int(dominant_code),
+    }
+
+
+def summarize_frames(probs: np.ndarray) -> Dict[str, Any]:
+    """Compact fields for one answer from its (n_frames, 7) probabilities"""
+    probs = np.asarray(probs, dtype=np.float64)
+    return encode(average_vector(probs), peak_code(probs.max(axis=0)))
+
+
+# ---------------------------
+# Reader shims (new and legacy documents)
+# ---------------------------
+def dominant_label(doc: Dict[str, Any], default: str = "neutral") -> str:
+    code = doc.get("dominant_code")
+    if isinstance(code, int) and 0 <= code < len(EMOTION_LABELS):
+        return EMOTION_LABELS[code]
+    # legacy: dict {"emotion": "..."} or a plain string
+    de = doc.get("dominant_emotion")
+    if isinstance(de, dict):
+        return de.get("emotion", default) or default
+    if isinstance(de, str):
+        return de or default
+    return default
+
+
+def emotion_vector(doc: Dict[str, Any]) -> Optional[np.ndarray]:
+    """The 7-float vector, rebuilt from averaged_emotions for legacy documents"""
+    vector = doc.get("emotion_vector")
+    if vector is not None:
+        return np.asarray(vector, dtype=np.float64)
+
+    entries = doc.get("averaged_emotions") or []
+    if not entries:
+        return None
+    sums = np.zeros(len(EMOTION_LABELS))
+    counts = np.zeros(len(EMOTION_LABELS))
+    for e in entries:
+        code = EMOTION_CODES.get(str(e.get("emotion", "")).lower())
+        if code is not None:
+            sums[code] += float(e.get("confidence", 0))
+            counts[code] += 1
+    # entries below the confidence cut-off were dropped per frame, so divide by the frame count
+    frames = doc.get("emotion_samples") or counts.max()
+    return sums / max(frames, 1)
+
+
+def dominant_emotion(doc: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """{"emotion", "confidence"} as the API has always returned it"""
+    if doc.get("dominant_code") is None:
+        de = doc.get("dominant_emotion")
+        return de if isinstance(de, dict) or de is None else {"emotion": de, "confidence": None}
+    vector = emotion_vector(doc)
+    code = doc["dominant_code"]
+    return {
+        "emotion": EMOTION_LABELS[code],
+        "confidence": round(float(vector[code]), 4) if vector is not None else None,
+    }
+
+
+def emotion_list(vector: np.ndarray, min_confidence: float = 0.0) -> List[Dict[str, float]]:
+    """[{"emotion", "confidence"}] sorted by confidence, for callers that want the old list form"""
+    items = [
+        {"emotion": label, "confidence": round(float(p), 4)}
+        for label, p in zip(EMOTION_LABELS, vector)
+        if p >= min_confidence
+    ]
+    return sorted(items, key=lambda x: x["confidence"], reverse=True)
+
+
+def migration_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Compact fields for a legacy document; keeps its recorded dominant emotion"""
+    vector = emotion_vector(doc)
+    code = EMOTION_CODES.get(dominant_label(doc, default=""))
+    if vector is None:
+        return {"emotion_vector": None, "dominant_code": code}
+    return encode(vector, int(np.argmax(vector)) if code is None else code)
+
+
+# ---------------------------
+# Batch migration of legacy response documents
+# ---------------------------
+LEGACY_FIELDS = {"averaged_emotions": "", "dominant_emotion": ""}
+
+
+def migrate_responses(db: Database, batch_size: int = 500, dry_run: bool = False) -> Dict[str, int]:
+    """
+    Rewrite responses still carrying averaged_emotions / dominant_emotion, in
+    _id order, one bulk_write per batch. Safe to re-run and to run while the
+    app is serving: pending responses only lose their (empty) legacy fields,
+    and only if the emotion pipeline has not completed them in the meantime.
+    """
+    query = {"$or": [{"averaged_emotions": {"$exists": True}}, {"dominant_emotion": {"$exists": True}}]}
+    report = {"scanned": 0, "migrated": 0, "pending": 0, "legacy_bytes": 0, "compact_bytes": 0}
+    last_id = None
+    while True:
+        batch_query = query if last_id is None else {**query, "_id": {"$gt": last_id}}
+        docs = list(
+            db.responses.find(
+                batch_query,
+                {"averaged_emotions": 1, "dominant_emotion": 1, "emotion_vector": 1,
+                 "dominant_code": 1, "emotion_samples": 1, "emotion_status": 1},
+            ).sort("_id", 1).limit(batch_size)
+        )
+        if not docs:
+            return report
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            report["scanned"] += 1
+            legacy = {k: doc[k] for k in LEGACY_FIELDS if k in doc}
+            report["legacy_bytes"] += len(bson.encode(legacy))
+            if doc.get("emotion_status") == "pending":
+                report["pending"] += 1
+                ops.append(UpdateOne({"_id": doc["_id"], "emotion_status": "pending"}, {"$unset": LEGACY_FIELDS}))
+                continue
+            fields = migration_fields(doc)
+            report["compact_bytes"] += len(bson.encode(fields))
+            report["migrated"] += 1
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields, "$unset": LEGACY_FIELDS}))
+        if not dry_run:
+            db.responses.bulk_write(ops, ordered=False)
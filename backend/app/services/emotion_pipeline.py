@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from app.core.config import settings
+from app.models.database import get_db
+from app.services.feature_store import apply_changes, finished_change
+from app.services.emotion_codec import summarize_frames
+from app.services.fer_service import EmotionCapture, Frame, unpack_faces
+from app.services.inference_executor import InferenceQueueFull
+from app.services.stage_metrics import stage_histograms
+
+logger = logging.getLogger(__name__)
+
+# Per-process spool directories: fer_spool/proc-<host>-<pid>/<response_id>/
+OWNER_PREFIX = "proc-"
+
+
+class EmotionPipeline:
+    """Second stage of submit-answer: fills in emotions for ``pending`` responses.
+
+    Frames are spooled to ``STORAGE_PATH/fer_spool/proc-<host>-<pid>/<response_id>/``
+    so a restart does not lose queued work; the in-memory queue only carries ids.
+    Each API process owns its directory. On start it claims the jobs of dead
+    processes on the same host by renaming them into its own, so with several
+    workers a job is recovered exactly once.
+    The consumer drains up to FER_PIPELINE_BATCH jobs at a time, sends them
+    through the shared FER batcher together, and writes the results back.
+    """
+
+    def __init__(self, capture: EmotionCapture):
+        self.capture = capture
+        self.spool_dir = os.path.join(settings.STORAGE_PATH, "fer_spool")
+        # set in start(), after any fork, so the pid is this worker's
+        self.own_dir = self.spool_dir
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # failed batches per job id, and the timers that put them back on the queue
+        self._failures: Dict[str, int] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+
+    # ——— Producer side ———
+    def _spool(self, response_id: str, frames: List[Frame]):
+        job_dir = os.path.join(self.own_dir, response_id)
+        os.makedirs(job_dir, exist_ok=True)
+        for i, frame in enumerate(frames):
+            # encoded images keep their bytes; pre-cropped faces are stored as raw 48x48 uint8
+            name = f"face_{i}.u8" if isinstance(frame, np.ndarray) else f"frame_{i}.bin"
+            data = frame.tobytes() if isinstance(frame, np.ndarray) else frame
+            with open(os.path.join(job_dir, name), "wb") as f:
+                f.write(data)
+
+    async def enqueue(self, response_id: str, frames: List[Frame]):
+        await asyncio.to_thread(self._spool, response_id, frames)
+        self._queue.put_nowait(response_id)
+
+    # ——— Consumer side ———
+    def _load(self, response_id: str) -> List[Frame]:
+        job_dir = os.path.join(self.own_dir, response_id)
+        names = sorted(os.listdir(job_dir), key=lambda n: int(n.split("_", 1)[1].split(".", 1)[0]))
+        frames: List[Frame] = []
+        for name in names:
+            with open(os.path.join(job_dir, name), "rb") as f:
+                data = f.read()
+            if name.endswith(".u8"):
+                frames.extend(unpack_faces(data))
+            else:
+                frames.append(data)
+        return frames
+
+    def _discard(self, response_ids: List[str]):
+        for rid in response_ids:
+            shutil.rmtree(os.path.join(self.own_dir, rid), ignore_errors=True)
+
+    def _orphaned(self, name: str) -> bool:
+        """Whether a spool entry has no live owner: a legacy top-level job or a dead process's directory"""
+        if not name.startswith(OWNER_PREFIX):
+            return True
+        host, _, pid = name[len(OWNER_PREFIX):].rpartition("-")
+        if host != socket.gethostname() or not pid.isdigit():
+            return False  # another host's process; it recovers its own jobs
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return True
+        except OSError:
+            pass
+        return False
+
+    def _recover(self) -> List[str]:
+        """Claim jobs left in the spool by dead processes; returns their ids"""
+        os.makedirs(self.own_dir, exist_ok=True)
+        sources = []
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if path == self.own_dir or not os.path.isdir(path) or not self._orphaned(name):
+                continue
+            if name.startswith(OWNER_PREFIX):
+                sources += [(os.path.join(path, rid), rid) for rid in os.listdir(path)]
+            else:
+                sources.append((path, name))
+        for src, rid in sources:
+            try:
+                # atomic: of several processes claiming the same job only one rename succeeds
+                os.rename(src, os.path.join(self.own_dir, rid))
+            except FileNotFoundError:
+                continue
+            except OSError as exc:  # e.g. a job with that id is already in our directory
+                logger.warning("could not claim spooled job %s: %s", rid, exc)
+        for name in os.listdir(self.spool_dir):
+            path = os.path.join(self.spool_dir, name)
+            if name.startswith(OWNER_PREFIX) and path != self.own_dir and self._orphaned(name):
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    pass
+        return sorted(os.listdir(self.own_dir))
+
+    async def _analyze(self, response_id: str) -> Dict[str, object]:
+        try:
+            frames = await asyncio.to_thread(self._load, response_id)
+            probs, fer_stages = await self.capture.analyze_frames_timed(frames)
+        except InferenceQueueFull:
+            raise
+        except (OSError, ValueError) as exc:
+            return {"emotion_status": "failed", "emotion_error": str(exc)}
+
+        if not len(probs):
+            return {"emotion_status": "failed", "emotion_error": "No emotions detected"}
+        for stage, ms in fer_stages.items():
+            stage_histograms.observe("emotion_pipeline", stage, ms / 1000)
+        return {
+            "emotion_status": "done",
+            **summarize_frames(probs),
+            "analysis_metadata.fer_stages_ms": fer_stages,
+        }
+
+    def _write(self, outcomes: Dict[str, Dict[str, object]]):
+        """Complete the responses, then fold them into the per-(quiz, user) accumulators"""
+        db = get_db()
+        changes = []
+        for rid, outcome in outcomes.items():
+            # The flip only matches a response that is still pending, and only the
+            # caller that flipped it gets the document back, so a job replayed by
+            # another process (or a second time here) is never counted twice.
+            doc = db.responses.find_one_and_update(
+                {"_id": ObjectId(rid), "emotion_status": "pending"},
+                {"$set": outcome},
+                projection={"quiz_id": 1, "user_id": 1, "time_taken": 1, "is_correct": 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+            if doc is not None:
+                changes.append(finished_change({**doc, **outcome}, was_pending=True))
+        apply_changes(db, changes)
+
+    async def _process(self, batch: List[str]):
+        outcomes = await asyncio.gather(*(self._analyze(rid) for rid in batch), return_exceptions=True)
+
+        retry = []
+        outcomes_by_id: Dict[str, Dict[str, object]] = {}
+        for rid, outcome in zip(batch, outcomes):
+            if isinstance(outcome, InferenceQueueFull):
+                retry.append(rid)
+                continue
+            if isinstance(outcome, Exception):
+                outcome = {"emotion_status": "failed", "emotion_error": str(outcome)}
+            outcome["emotion_completed_at"] = datetime.utcnow()
+            outcomes_by_id[rid] = outcome
+
+        finished = list(outcomes_by_id)
+        if finished:
+            await asyncio.to_thread(self._write, outcomes_by_id)
+            await asyncio.to_thread(self._discard, finished)
+            for rid in finished:
+                self._failures.pop(rid, None)
+        if retry:
+            await asyncio.sleep(settings.FER_RETRY_AFTER_S)
+            for rid in retry:
+                self._queue.put_nowait(rid)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < settings.FER_PIPELINE_BATCH and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._process(batch)
+            except Exception:  # keep the consumer alive; the jobs are still spooled
+                logger.exception("emotion pipeline batch of %d failed", len(batch))
+                self._retry_later(batch)
+
+    def _retry_later(self, batch: List[str]):
+        """Re-queue the jobs of a failed batch with exponential backoff, up to FER_PIPELINE_MAX_ATTEMPTS times"""
+        loop = asyncio.get_running_loop()
+        for rid in batch:
+            attempts = self._failures.get(rid, 0) + 1
+            if attempts > settings.FER_PIPELINE_MAX_ATTEMPTS:
+                self._failures.pop(rid, None)
+                logger.error("response %s failed %d batches; its job stays spooled until the next start", rid, attempts - 1)
+                continue
+            self._failures[rid] = attempts
+            delay = min(settings.FER_RETRY_AFTER_S * 2 ** (attempts - 1), settings.FER_PIPELINE_MAX_BACKOFF_S)
+            self._timers[rid] = loop.call_later(delay, self._put_back, rid)
+
+    def _put_back(self, rid: str):
+        self._timers.pop(rid, None)
+        self._queue.put_nowait(rid)
+
+    async def start(self):
+        self.own_dir = os.path.join(self.spool_dir, f"{OWNER_PREFIX}{socket.gethostname()}-{os.getpid()}")
+        self._queue = asyncio.Queue()
+        for rid in await asyncio.to_thread(self._recover):
+            self._queue.put_nowait(rid)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for handle in self._timers.values():
+            handle.cancel()
+        self._timers.clear()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def pending(self) -> int:
+        return self._queue.qsize() if self._queue else 0
@@ -0,0 +1,185 @@
+"""
+Streaming emotion capture: frames arrive over a WebSocket while a question is
+on screen and are analyzed one by one through the shared FER batcher, so by
+the time the student submits, the emotion average is already computed.
+
+Sessions live in the API process that holds the WebSocket. submit-answer
+finalizes the session with the same (quiz_id, user_id, question_id) key; when
+there is none (another worker, no camera, socket dropped), it falls back to
+the frames in the POST.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.emotion_codec import EMOTION_LABELS, dominant_emotion, encode, peak_code
+from app.services.fer_service import EmotionCapture, Frame, FrameTooLarge, unpack_faces
+from app.services.inference_executor import InferenceQueueFull
+from app.services.stage_metrics import stage_histograms
+
+logger = logging.getLogger(__name__)
+
+StreamKey = Tuple[int, str, int]  # (quiz_id, user_id, question_id)
+
+_IMAGE_MAGIC = (b"\xff\xd8", b"\x89PNG")
+
+
+def parse_frame(data: bytes) -> List[Frame]:
+    """One WebSocket message: an encoded image, or packed 48x48 uint8 faces"""
+    if data.startswith(_IMAGE_MAGIC):
+        if len(data) > settings.FER_MAX_FRAME_BYTES:
+            raise FrameTooLarge(f"Frame larger than {settings.FER_MAX_FRAME_BYTES} bytes")
+        return [data]
+    return unpack_faces(data)
+
+
+class EmotionSession:
+    """Running per-emotion average for one answer, fed frame by frame"""
+
+    def __init__(self, key: StreamKey):
+        self.key = key
+        self.buffer: "asyncio.Queue[Frame]" = asyncio.Queue(maxsize=settings.FER_STREAM_BUFFER)
+        # per-emotion sum and single-frame maximum, in EMOTION_LABELS order
+        self.sums = np.zeros(len(EMOTION_LABELS))
+        self.peaks = np.zeros(len(EMOTION_LABELS))
+        self.frames = 0
+        self.dropped = 0
+        self.rate_limited = 0
+        self.failed = 0
+        # set once submit-answer has detached the session
+        self.finalized = False
+        self.started_at = time.monotonic()
+        self.last_seen = self.started_at
+        self._next_slot = self.started_at
+        self._worker: Optional[asyncio.Task] = None
+
+    # ——— Producer (WebSocket receive loop) ———
+    def offer(self, frame: Frame) -> bool:
+        """Queue a frame unless over the rate limit; a full buffer drops its oldest frame"""
+        now = time.monotonic()
+        self.last_seen = now
+        if now < self._next_slot:
+            self.rate_limited += 1
+            return False
+        self._next_slot = now + 1.0 / settings.FER_STREAM_MAX_FPS
+        if self.buffer.full():
+            self.buffer.get_nowait()
+            self.buffer.task_done()
+            self.dropped += 1
+        self.buffer.put_nowait(frame)
+        return True
+
+    # ——— Consumer (one task per session) ———
+    def start(self, capture: EmotionCapture):
+        self._worker = asyncio.create_task(self._run(capture))
+
+    async def _run(self, capture: EmotionCapture):
+        while True:
+            frame = await self.buffer.get()
+            try:
+                probs, fer_stages = await capture.analyze_frames_timed([frame])
+                self.add(probs)
+                for stage, ms in fer_stages.items():
+                    stage_histograms.observe("emotion_stream", stage, ms / 1000)
+            except (InferenceQueueFull, ValueError):
+                self.failed += 1
+            except Exception:
+                # one bad frame must not stop the session's worker
+                self.failed += 1
+                logger.exception("emotion stream %s: frame analysis failed", self.key)
+            finally:
+                self.buffer.task_done()
+
+    def add(self, probs: np.ndarray):
+        """Fold in (n_frames, 7) probabilities"""
+        self.sums += probs.sum(axis=0)
+        self.peaks = np.maximum(self.peaks, probs.max(axis=0))
+        self.frames += len(probs)
+
+    def summary(self) -> Optional[Dict[str, Any]]:
+        """emotion_vector / dominant_code fields, as submit-answer stores them"""
+        if not self.frames:
+            return None
+        return encode(self.sums / self.frames, peak_code(self.peaks))
+
+    def progress(self) -> Dict[str, object]:
+        summary = self.summary()
+        return {
+            "frames": self.frames,
+            "dominant_emotion": dominant_emotion(summary) if summary else None,
+            "dropped": self.dropped,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+        }
+
+    async def drain(self, timeout: float):
+        """Wait (bounded) for frames already received to be analyzed, then stop the worker"""
+        try:
+            await asyncio.wait_for(self.buffer.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self.close()
+
+    def close(self):
+        if self._worker is not None:
+            self._worker.cancel()
+
+
+class EmotionStreams:
+    """Per-process registry of open emotion sessions"""
+
+    def __init__(self, capture: EmotionCapture):
+        self.capture = capture
+        self._sessions: Dict[StreamKey, EmotionSession] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def open(self, key: StreamKey) -> EmotionSession:
+        self._expire()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep())
+        session = self._sessions.get(key)
+        if session is None:
+            session = EmotionSession(key)
+            session.start(self.capture)
+            self._sessions[key] = session
+        return session
+
+    async def finalize(self, key: StreamKey) -> Optional[EmotionSession]:
+        """Detach the session for key once its buffered frames are analyzed; None if absent or empty"""
+        self._expire()
+        session = self._sessions.pop(key, None)
+        if session is None:
+            return None
+        session.finalized = True
+        await session.drain(settings.FER_STREAM_FINALIZE_TIMEOUT_S)
+        return session if session.frames else None
+
+    def _expire(self):
+        cutoff = time.monotonic() - settings.FER_STREAM_IDLE_TTL_S
+        for key in [k for k, s in self._sessions.items() if s.last_seen < cutoff]:
+            self._sessions.pop(key).close()
+
+    async def _sweep(self):
+        """Close idle sessions even when no socket opens or submit arrives"""
+        while True:
+            await asyncio.sleep(settings.FER_STREAM_IDLE_TTL_S)
+            self._expire()
+
+    def close(self):
+        """Stop the sweeper and every session (lifespan shutdown)"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            self._sweeper = None
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "open_sessions": len(self._sessions),
+            "buffered_frames": sum(s.buffer.qsize() for s in self._sessions.values()),
+        }
@@ -0,0 +1,331 @@
+"""
+Streaming exports of raw responses and per-student summaries (for retraining).
+
+Rows are read from a Mongo cursor in EXPORT_BATCH_SIZE batches and encoded
+as they arrive, so memory stays bounded by one batch (one row group for
+Parquet) whatever the export size:
+    ndjson / csv   optionally wrapped in gzip (zlib) or zstd (zstandard)
+    parquet        pyarrow, one row group per EXPORT_ROW_GROUP_SIZE rows,
+                   gzip/zstd as the column codec
+
+"summaries" rows carry the model's feature columns (NUM_FEATURES +
+CAT_FEATURES of metadata.json, computed from quiz_user_features exactly as
+analyze_quiz does) next to the labels stored in quiz_summary_scores.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from pymongo.database import Database
+
+from app.core.startup import lazy_import
+from app.services.emotion_codec import EMOTION_LABELS, emotion_vector
+from app.services.feature_store import COLLECTION as FEATURES, FeatureAccumulator, response_terms
+
+DATASETS = ("responses", "summaries")
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COMPRESSIONS = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+# (column, kind); kind is one of int, float, bool, str, datetime
+Columns = List[Tuple[str, str]]
+
+
+def response_columns(cat_features: Sequence[str]) -> Columns:
+    return [
+        ("quiz_id", "int"), ("user_id", "str"), ("question_id", "int"), ("topic", "str"),
+        ("selected_answer", "str"), ("is_correct", "bool"), ("time_taken", "float"),
+        ("emotion_status", "str"), ("emotion_samples", "int"),
+        *[(name, "str") for name in cat_features],
+        *[(f"emotion_{label}", "float") for label in EMOTION_LABELS],
+        ("stress", "float"), ("timestamp", "datetime"),
+    ]
+
+
+def summary_columns(num_features: Sequence[str], cat_features: Sequence[str]) -> Columns:
+    return [
+        ("quiz_id", "int"), ("user_id", "str"),
+        *[(name, "float") for name in num_features],
+        *[(name, "str") for name in cat_features],
+        ("total_questions", "int"), ("pending_responses", "int"),
+        ("raw_model_label", "str"), ("raw_model_confidence", "float"),
+        ("model_label", "str"), ("overridden_by_rules", "bool"), ("model_version", "str"),
+        ("last_response_at", "datetime"),
+    ]
+
+
+def _range(field: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    bounds = {}
+    if since is not None:
+        bounds["$gte"] = since
+    if until is not None:
+        bounds["$lt"] = until
+    return {field: bounds} if bounds else {}
+
+
+# ---------------------------
+# Row sources (Mongo cursors)
+# ---------------------------
+def response_rows(
+    db: Database,
+    cat_features: Sequence[str],
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    query = {**({"quiz_id": quiz_id} if quiz_id is not None else {}), **_range("timestamp", since, until)}
+    cursor = db.responses.find(query, {"_id": 0, "frame_hashes": 0, "analysis_metadata": 0}).batch_size(batch_size)
+    for doc in cursor:
+        pending = doc.get("emotion_status") == "pending"
+        dom_emo, _, _, stress = response_terms(doc)
+        vector = emotion_vector(doc)
+        row = {
+            "quiz_id": doc.get("quiz_id"),
+            "user_id": doc.get("user_id"),
+            "question_id": doc.get("question_id"),
+            "topic": doc.get("topic"),
+            "selected_answer": doc.get("selected_answer"),
+            "is_correct": doc.get("is_correct"),
+            "time_taken": doc.get("time_taken"),
+            "emotion_status": doc.get("emotion_status", "done"),
+            "emotion_samples": doc.get("emotion_samples"),
+            "stress": None if pending else stress,
+            "timestamp": doc.get("timestamp"),
+        }
+        # the per-response value of each categorical feature (only dominant_emotion today)
+        row.update({name: None if pending else dom_emo for name in cat_features})
+        for i, label in enumerate(EMOTION_LABELS):
+            row[f"emotion_{label}"] = None if vector is None else round(float(vector[i]), 4)
+        yield row
+
+
+def summary_rows(
+    db: Database,
+    num_features: Sequence[str],
+    cat_features: Sequence[str],
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+) -> Iterator[Dict[str, Any]]:
+    """One row per (quiz, user) accumulator, joined with its quiz_summary_scores labels if analyzed"""
+    match = {**({"quiz_id": quiz_id} if quiz_id is not None else {}), **_range("last_response_at", since, until)}
+    pipeline = [
+        {"$match": match},
+        {"$lookup": {
+            "from": "quiz_summary_scores",
+            "let": {"q": "$quiz_id", "u": "$user_id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$and": [{"$eq": ["$user_id", "$$u"]}, {"$eq": ["$quiz_id", "$$q"]}]}}},
+                {"$project": {
+                    "_id": 0, "raw_model_label": 1, "raw_model_confidence": 1,
+                    "model_label": 1, "overridden_by_rules": 1, "model_version": 1,
+                }},
+            ],
+            "as": "scores",
+        }},
+    ]
+    for doc in db[FEATURES].aggregate(pipeline, batchSize=batch_size):
+        result = FeatureAccumulator.from_doc(doc).result()
+        features = result.get("features", {})
+        summary = result.get("summary", {})
+        scores = doc["scores"][0] if doc.get("scores") else {}
+        row = {
+            "quiz_id": doc.get("quiz_id"),
+            "user_id": doc.get("user_id"),
+            "total_questions": summary.get("total_questions", 0),
+            "pending_responses": doc.get("pending", 0),
+            "last_response_at": doc.get("last_response_at"),
+        }
+        row.update({name: features.get(name) for name in list(num_features) + list(cat_features)})
+        row.update({
+            name: scores.get(name)
+            for name in ("raw_model_label", "raw_model_confidence", "model_label", "overridden_by_rules", "model_version")
+        })
+        yield row
+
+
+def batched(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch: List[Dict[str, Any]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+# ---------------------------
+# Encoders
+# ---------------------------
+def _text(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_ndjson(batches: Iterable[List[Dict[str, Any]]], columns: Columns) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    for batch in batches:
+        lines = [json.dumps({n: _text(row.get(n)) for n in names}, default=str) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def encode_csv(batches: Iterable[List[Dict[str, Any]]], columns: Columns) -> Iterator[bytes]:
+    names = [name for name, _ in columns]
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(names)
+    for batch in batches:
+        writer.writerows([_text(row.get(n)) for n in names] for row in batch)
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        # header only (empty export)
+        yield buf.getvalue().encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object for ParquetWriter that hands out what was written since the last take()"""
+
+    def __init__(self):
+        self._buf = io.BytesIO()
+        self._pos = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        n = self._buf.write(data)
+        self._pos += n
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = self._buf.getvalue()
+        self._buf.seek(0)
+        self._buf.truncate()
+        return data
+
+
+_CASTS = {"int": int, "float": float, "bool": bool, "str": str, "datetime": lambda v: v}
+
+
+def _arrow_type(pa, kind: str):
+    return {
+        "int": pa.int64(), "float": pa.float64(), "bool": pa.bool_(),
+        "str": pa.string(), "datetime": pa.timestamp("ms"),
+    }[kind]
+
+
+def encode_parquet(batches: Iterable[List[Dict[str, Any]]], columns: Columns, compression: str) -> Iterator[bytes]:
+    """One row group per batch, streamed out as each group is written"""
+    pa = lazy_import("pyarrow")
+    pq = lazy_import("pyarrow.parquet")
+    schema = pa.schema([(name, _arrow_type(pa, kind)) for name, kind in columns])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression=None if compression == "none" else compression)
+    try:
+        for batch in batches:
+            data = {
+                name: [None if row.get(name) is None else _CASTS[kind](row[name]) for row in batch]
+                for name, kind in columns
+            }
+            writer.write_table(pa.Table.from_pydict(data, schema=schema), row_group_size=len(batch))
+            chunk = sink.take()
+            if chunk:
+                yield chunk
+    finally:
+        writer.close()
+    yield sink.take()
+
+
+def compressed(chunks: Iterable[bytes], compression: str) -> Iterator[bytes]:
+    """gzip / zstd a byte stream incrementally"""
+    if compression == "none":
+        yield from chunks
+        return
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip header
+    else:
+        compressor = lazy_import("zstandard").ZstdCompressor().compressobj()
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+# ---------------------------
+# Entry point (router and CLI)
+# ---------------------------
+def build_export(
+    db: Database,
+    dataset: str,
+    fmt: str,
+    compression: str,
+    num_features: Sequence[str],
+    cat_features: Sequence[str],
+    quiz_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    batch_size: int = 1000,
+    row_group_size: int = 50000,
+) -> Tuple[Iterator[bytes], str, str]:
+    """
+    (byte chunks, media type, file name). Arguments and optional dependencies
+    are checked here, before the first byte is produced; the query itself only
+    runs once the chunks are iterated.
+    """
+    if dataset not in DATASETS:
+        raise ValueError(f"Unknown dataset {dataset!r}; expected one of {', '.join(DATASETS)}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression {compression!r}; expected one of {', '.join(COMPRESSIONS)}")
+    needs = ["pyarrow", "pyarrow.parquet"] if fmt == "parquet" else ["zstandard"] if compression == "zstd" else []
+    for module in needs:
+        try:
+            lazy_import(module)
+        except ImportError:
+            raise ValueError(f"{fmt}/{compression} export needs the {module.split('.')[0]} package")
+
+    if dataset == "responses":
+        columns = response_columns(cat_features)
+        rows = response_rows(db, cat_features, quiz_id, since, until, batch_size)
+    else:
+        columns = summary_columns(num_features, cat_features)
+        rows = summary_rows(db, num_features, cat_features, quiz_id, since, until, batch_size)
+
+    media_type, extension = FORMATS[fmt]
+    if fmt == "parquet":
+        # compression is the Parquet column codec; the file itself stays a plain .parquet
+        chunks = encode_parquet(batched(rows, row_group_size), columns, compression)
+    else:
+        encode = encode_ndjson if fmt == "ndjson" else encode_csv
+        chunks = compressed(encode(batched(rows, batch_size), columns), compression)
+        extension += COMPRESSIONS[compression]
+        if compression != "none":
+            media_type = "application/gzip" if compression == "gzip" else "application/zstd"
+
+    scope = f"quiz{quiz_id}" if quiz_id is not None else "all"
+    return chunks, media_type, f"{dataset}_{scope}.{extension}"
@@ -0,0 +1,462 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from pymongo.database import Database
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from app.services.emotion_codec import EMOTION_CODES, dominant_label
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------
+# Scoring constants
+# ---------------------------
+EMOTION_WEIGHTS = {
+    "neutral": 1, "happy": 0, "sad": 3, "angry": 4,
+    "fear": 5, "surprise": 0, "disgust": 4
+}
+NEG_EMOTIONS = {"sad", "angry", "fear", "disgust"}
+
+# Pre-aggregated per-(quiz_id, user_id) counters, kept current with $inc
+COLLECTION = "quiz_user_features"
+# Per quiz: the reconciled marker, plus the lease and journal of a running rebuild
+STATE_COLLECTION = "quiz_feature_state"
+
+# While a quiz is rebuilt its rows carry REBUILD_FIELD (see rebuild_quiz_accumulators)
+REBUILD_FIELD = "rebuild"
+REBUILD_LEASE = timedelta(minutes=10)
+# how long a writer may take between a rejected $inc and its journal entry
+JOURNAL_GRACE_S = 2.0
+
+# Response states in the order a response moves through them
+NOT_STORED, PENDING, FINISHED = 0, 1, 2
+
+# Features FeatureAccumulator.result() produces; a model version may use any subset
+NUM_FEATURE_NAMES = ("avg_stress", "wrong_ratio", "avg_time", "time_over_15_ratio", "neg_emotion_ratio")
+CAT_FEATURE_NAMES = ("dominant_emotion",)
+
+
+def response_terms(a: Dict[str, Any]) -> Tuple[str, float, bool, float]:
+    """(dominant emotion, time taken, is_correct, stress) for one response document"""
+    # dominant_code, or for documents not yet migrated a dict {"emotion": "..."} or a string
+    dom_emo = dominant_label(a)
+
+    time_taken = float(a.get("time_taken", 0))
+    is_correct = bool(a.get("is_correct", False))
+
+    # stress score = base(by emotion) + 0.5 if time>15 + 1 if wrong
+    base = EMOTION_WEIGHTS.get(dom_emo, 1)
+    stress = base + (0.5 if time_taken > 15 else 0) + (0 if is_correct else 1)
+    return dom_emo, time_taken, is_correct, stress
+
+
+class FeatureAccumulator:
+    """
+    Running per-(quiz, user) counters.
+
+    Stress scores are multiples of 0.5, so summing them is exact and
+    stress_sum / total equals the mean of the per-question scores.
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.wrong = 0
+        self.total_time = 0.0
+        self.over15 = 0
+        self.neg_count = 0
+        self.pending = 0
+        self.stress_sum = 0.0
+        self.emo_counts: Dict[str, int] = {}
+        # when the student last submitted an answer (finished or pending); not a feature
+        self.last_response_at: Optional[datetime] = None
+
+    def answered(self, a: Dict[str, Any]):
+        at = a.get("timestamp")
+        if at is not None and (self.last_response_at is None or at > self.last_response_at):
+            self.last_response_at = at
+
+    def add(self, a: Dict[str, Any]):
+        dom_emo, time_taken, is_correct, stress = response_terms(a)
+
+        self.total += 1
+        self.total_time += time_taken
+        if time_taken > 15:
+            self.over15 += 1
+        if not is_correct:
+            self.wrong += 1
+        if dom_emo in NEG_EMOTIONS:
+            self.neg_count += 1
+
+        self.emo_counts[dom_emo] = self.emo_counts.get(dom_emo, 0) + 1
+        self.stress_sum += stress
+
+    def result(self) -> Dict[str, Any]:
+        total = self.total
+        if not total:
+            return {}
+
+        avg_stress = round(float(self.stress_sum / total), 4)
+        avg_time = round(self.total_time / total, 4)
+        wrong_ratio = round(self.wrong / total, 4)
+        time_over_15_ratio = round(self.over15 / total, 4)
+        neg_emotion_ratio = round(self.neg_count / total, 4)
+
+        emo_counts = self.emo_counts
+        # most counted; ties go to the earlier label in EMOTION_LABELS, whatever the response order
+        dominant_emotion = min(
+            emo_counts, key=lambda label: (-emo_counts[label], EMOTION_CODES.get(label, len(EMOTION_CODES)), label)
+        ) if emo_counts else "neutral"
+
+        return {
+            "features": {
+                "avg_stress": avg_stress,
+                "wrong_ratio": wrong_ratio,
+                "avg_time": avg_time,
+                "time_over_15_ratio": time_over_15_ratio,
+                "neg_emotion_ratio": neg_emotion_ratio,
+                "dominant_emotion": dominant_emotion,
+            },
+            "summary": {
+                "avg_stress_score": avg_stress,
+                "avg_time": avg_time,
+                "wrong_answers": self.wrong,
+                "emotion_counts": emo_counts if emo_counts else {},
+                "total_questions": total,
+                "pending_responses": self.pending
+            }
+        }
+
+    # ——— Persistence (quiz_user_features documents) ———
+    def to_doc(self) -> Dict[str, Any]:
+        doc = {
+            "total": self.total,
+            "wrong": self.wrong,
+            "time_sum": self.total_time,
+            "over15": self.over15,
+            "neg_count": self.neg_count,
+            "pending": self.pending,
+            "stress_sum": self.stress_sum,
+            "emo_counts": dict(self.emo_counts),
+        }
+        if self.last_response_at is not None:
+            doc["last_response_at"] = self.last_response_at
+        return doc
+
+    @classmethod
+    def from_doc(cls, doc: Dict[str, Any]) -> "FeatureAccumulator":
+        acc = cls()
+        acc.total = int(doc.get("total", 0))
+        acc.wrong = int(doc.get("wrong", 0))
+        acc.total_time = float(doc.get("time_sum", 0.0))
+        acc.over15 = int(doc.get("over15", 0))
+        acc.neg_count = int(doc.get("neg_count", 0))
+        acc.pending = max(0, int(doc.get("pending", 0)))
+        acc.stress_sum = float(doc.get("stress_sum", 0.0))
+        acc.emo_counts = {k: int(v) for k, v in (doc.get("emo_counts") or {}).items() if v}
+        acc.last_response_at = doc.get("last_response_at")
+        return acc
+
+
+# ---------------------------
+# Incremental maintenance
+# ---------------------------
+def increments_for(a: Dict[str, Any]) -> Dict[str, Any]:
+    """$inc document that folds one finished response into its accumulator"""
+    dom_emo, time_taken, is_correct, stress = response_terms(a)
+    return {
+        "total": 1,
+        "wrong": 0 if is_correct else 1,
+        "time_sum": time_taken,
+        "over15": 1 if time_taken > 15 else 0,
+        "neg_count": 1 if dom_emo in NEG_EMOTIONS else 0,
+        "stress_sum": stress,
+        f"emo_counts.{dom_emo}": 1,
+    }
+
+
+# A change is (filter, update, transition). The filter only matches rows that are
+# not being rebuilt, so during a rebuild the upsert hits the unique index instead
+# and the writer journals the transition (see rebuild_quiz_accumulators).
+# updated_at moves on every write, rebuilds included; last_response_at only when
+# a student submits an answer (record_response / record_pending), so exports
+# filter on it.
+def _row_filter(quiz_id: int, user_id: str) -> Dict[str, Any]:
+    return {"quiz_id": quiz_id, "user_id": user_id, REBUILD_FIELD: {"$exists": False}}
+
+
+def finished_change(a: Dict[str, Any], was_pending: bool = False):
+    """(filter, update, transition) folding one finished response into its accumulator"""
+    inc = increments_for(a)
+    now = datetime.utcnow()
+    update: Dict[str, Any] = {"$inc": inc, "$set": {"updated_at": now}}
+    if was_pending:
+        # the emotion pipeline finishing an answer submitted earlier
+        inc["pending"] = -1
+        return _row_filter(a["quiz_id"], a["user_id"]), update, _transition(a["_id"], a["user_id"], PENDING, inc)
+    answered_at = a.get("timestamp") or now
+    update["$max"] = {"last_response_at": answered_at}
+    return (
+        _row_filter(a["quiz_id"], a["user_id"]),
+        update,
+        _transition(a["_id"], a["user_id"], NOT_STORED, inc, answered_at),
+    )
+
+
+def pending_change(quiz_id: int, user_id: str, response_id):
+    """(filter, update, transition) counting one response still waiting for emotion analysis"""
+    inc = {"pending": 1}
+    now = datetime.utcnow()
+    return (
+        _row_filter(quiz_id, user_id),
+        {"$inc": inc, "$set": {"updated_at": now}, "$max": {"last_response_at": now}},
+        _transition(response_id, user_id, NOT_STORED, inc, now),
+    )
+
+
+def _transition(response_id, user_id: str, from_state: int, inc: Dict[str, Any],
+                answered_at: Optional[datetime] = None) -> Dict[str, Any]:
+    # inc as pairs: "emo_counts.<label>" is not a valid key inside a stored document
+    transition = {"rid": ObjectId(response_id), "user_id": user_id, "from": from_state, "inc": [[k, v] for k, v in inc.items()]}
+    if answered_at is not None:
+        transition["answered_at"] = answered_at
+    return transition
+
+
+def accumulator_update(change) -> UpdateOne:
+    """Bulk upsert for a change from finished_change / pending_change"""
+    return UpdateOne(change[0], change[1], upsert=True)
+
+
+def journal_transition(db: Database, quiz_id: int, transition: Dict[str, Any]) -> bool:
+    """Hand a rejected change to the quiz's running rebuild; False if none is running"""
+    result = db[STATE_COLLECTION].update_one(
+        {"quiz_id": quiz_id, REBUILD_FIELD: {"$exists": True}},
+        {"$push": {"journal": transition}},
+    )
+    return result.matched_count > 0
+
+
+def apply_change(db: Database, change):
+    """Upsert one change; a row under rebuild makes the change go to the rebuild's journal"""
+    filter_, update, transition = change
+    for _ in range(3):
+        try:
+            db[COLLECTION].update_one(filter_, update, upsert=True)
+            return
+        except DuplicateKeyError:
+            # the row is flagged by a rebuild, or a concurrent first upsert won the race
+            if journal_transition(db, filter_["quiz_id"], transition):
+                return
+    logger.warning("accumulator change for quiz %s dropped after repeated conflicts", filter_["quiz_id"])
+
+
+def apply_changes(db: Database, changes: List[Any]):
+    """apply_change for a batch: one unordered bulk_write, conflicting changes retried one by one"""
+    if not changes:
+        return
+    try:
+        db[COLLECTION].bulk_write([accumulator_update(c) for c in changes], ordered=False)
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(e.get("code") != 11000 for e in errors):
+            raise
+        for e in errors:
+            apply_change(db, changes[e["index"]])
+
+
+def record_response(db: Database, a: Dict[str, Any]):
+    """Fold a response that was analyzed synchronously (and is stored, with its _id) into its accumulator"""
+    apply_change(db, finished_change(a))
+
+
+def record_pending(db: Database, quiz_id: int, user_id: str, response_id):
+    """Count a response still waiting for emotion analysis"""
+    apply_change(db, pending_change(quiz_id, user_id, response_id))
+
+
+def load_quiz_accumulators(db: Database, quiz_id: int) -> Dict[str, FeatureAccumulator]:
+    return {
+        doc["user_id"]: FeatureAccumulator.from_doc(doc)
+        for doc in db[COLLECTION].find({"quiz_id": quiz_id}, {"_id": 0})
+    }
+
+
+# ---------------------------
+# Rebuild / backfill from raw responses
+# ---------------------------
+def accumulate_responses(responses: Iterable[Dict[str, Any]]) -> Dict[str, FeatureAccumulator]:
+    """Group a stream of one quiz's responses into per-user accumulators"""
+    accs: Dict[str, FeatureAccumulator] = {}
+    for a in responses:
+        acc = accs.setdefault(a.get("user_id"), FeatureAccumulator())
+        acc.answered(a)
+        if a.get("emotion_status") == "pending":
+            acc.pending += 1
+        else:
+            acc.add(a)
+    return accs
+
+
+class RebuildInProgress(RuntimeError):
+    """Another process holds the quiz's rebuild lease"""
+
+
+def _acquire_rebuild(db: Database, quiz_id: int) -> ObjectId:
+    now = datetime.utcnow()
+    token = ObjectId()
+    try:
+        db[STATE_COLLECTION].update_one(
+            {"quiz_id": quiz_id, "$or": [
+                {REBUILD_FIELD: {"$exists": False}},
+                {f"{REBUILD_FIELD}.until": {"$lt": now}},  # lease of a crashed rebuild
+            ]},
+            # journal entries from before this point are covered by the scan below
+            {"$set": {REBUILD_FIELD: {"token": token, "until": now + REBUILD_LEASE}, "journal": []}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        raise RebuildInProgress(f"quiz {quiz_id} is being rebuilt")
+    return token
+
+
+def _drain_journal(db: Database, quiz_id: int, scanned: Dict[ObjectId, int], replaced: set) -> int:
+    """
+    Apply the journaled transitions the scan did not already see. A transition
+    from state S is in the scan when the scan found its response past S. Rows
+    the rebuild did not replace (students new since it started) hold none of
+    the scan, so every transition of theirs applies.
+    """
+    state = db[STATE_COLLECTION].find_one({"quiz_id": quiz_id}, {"journal": 1}) or {}
+    entries = state.get("journal") or []
+    if not entries:
+        return 0
+    ops = []
+    for entry in entries:
+        seen = scanned.get(entry["rid"], NOT_STORED) if entry["user_id"] in replaced else NOT_STORED
+        if seen <= entry["from"]:
+            update = {"$inc": dict(entry["inc"]), "$set": {"updated_at": datetime.utcnow()}}
+            if "answered_at" in entry:
+                update["$max"] = {"last_response_at": entry["answered_at"]}
+            ops.append(UpdateOne({"quiz_id": quiz_id, "user_id": entry["user_id"]}, update, upsert=True))
+    if ops:
+        db[COLLECTION].bulk_write(ops, ordered=False)
+    db[STATE_COLLECTION].update_one({"quiz_id": quiz_id}, {"$pull": {"journal": {"$in": entries}}})
+    return len(entries)
+
+
+def rebuild_quiz_accumulators(db: Database, quiz_id: int, projection: Dict[str, int]) -> Dict[str, FeatureAccumulator]:
+    """
+    Recompute one quiz's accumulators from its responses while submissions keep
+    arriving, then mark the quiz reconciled.
+
+    1. Take the quiz's rebuild lease and flag every row (creating rows for
+       students who have responses but none). Writers filter on the flag's
+       absence, so from here their $inc on a flagged row fails on the unique
+       index and they journal the transition instead.
+    2. Scan the responses. A change applied before step 1 was made to its
+       response first, so the scan sees it.
+    3. Replace the flagged rows with the scan, fold in the journal, clear the
+       flags, wait JOURNAL_GRACE_S for writers rejected just before that, and
+       release the lease once the journal is empty.
+    Raises RebuildInProgress if another process holds the lease.
+    """
+    token = _acquire_rebuild(db, quiz_id)
+    user_ids = db.responses.distinct("user_id", {"quiz_id": quiz_id})
+    db[COLLECTION].update_many({"quiz_id": quiz_id}, {"$set": {REBUILD_FIELD: token}})
+    if user_ids:
+        db[COLLECTION].bulk_write([
+            UpdateOne({"quiz_id": quiz_id, "user_id": uid}, {"$set": {REBUILD_FIELD: token}}, upsert=True)
+            for uid in user_ids
+        ], ordered=False)
+
+    scanned: Dict[ObjectId, int] = {}
+
+    def scan():
+        # the drain matches journal entries to responses by _id, which callers' projections may drop
+        for a in db.responses.find({"quiz_id": quiz_id}, {**projection, "_id": 1}, batch_size=1000):
+            scanned[a["_id"]] = PENDING if a.get("emotion_status") == "pending" else FINISHED
+            yield a
+
+    accs = accumulate_responses(scan())
+
+    now = datetime.utcnow()
+    flagged = {"quiz_id": quiz_id, REBUILD_FIELD: token}
+    ops: List[Any] = [
+        # only rows flagged in step 1; a student new since then keeps the row writers built
+        ReplaceOne(
+            {**flagged, "user_id": uid},
+            {"quiz_id": quiz_id, "user_id": uid, **acc.to_doc(), REBUILD_FIELD: token, "updated_at": now},
+        )
+        for uid, acc in accs.items()
+    ]
+    if ops:
+        db[COLLECTION].bulk_write(ops, ordered=False)
+    db[COLLECTION].delete_many({**flagged, "user_id": {"$nin": list(accs.keys())}})
+    replaced = {doc["user_id"] for doc in db[COLLECTION].find(flagged, {"user_id": 1})}
+
+    _drain_journal(db, quiz_id, scanned, replaced)
+    db[COLLECTION].update_many(flagged, {"$unset": {REBUILD_FIELD: ""}})
+    time.sleep(JOURNAL_GRACE_S)
+    while True:
+        _drain_journal(db, quiz_id, scanned, replaced)
+        released = db[STATE_COLLECTION].update_one(
+            {"quiz_id": quiz_id, f"{REBUILD_FIELD}.token": token, "journal": {"$size": 0}},
+            {"$unset": {REBUILD_FIELD: "", "journal": ""}, "$set": {"reconciled_at": datetime.utcnow()}},
+        )
+        if released.matched_count:
+            break
+    return load_quiz_accumulators(db, quiz_id)
+
+
+def mark_reconciled(db: Database, quiz_id: int):
+    db[STATE_COLLECTION].update_one(
+        {"quiz_id": quiz_id}, {"$set": {"reconciled_at": datetime.utcnow()}}, upsert=True
+    )
+
+
+def ensure_quiz_accumulators(db: Database, quiz_id: int, projection: Dict[str, int]) -> Dict[str, FeatureAccumulator]:
+    """
+    Stored accumulators for one quiz. The first time a quiz is seen, they are
+    rebuilt from raw responses if they do not account for every response.
+    That covers quizzes answered before the accumulators existed, including
+    ones that got a few $inc rows after the upgrade. Only a completed rebuild
+    (or an exact count) marks the quiz reconciled; a rebuild that crashed
+    leaves an expired lease, and the next call rebuilds again.
+    """
+    accs = load_quiz_accumulators(db, quiz_id)
+    state = db[STATE_COLLECTION].find_one({"quiz_id": quiz_id}, {"reconciled_at": 1, REBUILD_FIELD: 1}) or {}
+    lease = state.get(REBUILD_FIELD)
+    if lease is not None:
+        if lease["until"] >= datetime.utcnow():
+            return accs  # another process is rebuilding; serve the current rows
+        return _rebuild_or_current(db, quiz_id, projection, accs)
+    if state.get("reconciled_at"):
+        return accs
+    counted = sum(acc.total + acc.pending for acc in accs.values())
+    if counted != db.responses.count_documents({"quiz_id": quiz_id}):
+        return _rebuild_or_current(db, quiz_id, projection, accs)
+    mark_reconciled(db, quiz_id)
+    return accs
+
+
+def _rebuild_or_current(db: Database, quiz_id: int, projection: Dict[str, int], accs: Dict[str, FeatureAccumulator]):
+    try:
+        return rebuild_quiz_accumulators(db, quiz_id, projection)
+    except RebuildInProgress:
+        return accs
+
+
+def rebuild_accumulators(db: Database, projection: Dict[str, int], quiz_id: Optional[int] = None) -> Dict[int, Optional[int]]:
+    """Backfill/repair accumulators for one quiz or every quiz; returns users per quiz (None: already being rebuilt)"""
+    quiz_ids = [quiz_id] if quiz_id is not None else db.responses.distinct("quiz_id")
+    report: Dict[int, Optional[int]] = {}
+    for qid in quiz_ids:
+        try:
+            report[qid] = len(rebuild_quiz_accumulators(db, qid, projection))
+        except RebuildInProgress:
+            report[qid] = None
+    return report
@@ -0,0 +1,134 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from queue import Queue, Empty
+from typing import Callable, Deque, Dict, List, Tuple
+
+import numpy as np
+
+
+class BatchMetrics:
+    """In-process counters for FER batching (per-request latency, batch sizes, CPU)"""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.frames = 0
+        self.batches = 0
+        self.cpu_seconds = 0.0
+        self._latencies_ms: Deque[float] = deque(maxlen=window)
+        self._batch_frames: Deque[int] = deque(maxlen=window)
+        self._batch_requests: Deque[int] = deque(maxlen=window)
+
+    def observe_batch(self, n_requests: int, n_frames: int, cpu_seconds: float):
+        with self._lock:
+            self.batches += 1
+            self.frames += n_frames
+            self.cpu_seconds += cpu_seconds
+            self._batch_frames.append(n_frames)
+            self._batch_requests.append(n_requests)
+
+    def observe_request(self, latency_ms: float):
+        with self._lock:
+            self.requests += 1
+            self._latencies_ms.append(latency_ms)
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            lat = np.asarray(self._latencies_ms, dtype=float)
+            frames = np.asarray(self._batch_frames, dtype=float)
+            reqs = np.asarray(self._batch_requests, dtype=float)
+            return {
+                "requests": self.requests,
+                "frames": self.frames,
+                "batches": self.batches,
+                "avg_batch_frames": round(float(frames.mean()), 2) if frames.size else 0.0,
+                "avg_batch_requests": round(float(reqs.mean()), 2) if reqs.size else 0.0,
+                "max_batch_frames": int(frames.max()) if frames.size else 0,
+                "latency_ms_p50": round(float(np.percentile(lat, 50)), 1) if lat.size else 0.0,
+                "latency_ms_p95": round(float(np.percentile(lat, 95)), 1) if lat.size else 0.0,
+                "latency_ms_p99": round(float(np.percentile(lat, 99)), 1) if lat.size else 0.0,
+                "cpu_seconds_total": round(self.cpu_seconds, 3),
+                "cpu_seconds_per_request": round(self.cpu_seconds / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+class FERBatcher:
+    """Collects frames from concurrent requests and runs them through one model call.
+
+    The collector thread waits until a dispatch slot is free, then takes the
+    first pending request and keeps pulling requests for up to ``window_ms``
+    (or until ``max_batch_frames`` is reached). ``dispatch_fn`` receives the
+    whole group and returns a Future of ``(results, n_frames, cpu_seconds,
+    timings)``; each request's future resolves to ``(result, timing)``.
+    While every slot is busy, new requests pile up and form larger batches.
+    """
+
+    def __init__(
+        self,
+        dispatch_fn: Callable[[List[list]], Future],
+        max_batch_frames: int = 32,
+        window_ms: float = 15,
+        metrics: BatchMetrics = None,
+        max_inflight: int = 1,
+    ):
+        self.dispatch_fn = dispatch_fn
+        self.max_batch_frames = max_batch_frames
+        self.window_s = window_ms / 1000.0
+        self.metrics = metrics or BatchMetrics()
+        self._slots = threading.Semaphore(max(1, max_inflight))
+        self._queue: "Queue[Tuple[list, Future, float]]" = Queue()
+        self._thread = threading.Thread(target=self._run, name="fer-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, frames: list) -> Future:
+        fut: Future = Future()
+        self._queue.put((frames, fut, time.perf_counter()))
+        return fut
+
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def _collect(self) -> List[Tuple[list, Future, float]]:
+        batch = [self._queue.get()]
+        n_frames = len(batch[0][0])
+        deadline = time.perf_counter() + self.window_s
+        while n_frames < self.max_batch_frames:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except Empty:
+                break
+            batch.append(item)
+            n_frames += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            self._slots.acquire()
+            batch = self._collect()
+            try:
+                fut = self.dispatch_fn([frames for frames, _, _ in batch])
+            except Exception as exc:
+                fut = Future()
+                fut.set_exception(exc)
+            fut.add_done_callback(lambda f, batch=batch: self._finish(batch, f))
+
+    def _finish(self, batch, fut: Future):
+        self._slots.release()
+        try:
+            results, n_frames, cpu_seconds, timings = fut.result()
+            self.metrics.observe_batch(len(batch), n_frames, cpu_seconds)
+        except Exception as exc:  # model/worker failure: fail every request in the batch
+            results, timings = [exc] * len(batch), [{}] * len(batch)
+
+        done = time.perf_counter()
+        for (_, req_fut, started), result, timing in zip(batch, results, timings):
+            self.metrics.observe_request((done - started) * 1000)
+            if isinstance(result, Exception):
+                req_fut.set_exception(result)
+            else:
+                req_fut.set_result((result, timing))
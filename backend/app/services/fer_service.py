@@ -1,60 +1,378 @@
-from deepface import DeepFace
+import asyncio
+import threading
+import time
 import numpy as np
-from statistics import mean
-from typing import List, Dict
-import cv2
-from io import BytesIO
+from concurrent.futures import Future
+from typing import List, Dict, Optional, Tuple, Union
+
+from app.core.config import settings
+from app.core.startup import lazy_import
+from app.services.emotion_backends import build_backend
+from app.services.emotion_codec import EMOTION_LABELS, average_vector, emotion_list
+from app.services.fer_batcher import FERBatcher, BatchMetrics
+from app.services.inference_executor import InferenceExecutor, InferenceQueueFull
+
+FACE_SIZE = 48
+FACE_BYTES = FACE_SIZE * FACE_SIZE
+
+# A frame is either an encoded image (JPEG/PNG bytes) or a pre-cropped 48x48 uint8 face
+Frame = Union[bytes, np.ndarray]
+# Face bounding box (x, y, w, h) in decoded-frame pixels
+Box = Tuple[int, int, int, int]
+
+# OpenCV and deepface are imported on first use, so only processes that
+# actually decode frames or run the model pay for them
+_REDUCED_GRAYSCALE = [
+    (8, "IMREAD_REDUCED_GRAYSCALE_8"),
+    (4, "IMREAD_REDUCED_GRAYSCALE_4"),
+    (2, "IMREAD_REDUCED_GRAYSCALE_2"),
+]
+
+
+class FrameTooLarge(ValueError):
+    """Frame exceeds FER_MAX_FRAME_BYTES / FER_MAX_FRAME_PIXELS or too many packed faces"""
+
+
+def jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG's SOF header without decoding; None if not a JPEG"""
+    if data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        length = int.from_bytes(data[i + 2:i + 4], "big")
+        # SOF0..SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + length
+    return None
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG, PNG, WebP, GIF or BMP header; None for other formats"""
+    if data[:2] == b"\xff\xd8":
+        return jpeg_size(data)
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and data[12:16] == b"IHDR" and len(data) >= 24:
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            return int.from_bytes(data[26:28], "little") & 0x3FFF, int.from_bytes(data[28:30], "little") & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        return None
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        return int.from_bytes(data[6:8], "little"), int.from_bytes(data[8:10], "little")
+    if data[:2] == b"BM" and len(data) >= 26:
+        return abs(int.from_bytes(data[18:22], "little", signed=True)), abs(int.from_bytes(data[22:26], "little", signed=True))
+    return None
+
+
+def unpack_faces(data: bytes) -> List[np.ndarray]:
+    """Split a packed N x 48 x 48 uint8 upload into per-face arrays"""
+    if not data or len(data) % FACE_BYTES:
+        raise ValueError(f"Packed faces must be N x {FACE_SIZE} x {FACE_SIZE} uint8 ({FACE_BYTES} bytes each)")
+    n = len(data) // FACE_BYTES
+    if n > settings.FER_MAX_PACKED_FACES:
+        raise FrameTooLarge(f"At most {settings.FER_MAX_PACKED_FACES} packed faces per answer")
+    return list(np.frombuffer(data, np.uint8).reshape(n, FACE_SIZE, FACE_SIZE))
+
+
+def run_groups(capture: "EmotionCapture", groups: List[List[Frame]]):
+    """Run one batch and report (results, frames, CPU seconds, per-group stage ms)"""
+    cpu_start = time.process_time()
+    timings: List[Dict[str, float]] = []
+    results = capture.analyze_groups(groups, timings)
+    n_frames = sum(len(r) for r in results if not isinstance(r, Exception))
+    return results, n_frames, time.process_time() - cpu_start, timings
+
 
 class EmotionCapture:
-    def __init__(self):
+    def __init__(
+        self,
+        detector_backend: Optional[str] = None,
+        tracking: Optional[str] = None,
+        model_backend: Optional[str] = None,
+    ):
         self.model_name = "VGG-FER"
-        self.sample_size = 3  
-        self.min_confidence = 0.1  
+        # "keras" (deepface/TensorFlow) or "onnx" (onnxruntime CPU), see emotion_backends
+        self.model_backend = model_backend or settings.FER_MODEL_BACKEND
+        self.min_confidence = 0.1
+        self.detector_backend = detector_backend or settings.FER_DETECTOR_BACKEND
+        # "off": detect on every frame; "roi": re-detect near the previous face; "reuse": crop the previous box
+        self.tracking = tracking or settings.FER_FACE_TRACKING
+        self.detections = {"full": 0, "roi": 0, "reused": 0, "fallback": 0, "detect_s": 0.0}
+        self.metrics = BatchMetrics()
+        self._emotion_model = None
+        self._batcher: Optional[FERBatcher] = None
+        self._executor: Optional[InferenceExecutor] = None
+        self._inflight = 0
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
 
-    def capture_emotions(self, image_bytes: bytes) -> List[Dict[str, float]]:
-        """Capture multiple emotion samples and return averaged results"""
-        samples = []
-        
-        
-        nparr = np.frombuffer(image_bytes, np.uint8)
-        image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)  
+    # ——— Model / detection ———
+    def _load_model(self):
+        """Build the emotion model backend once per process"""
+        if self._emotion_model is None:
+            self._emotion_model = build_backend(self.model_backend)
+        return self._emotion_model
+
+    def _decode(self, image_bytes: bytes) -> np.ndarray:
+        """Decode straight to grayscale, letting libjpeg downscale large frames while decoding"""
+        if len(image_bytes) > settings.FER_MAX_FRAME_BYTES:
+            raise FrameTooLarge(f"Frame larger than {settings.FER_MAX_FRAME_BYTES} bytes")
 
-    
+        cv2 = lazy_import("cv2")
+        flag = cv2.IMREAD_GRAYSCALE
+        size = image_size(image_bytes)
+        if size is not None:
+            width, height = size
+            if width * height > settings.FER_MAX_FRAME_PIXELS:
+                raise FrameTooLarge(f"Frame of {width}x{height} exceeds {settings.FER_MAX_FRAME_PIXELS} pixels")
+        if size is not None and image_bytes[:2] == b"\xff\xd8":
+            # largest reduction that still leaves FER_DECODE_MIN_SIDE pixels for detection
+            for factor, reduced in _REDUCED_GRAYSCALE:
+                if min(width, height) // factor >= settings.FER_DECODE_MIN_SIDE:
+                    flag = getattr(cv2, reduced)
+                    break
+
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        image = cv2.imdecode(nparr, flag)
         if image is None:
             raise ValueError("Failed to decode the image. Check the image format or input.")
+        # formats without a header we can read (or a header that lied) are checked after decoding
+        if image.shape[0] * image.shape[1] > settings.FER_MAX_FRAME_PIXELS:
+            raise FrameTooLarge(
+                f"Frame of {image.shape[1]}x{image.shape[0]} exceeds {settings.FER_MAX_FRAME_PIXELS} pixels"
+            )
+        return image
+
+    def _detect_face(self, gray: np.ndarray) -> Tuple[np.ndarray, Optional[Box], float]:
+        """Detect (and align) the first face: (48x48 grayscale crop, box, detector confidence).
+
+        The box is None when nothing was found and the whole frame was used.
+        """
+        cv2 = lazy_import("cv2")
+        DeepFace = lazy_import("deepface.DeepFace")
+
+        started = time.perf_counter()
+        faces = DeepFace.extract_faces(
+            img_path=cv2.cvtColor(gray, cv2.COLOR_GRAY2BGR),
+            detector_backend=self.detector_backend,
+            enforce_detection=False,
+            align=True,
+        )
+        self.detections["detect_s"] += time.perf_counter() - started
 
-        for _ in range(self.sample_size):
-            result = DeepFace.analyze(
-                img_path=image,
-                actions=['emotion'],
-                detector_backend="opencv",
-                enforce_detection=False,
-                silent=True
+        # extract_faces returns RGB in [0, 1]; the emotion head was trained on BGR->gray
+        face = faces[0]["face"][:, :, ::-1].astype(np.float32)
+        crop = cv2.resize(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), (FACE_SIZE, FACE_SIZE))
+
+        confidence = float(faces[0].get("confidence") or 0)
+        area = faces[0].get("facial_area") or {}
+        box = (area["x"], area["y"], area["w"], area["h"]) if confidence > 0 and area.get("w") else None
+        return crop, box, confidence
+
+    @staticmethod
+    def _crop_box(gray: np.ndarray, box: Box) -> np.ndarray:
+        """48x48 crop of a known face box, without detection or alignment"""
+        cv2 = lazy_import("cv2")
+        x, y, w, h = box
+        face = gray[y:y + h, x:x + w].astype(np.float32) / 255.0
+        return cv2.resize(face, (FACE_SIZE, FACE_SIZE))
+
+    @staticmethod
+    def _search_window(box: Box, shape: Tuple[int, ...]) -> Tuple[int, int, int, int]:
+        """Previous box grown by FER_TRACK_MARGIN on each side, clipped to the frame"""
+        x, y, w, h = box
+        mx, my = int(w * settings.FER_TRACK_MARGIN), int(h * settings.FER_TRACK_MARGIN)
+        height, width = shape[:2]
+        return max(0, x - mx), max(0, y - my), min(width, x + w + mx), min(height, y + h + my)
+
+    def _track_face(self, gray: np.ndarray, box: Optional[Box]) -> Tuple[np.ndarray, Optional[Box]]:
+        """Crop the face of one frame, starting from the previous frame's box when tracking"""
+        if box is not None and self.tracking == "reuse":
+            x, y, w, h = box
+            if x + w <= gray.shape[1] and y + h <= gray.shape[0]:
+                self.detections["reused"] += 1
+                return self._crop_box(gray, box), box
+
+        if box is not None and self.tracking == "roi":
+            x0, y0, x1, y1 = self._search_window(box, gray.shape)
+            crop, found, confidence = self._detect_face(gray[y0:y1, x0:x1])
+            if found is not None and confidence >= settings.FER_TRACK_MIN_CONFIDENCE:
+                self.detections["roi"] += 1
+                return crop, (found[0] + x0, found[1] + y0, found[2], found[3])
+            self.detections["fallback"] += 1
+
+        self.detections["full"] += 1
+        crop, found, _ = self._detect_face(gray)
+        return crop, found
+
+    def _crop_group(self, frames: List[Frame], timing: Dict[str, float]) -> List[np.ndarray]:
+        """48x48 crops for one answer's frames, carrying the face box from frame to frame"""
+        crops, box = [], None
+        for frame in frames:
+            if isinstance(frame, np.ndarray):
+                # pre-cropped by the client: only scale to [0, 1]
+                crops.append(frame.astype(np.float32) / 255.0)
+                continue
+            started = time.perf_counter()
+            gray = self._decode(frame)
+            decoded = time.perf_counter()
+            crop, box = self._track_face(gray, box)
+            timing["decode"] += (decoded - started) * 1000
+            timing["face_detection"] += (time.perf_counter() - decoded) * 1000
+            crops.append(crop)
+        return crops
+
+    def _predict(self, crops: List[np.ndarray]) -> np.ndarray:
+        """Run the emotion model once over every crop, returns (N, 7) probabilities"""
+        batch = np.stack(crops)[..., np.newaxis]
+        probs = self._load_model().predict(batch.astype(np.float32))
+        return probs / probs.sum(axis=1, keepdims=True)
+
+    # ——— Batched inference ———
+    def analyze_groups(
+        self,
+        groups: List[List[Frame]],
+        timings: Optional[List[Dict[str, float]]] = None,
+    ) -> List[Union[np.ndarray, Exception]]:
+        """Analyze several requests' frames with a single forward pass.
+
+        Returns one entry per group: its (n_frames, 7) float32 probabilities in
+        EMOTION_LABELS order (see emotion_codec), or the exception that made that group unusable (other groups are unaffected).
+        If ``timings`` is given, one dict of stage milliseconds per group is
+        appended to it; every group reports the shared forward pass in full,
+        since that is what it waited for.
+        """
+        crops: List[np.ndarray] = []
+        spans: List[Union[slice, Exception]] = []
+        group_timings = [{"decode": 0.0, "face_detection": 0.0} for _ in groups]
+        for frames, timing in zip(groups, group_timings):
+            start = len(crops)
+            try:
+                group_crops = self._crop_group(frames, timing)
+            except ValueError as exc:
+                spans.append(exc)
+                continue
+            crops.extend(group_crops)
+            spans.append(slice(start, len(crops)))
+
+        started = time.perf_counter()
+        probs = self._predict(crops) if crops else np.empty((0, len(EMOTION_LABELS)))
+        inference_ms = (time.perf_counter() - started) * 1000
+
+        results: List[Union[np.ndarray, Exception]] = []
+        for span, timing in zip(spans, group_timings):
+            timing["emotion_inference"] = inference_ms
+            results.append(span if isinstance(span, Exception) else probs[span].astype(np.float32))
+
+        if timings is not None:
+            timings.extend({k: round(v, 3) for k, v in t.items()} for t in group_timings)
+        return results
+
+    def capture_batch(self, frames: List[Frame]) -> np.ndarray:
+        """Synchronous batched path for one request (offline jobs, scripts)"""
+        result = self.analyze_groups([frames])[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def warm_up(self):
+        """Build the detector and emotion model with one throwaway inference"""
+        cv2 = lazy_import("cv2")
+        blank = np.full((240, 320, 3), 128, dtype=np.uint8)
+        ok, buf = cv2.imencode(".jpg", blank)
+        self.capture_batch([buf.tobytes()])
+
+    # ——— Serving path ———
+    def start(self):
+        """Start the inference executor (worker processes) and the micro-batcher"""
+        with self._start_lock:
+            if self._batcher is not None:
+                return
+            if settings.FER_WORKERS > 0:
+                self._executor = InferenceExecutor(settings.FER_WORKERS, settings.FER_RETRY_AFTER_S)
+                self._executor.start()
+                dispatch, inflight = self._executor.dispatch, settings.FER_WORKERS
+            else:
+                # In-process fallback (dev / tests): run on the batcher thread
+                self.warm_up()
+                dispatch, inflight = self._dispatch_local, 1
+            self._batcher = FERBatcher(
+                dispatch,
+                max_batch_frames=settings.FER_BATCH_MAX_FRAMES,
+                window_ms=settings.FER_BATCH_WINDOW_MS,
+                metrics=self.metrics,
+                max_inflight=inflight,
             )
-            
-            if isinstance(result, list):
-                result = result[0] 
-            
-            samples.append(result["emotion"])
-        
-        return self._average_emotions(samples)
-
-    def _average_emotions(self, samples: List[dict]) -> List[Dict[str, float]]:
-        """Calculate average confidence for each emotion"""
-        emotion_totals = {}
-        
-        
-        for sample in samples:
-            for emotion, confidence in sample.items():
-                emotion_totals.setdefault(emotion.lower(), []).append(confidence / 100)  
-        
-        
-        averaged = [
-            {"emotion": e, "confidence": round(float(mean(confidences)), 4)} 
-            for e, confidences in emotion_totals.items()
-            if mean(confidences) >= self.min_confidence  
-        ]
-        
-        
-        return sorted(averaged, key=lambda x: x["confidence"], reverse=True)
 
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _dispatch_local(self, groups: List[List[Frame]]) -> Future:
+        fut: Future = Future()
+        fut.set_result(run_groups(self, groups))
+        return fut
+
+    async def analyze_frames_timed(self, frames: List[Frame]) -> Tuple[np.ndarray, Dict[str, float]]:
+        """Queue frames for the shared micro-batcher and await their emotions.
+
+        Returns ((n_frames, 7) probabilities, stage ms). The stages are measured
+        where the work ran (decode, face_detection, emotion_inference);
+        ``fer_queue_wait`` is the rest of the round-trip (batching window,
+        queueing, transfer to and from the worker).
+        Raises InferenceQueueFull when FER_MAX_QUEUE requests are already waiting.
+        """
+        if self._batcher is None:
+            await asyncio.to_thread(self.start)
+        with self._lock:
+            if self._inflight >= settings.FER_MAX_QUEUE:
+                raise InferenceQueueFull(settings.FER_RETRY_AFTER_S)
+            self._inflight += 1
+        try:
+            started = time.perf_counter()
+            probs, timing = await asyncio.wrap_future(self._batcher.submit(frames))
+            total_ms = (time.perf_counter() - started) * 1000
+            timing = dict(timing)
+            timing["fer_queue_wait"] = round(max(0.0, total_ms - sum(timing.values())), 3)
+            return probs, timing
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    async def analyze_frames(self, frames: List[Frame]) -> np.ndarray:
+        """analyze_frames_timed without the stage timings"""
+        probs, _ = await self.analyze_frames_timed(frames)
+        return probs
+
+    def status(self) -> Dict[str, object]:
+        return {
+            **self.metrics.snapshot(),
+            "inflight_requests": self._inflight,
+            "queue_depth": self._batcher.depth() if self._batcher else 0,
+            "max_queue": settings.FER_MAX_QUEUE,
+            "workers": self._executor.workers_info if self._executor else [],
+            "worker_pool_restarts": self._executor.restarts if self._executor else 0,
+        }
+
+    def capture_emotions(self, image_bytes: bytes) -> List[Dict[str, float]]:
+        """Capture emotions for a single frame and return averaged results"""
+        return emotion_list(self._average_emotions(self.capture_batch([image_bytes])), self.min_confidence)
+
+    @staticmethod
+    def _average_emotions(probs: np.ndarray) -> np.ndarray:
+        """Mean confidence of each emotion across frames, in EMOTION_LABELS order"""
+        return average_vector(probs)
@@ -0,0 +1,163 @@
+"""
+Optional archive of the raw frames students submit.
+
+Frames are stored byte-for-byte (no decode / re-encode), content-addressed by
+SHA-256 and sharded by hash prefix:
+
+    STORAGE_PATH/archive/ab/cd/abcd...ef.jpg
+
+The same frame is stored once; seeing it again only refreshes its mtime, which
+is what retention cleanup goes by. Writes happen on a background task fed by a
+bounded queue, so archiving never adds latency to submit-answer: when the
+queue is full the frames are dropped from the archive and counted.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+_EXTENSIONS = ((b"\xff\xd8", ".jpg"), (b"\x89PNG", ".png"))
+
+
+def archive_dir() -> str:
+    return os.path.join(settings.STORAGE_PATH, "archive")
+
+
+def frame_bytes(frame) -> bytes:
+    return frame.tobytes() if isinstance(frame, np.ndarray) else frame
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def archive_path(digest: str, data: bytes) -> str:
+    ext = next((e for magic, e in _EXTENSIONS if data.startswith(magic)), ".u8")
+    return os.path.join(archive_dir(), digest[:2], digest[2:4], digest + ext)
+
+
+def store(data: bytes, digest: Optional[str] = None) -> str:
+    """Write one frame if it is not archived yet (atomic rename); returns its path"""
+    path = archive_path(digest or content_hash(data), data)
+    if os.path.exists(path):
+        os.utime(path)  # seen again: restart its retention clock
+        return path
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+    return path
+
+
+def cleanup(retention_days: float) -> Dict[str, int]:
+    """Delete archived frames not written or seen for retention_days, and empty shards"""
+    root = archive_dir()
+    cutoff = time.time() - retention_days * 86400
+    removed = kept = 0
+    if not os.path.isdir(root):
+        return {"removed": 0, "kept": 0}
+    for dirpath, _, filenames in os.walk(root, topdown=False):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+                else:
+                    kept += 1
+            except FileNotFoundError:
+                continue
+        if dirpath != root and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+    return {"removed": removed, "kept": kept}
+
+
+class ImageArchive:
+    """Background writer for the frame archive (IMAGE_ARCHIVE_ENABLED)"""
+
+    def __init__(self):
+        self.enabled = settings.IMAGE_ARCHIVE_ENABLED
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self.stored = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_cleanup: Optional[Dict[str, int]] = None
+
+    def submit(self, frames: List) -> List[str]:
+        """Queue frames for archiving without waiting; returns their content hashes"""
+        if not self.enabled or self._queue is None:
+            return []
+        digests = []
+        for frame in frames:
+            data = frame_bytes(frame)
+            digest = content_hash(data)
+            digests.append(digest)
+            try:
+                self._queue.put_nowait((digest, data))
+            except asyncio.QueueFull:
+                self.dropped += 1
+        return digests
+
+    def _store(self, digest: str, data: bytes):
+        existed = os.path.exists(archive_path(digest, data))
+        store(data, digest)
+        if existed:
+            self.deduplicated += 1
+        else:
+            self.stored += 1
+
+    async def _writer(self):
+        while True:
+            digest, data = await self._queue.get()
+            try:
+                await asyncio.to_thread(self._store, digest, data)
+            except OSError:
+                self.errors += 1
+            finally:
+                self._queue.task_done()
+
+    async def _cleaner(self):
+        while True:
+            try:
+                self.last_cleanup = await asyncio.to_thread(cleanup, settings.IMAGE_ARCHIVE_RETENTION_DAYS)
+            except OSError:
+                self.errors += 1
+            await asyncio.sleep(settings.IMAGE_ARCHIVE_CLEANUP_INTERVAL_S)
+
+    async def start(self):
+        if not self.enabled or self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=settings.IMAGE_ARCHIVE_QUEUE)
+        self._tasks = [asyncio.create_task(self._writer()), asyncio.create_task(self._cleaner())]
+
+    async def stop(self, timeout: float = 5.0):
+        if not self._tasks:
+            return
+        # give queued frames a moment to reach disk
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "stored": self.stored,
+            "deduplicated": self.deduplicated,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "last_cleanup": self.last_cleanup,
+        }
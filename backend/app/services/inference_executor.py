@@ -0,0 +1,157 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# ——— Worker-process state (one EmotionCapture per process) ———
+_capture = None
+_warmup_ms = 0.0
+
+
+def _init_worker():
+    """Load the DeepFace/Keras model once per worker and run a warm-up inference"""
+    global _capture, _warmup_ms
+    from app.core.startup import startup
+    from app.services.fer_service import EmotionCapture
+
+    started = time.perf_counter()
+    _capture = EmotionCapture()
+    with startup.stage("warmup:fer"):
+        _capture.warm_up()
+    _warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+
+
+def _worker_info() -> Dict[str, object]:
+    from app.core.startup import startup
+
+    # import:* and warmup:fer timings measured inside this worker
+    return {"pid": os.getpid(), "warmup_ms": _warmup_ms, "stages": startup.snapshot()["stages"]}
+
+
+def _run_groups(groups: List[list]):
+    from app.services.fer_service import run_groups
+    return run_groups(_capture, groups)
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the FER queue is at capacity; callers should retry later"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Emotion analysis is busy, please retry shortly")
+        self.retry_after = retry_after
+
+
+class InferenceRestarting(InferenceQueueFull):
+    """Raised while a crashed worker pool is rebuilt; served as 503 + Retry-After like a full queue"""
+
+    def __init__(self, retry_after: int):
+        Exception.__init__(self, "Emotion analysis is restarting, please retry shortly")
+        self.retry_after = retry_after
+
+
+class InferenceExecutor:
+    """Pool of worker processes that run batched FER off the API process.
+
+    Workers are spawned (not forked) so TensorFlow and the Mongo client are
+    never shared across a fork, and each one warms its model before the API
+    reports the pool as started.
+
+    A worker that dies (OOM kill, native crash) breaks the whole pool. The
+    batch in flight and every dispatch until a fresh pool has warmed up fail
+    with InferenceRestarting; the pool is rebuilt once, on a background thread.
+    """
+
+    def __init__(self, workers: int, retry_after: int = 2):
+        self.workers = workers
+        self.retry_after = retry_after
+        self.workers_info: List[Dict[str, object]] = []
+        self.restarts = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._restart_lock = threading.Lock()
+        self._restarting = False
+
+    def _spawn(self) -> ProcessPoolExecutor:
+        ctx = multiprocessing.get_context("spawn")
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=ctx,
+            initializer=_init_worker,
+        )
+        # Submitting one task per worker makes the pool spawn (and warm) all of them now
+        futures = [pool.submit(_worker_info) for _ in range(self.workers)]
+        seen = {}
+        for fut in futures:
+            info = fut.result()
+            seen[info["pid"]] = info
+        self.workers_info = list(seen.values())
+        return pool
+
+    def start(self):
+        self._pool = self._spawn()
+
+    def dispatch(self, groups: List[list]) -> Future:
+        pool = self._pool
+        if pool is None:
+            raise InferenceRestarting(self.retry_after)
+        try:
+            inner = pool.submit(_run_groups, groups)
+        except BrokenProcessPool:
+            self._restart(pool)
+            raise InferenceRestarting(self.retry_after)
+
+        outer: Future = Future()
+
+        def relay(f: Future):
+            exc = f.exception()
+            if isinstance(exc, BrokenProcessPool):
+                self._restart(pool)
+                outer.set_exception(InferenceRestarting(self.retry_after))
+            elif exc is not None:
+                outer.set_exception(exc)
+            else:
+                outer.set_result(f.result())
+
+        inner.add_done_callback(relay)
+        return outer
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        """Replace ``broken`` with a fresh pool (re-running _init_worker) unless that is already under way"""
+        with self._restart_lock:
+            if self._restarting or self._pool is not broken:
+                return
+            self._restarting = True
+        threading.Thread(target=self._rebuild, args=(broken,), name="fer-pool-restart", daemon=True).start()
+
+    def _rebuild(self, broken: ProcessPoolExecutor):
+        logger.warning("FER worker pool broke; starting %d fresh workers", self.workers)
+        broken.shutdown(wait=False, cancel_futures=True)
+        try:
+            pool = self._spawn()
+        except Exception:
+            # the next failed dispatch tries again
+            logger.exception("FER worker pool restart failed")
+        else:
+            with self._restart_lock:
+                swapped = self._pool is broken
+                if swapped:
+                    self._pool = pool
+                    self.restarts += 1
+            if swapped:
+                logger.info("FER worker pool restarted (%d restarts)", self.restarts)
+            else:  # shut down while restarting
+                pool.shutdown(wait=False, cancel_futures=True)
+        finally:
+            with self._restart_lock:
+                self._restarting = False
+
+    def shutdown(self):
+        with self._restart_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
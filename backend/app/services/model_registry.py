@@ -0,0 +1,306 @@
+"""
+Versioned recommendation-model artifacts with hot swap and shadow scoring.
+
+MODEL_ARTIFACT_DIR holds one version per directory, keyed by the "version"
+in its metadata.json:
+    metadata.json, quiz_reco_logreg.joblib            the original artifact
+    <subdir>/metadata.json, <subdir>/quiz_reco_logreg.joblib
+    active.json   {"live": "1.1.0", "shadow": "1.2.0"}
+
+active.json is the selection every worker follows (without it: MODEL_VERSION
+and MODEL_SHADOW_VERSION, by default the top-level artifact and no shadow).
+The admin endpoint loads the new selection first, then rewrites the file
+atomically; each worker's watcher picks the change up within
+MODEL_WATCH_INTERVAL_S. A version is loaded and scores one
+row before it is swapped in with a single reference assignment; callers take
+one ModelVersion per analysis, so a request never mixes two models.
+
+With MODEL_MMAP the joblib files are loaded with mmap_mode="r": the numpy
+arrays of an uncompressed dump are mapped from the page cache and shared by
+every worker on the host (compressed dumps are read into memory as before).
+"""
+import json
+import logging
+import os
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.core.startup import lazy_import, startup
+from app.services.scoring import score_batch
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "quiz_reco_logreg.joblib"
+META_FILE = "metadata.json"
+ACTIVE_FILE = "active.json"
+
+DEFAULT_LABELS = ["BALANCED_IMPROVEMENT_NEEDED", "HIGH_CONTENT_GAP", "LOW_STRESS_GOOD_PROGRESS"]
+
+
+class UnknownModelVersion(KeyError):
+    """No artifact directory has this metadata version"""
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ModelVersion:
+    """One loaded artifact: the sklearn pipeline plus its metadata contract"""
+
+    def __init__(self, directory: str, metadata: Dict[str, Any], model, mtime: Optional[int]):
+        self.directory = directory
+        self.metadata = metadata
+        self.model = model
+        self.mtime = mtime
+        self.version = str(metadata.get("version", "unversioned"))
+        self.labels: List[str] = metadata.get("labels", DEFAULT_LABELS)
+        self.num_features: List[str] = metadata.get("num_features", [])
+        self.cat_features: List[str] = metadata.get("cat_features", [])
+        self.loaded_at = datetime.utcnow()
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "ModelVersion":
+        joblib = lazy_import("joblib")
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        path = os.path.join(directory, MODEL_FILE)
+        model = joblib.load(path, mmap_mode="r" if mmap else None)
+        return cls(directory, metadata, model, _mtime(path))
+
+    def score(self, feature_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return score_batch(self.model, feature_rows, self.num_features, self.cat_features, self.labels)
+
+    def warm_up(self):
+        """Score one dummy row (first predict_proba builds sklearn's internal state)"""
+        row = {name: 0.0 for name in self.num_features}
+        row.update({name: "neutral" for name in self.cat_features})
+        self.score([row])
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "directory": self.directory,
+            "labels": self.labels,
+            "num_features": self.num_features,
+            "cat_features": self.cat_features,
+            "loaded_at": self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry:
+    def __init__(
+        self,
+        artifact_dir: str,
+        features: Iterable[str],
+        live_version: str = "",
+        shadow_version: str = "",
+        mmap: bool = True,
+    ):
+        self.artifact_dir = artifact_dir
+        # features the aggregation step produces; a version asking for others is rejected
+        self.features = set(features)
+        self.default_live = live_version
+        self.default_shadow = shadow_version
+        self.mmap = mmap
+        # (live, shadow), replaced as one tuple so readers never see half a swap
+        self._active: Optional[Tuple[ModelVersion, Optional[ModelVersion]]] = None
+        self._reload_lock = threading.Lock()
+        self._signature = None
+        # skipped/duplicate directories last reported; versions() runs on every poll
+        self._discovery_problems: Tuple[str, ...] = ()
+        self._watcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.swaps = 0
+        self.last_error: Optional[str] = None
+        self.shadow_scored = 0
+        self.shadow_disagreed = 0
+
+    # ——— Artifact discovery ———
+    def versions(self) -> Dict[str, str]:
+        """version -> directory, for the top-level artifact and every subdirectory with one"""
+        found: Dict[str, str] = {}
+        problems: List[str] = []
+        candidates = [self.artifact_dir] + sorted(
+            os.path.join(self.artifact_dir, name)
+            for name in os.listdir(self.artifact_dir)
+            if os.path.isdir(os.path.join(self.artifact_dir, name))
+        )
+        for directory in candidates:
+            meta_path = os.path.join(directory, META_FILE)
+            if not (os.path.exists(meta_path) and os.path.exists(os.path.join(directory, MODEL_FILE))):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    version = str(json.load(f).get("version", "unversioned"))
+            except (OSError, ValueError) as exc:
+                problems.append(f"skipping {directory}: {exc}")
+                continue
+            if version in found:
+                problems.append(f"version {version} in both {found[version]} and {directory}; using the first")
+                continue
+            found[version] = directory
+        # logged once per change of the directory set, not on every watcher poll
+        if tuple(problems) != self._discovery_problems:
+            self._discovery_problems = tuple(problems)
+            for problem in problems:
+                logger.warning(problem)
+        return found
+
+    def selection(self) -> Dict[str, Optional[str]]:
+        """{"live", "shadow"} versions from active.json, else from the settings"""
+        try:
+            with open(os.path.join(self.artifact_dir, ACTIVE_FILE), "r", encoding="utf-8") as f:
+                active = json.load(f)
+        except FileNotFoundError:
+            active = {"live": self.default_live, "shadow": self.default_shadow}
+        return {"live": active.get("live") or None, "shadow": active.get("shadow") or None}
+
+    def _top_level_version(self) -> str:
+        with open(os.path.join(self.artifact_dir, META_FILE), "r", encoding="utf-8") as f:
+            return str(json.load(f).get("version", "unversioned"))
+
+    def signature(self) -> Tuple:
+        """Changes whenever active.json or any version's files change"""
+        paths = [os.path.join(self.artifact_dir, ACTIVE_FILE)]
+        for directory in self.versions().values():
+            paths += [os.path.join(directory, META_FILE), os.path.join(directory, MODEL_FILE)]
+        return tuple((p, _mtime(p)) for p in paths)
+
+    # ——— Loading / swapping ———
+    def _resolve(self, version: str, versions: Dict[str, str], loaded: Iterable[Optional[ModelVersion]]) -> ModelVersion:
+        """The ModelVersion for ``version``, reusing an already loaded one if its files are unchanged"""
+        if version not in versions:
+            raise UnknownModelVersion(version)
+        directory = versions[version]
+        mtime = _mtime(os.path.join(directory, MODEL_FILE))
+        for current in loaded:
+            if current is not None and (current.version, current.directory, current.mtime) == (version, directory, mtime):
+                return current
+        candidate = ModelVersion.load(directory, self.mmap)
+        unknown = set(candidate.num_features + candidate.cat_features) - self.features
+        if unknown:
+            raise ValueError(f"Model {version} needs features the aggregation does not produce: {sorted(unknown)}")
+        candidate.warm_up()
+        return candidate
+
+    def reload(self) -> Dict[str, Any]:
+        """Load the selected live/shadow versions and swap them in if they changed"""
+        return self._apply()
+
+    def _apply(self, requested: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        Load and swap in ``requested`` (persisting it as active.json), or the
+        selection already on disk. A requested selection is only written once
+        both versions have loaded, passed the feature check and warmed up, so a
+        bad one never reaches the other workers.
+        """
+        with self._reload_lock:
+            signature = self.signature()
+            selected = requested or self.selection()
+            versions = self.versions()
+            live_version = selected["live"] or self._top_level_version()
+            current_live, current_shadow = self._active or (None, None)
+
+            # the first load is part of startup; later swaps happen while serving
+            with startup.stage("load:recommendation_model") if current_live is None else nullcontext():
+                live = self._resolve(live_version, versions, (current_live, current_shadow))
+            shadow = None
+            if selected["shadow"] and selected["shadow"] != live.version:
+                shadow = self._resolve(selected["shadow"], versions, (current_shadow, current_live))
+
+            if requested is not None:
+                self._write_selection(requested)
+                signature = self.signature()
+
+            if live is not current_live or shadow is not current_shadow:
+                if current_live is not None:
+                    self.swaps += 1
+                    logger.info(
+                        "live %s -> %s, shadow %s -> %s",
+                        current_live.version, live.version,
+                        current_shadow.version if current_shadow else None,
+                        shadow.version if shadow else None,
+                    )
+                if shadow is not current_shadow:
+                    self.shadow_scored = self.shadow_disagreed = 0
+                self._active = (live, shadow)
+            self._signature = signature
+            self.last_error = None
+            return self.status()
+
+    def activate(self, live: Optional[str], shadow: Optional[str]) -> Dict[str, Any]:
+        """Switch this worker to a new selection, then persist it for every other worker"""
+        versions = self.versions()
+        for version in (live, shadow):
+            if version and version not in versions:
+                raise UnknownModelVersion(version)
+        return self._apply({"live": live or None, "shadow": shadow or None})
+
+    def _write_selection(self, selected: Dict[str, Optional[str]]):
+        path = os.path.join(self.artifact_dir, ACTIVE_FILE)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({**selected, "updated_at": datetime.utcnow().isoformat()}, f)
+        os.replace(tmp, path)
+
+    # ——— Readers ———
+    def active(self) -> Tuple[ModelVersion, Optional[ModelVersion]]:
+        """(live, shadow or None); loads the selection on first use"""
+        if self._active is None:
+            self.reload()
+        return self._active
+
+    def live(self) -> ModelVersion:
+        return self.active()[0]
+
+    def record_shadow(self, scored: int, disagreed: int):
+        self.shadow_scored += scored
+        self.shadow_disagreed += disagreed
+
+    # ——— Watcher ———
+    def start_watcher(self, interval_s: float):
+        """Poll the artifact directory; a failed reload keeps the models already loaded"""
+        if interval_s <= 0 or self._watcher is not None:
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, args=(interval_s,), name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval_s: float):
+        while not self._stop.wait(interval_s):
+            signature = self.signature()
+            if signature == self._signature:
+                continue
+            try:
+                self.reload()
+            except Exception as exc:
+                # retried once the files change again
+                self._signature = signature
+                self.last_error = f"{type(exc).__name__}: {exc}"
+                logger.error("reload failed, keeping the current models: %s", self.last_error)
+
+    def stop_watcher(self):
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def status(self) -> Dict[str, Any]:
+        live, shadow = self._active or (None, None)
+        return {
+            "live": live.info() if live else None,
+            "shadow": shadow.info() if shadow else None,
+            "available": sorted(self.versions()),
+            "swaps": self.swaps,
+            "watching": self._watcher is not None,
+            "mmap": self.mmap,
+            "last_error": self.last_error,
+            "shadow_scored": self.shadow_scored,
+            "shadow_disagreed": self.shadow_disagreed,
+        }
@@ -0,0 +1,87 @@
+"""
+Opt-in sampling profiler for individual slow requests.
+
+With PROFILE_SLOW_MS > 0, a PROFILE_SAMPLE_RATE share of requests runs under
+pyinstrument (requirements-optional.txt, imported on first use). A profile is kept
+only when the request took at least PROFILE_SLOW_MS; it is written as HTML to
+STORAGE_PATH/profiles/. Async routes are covered by RequestTimingMiddleware,
+sync routes that run in the threadpool wrap their body in ``profiled()``.
+"""
+import logging
+import os
+import random
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_unavailable = False
+
+
+def start_profiler(async_mode: bool = False):
+    """A running pyinstrument Profiler if this request is sampled, else None"""
+    global _unavailable
+    if _unavailable or settings.PROFILE_SLOW_MS <= 0 or random.random() >= settings.PROFILE_SAMPLE_RATE:
+        return None
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        _unavailable = True
+        logger.warning("PROFILE_SLOW_MS is set but pyinstrument is not installed; profiling disabled")
+        return None
+    profiler = Profiler(interval=settings.PROFILE_INTERVAL_S, async_mode="enabled" if async_mode else "disabled")
+    profiler.start()
+    return profiler
+
+
+def finish_profiler(profiler, label: str, elapsed_ms: float) -> Optional[str]:
+    """Stop the profiler; keep its report if the request was slow. Returns the report path"""
+    if profiler is None:
+        return None
+    profiler.stop()
+    if elapsed_ms < settings.PROFILE_SLOW_MS:
+        return None
+    directory = os.path.join(settings.STORAGE_PATH, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    safe_label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label).strip("_")
+    path = os.path.join(directory, f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{safe_label}_{int(elapsed_ms)}ms.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(profiler.output_html())
+    logger.info("%s took %.0f ms, profile saved to %s", label, elapsed_ms, path)
+    return path
+
+
+@contextmanager
+def profiled(label: str):
+    """Profile the enclosed (synchronous) block if sampled"""
+    profiler = start_profiler()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        finish_profiler(profiler, label, (time.perf_counter() - started) * 1000)
+
+
+class RequestTimingMiddleware:
+    """
+    Pure ASGI middleware: stamps ``request.state.started_at`` (so handlers can
+    attribute body receive/parse time) and profiles sampled async requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        scope.setdefault("state", {})["started_at"] = started
+        profiler = start_profiler(async_mode=True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            finish_profiler(profiler, f"{scope['method']} {scope['path']}", (time.perf_counter() - started) * 1000)
@@ -0,0 +1,141 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, NamedTuple, Optional
+
+
+class CachedBody(NamedTuple):
+    body: bytes          # serialized JSON, ready to send
+    etag: str
+    expires_at: float
+
+
+class _KeyLock:
+    """Single-flight lock for one key, with the number of threads using it"""
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.users = 0
+
+
+class QuizCache:
+    """
+    In-process LRU + TTL cache of serialized quiz payloads.
+
+    Entries hold the already-encoded JSON and its ETag, so a hit (or a 304)
+    skips both MongoDB and response-model serialization. Writes in this process
+    invalidate explicitly; the TTL bounds staleness across other workers.
+    Concurrent misses for the same key load once (single flight); a key's
+    lock only exists while some thread is loading or waiting on it. A load
+    that overlaps an invalidate() is returned to its caller but not cached.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_s: float = 30):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries: "OrderedDict[Hashable, CachedBody]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[Hashable, _KeyLock] = {}
+        # bumped by invalidate(); only kept for keys being loaded, like _key_locks
+        self._generations: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def make_etag(body: bytes) -> str:
+        return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def _lookup(self, key: Hashable) -> Optional[CachedBody]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _store(self, key: Hashable, body: bytes, generation: int) -> CachedBody:
+        entry = CachedBody(body, self.make_etag(body), time.monotonic() + self.ttl_s)
+        with self._lock:
+            if self._generations.get(key, 0) != generation:
+                return entry  # invalidated while loading: the body may predate the write
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Optional[bytes]]) -> Optional[CachedBody]:
+        """Cached entry for key, calling loader() on a miss; None if loader returns None"""
+        entry = self._lookup(key)
+        if entry is not None:
+            with self._lock:
+                self.hits += 1
+            return entry
+
+        with self._lock:
+            key_lock = self._key_locks.get(key)
+            if key_lock is None:
+                key_lock = self._key_locks[key] = _KeyLock()
+            key_lock.users += 1
+        try:
+            with key_lock.lock:
+                # another thread may have loaded it while we waited
+                entry = self._lookup(key)
+                if entry is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return entry
+                with self._lock:
+                    self.misses += 1
+                    generation = self._generations.get(key, 0)
+                body = loader()
+                if body is None:
+                    return None
+                return self._store(key, body, generation)
+        finally:
+            with self._lock:
+                key_lock.users -= 1
+                if not key_lock.users:
+                    del self._key_locks[key]
+                    self._generations.pop(key, None)
+
+    def invalidate(self, *keys: Hashable):
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.invalidations += 1
+                if key in self._key_locks:
+                    self._generations[key] = self._generations.get(key, 0) + 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "loading_keys": len(self._key_locks),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates or f"W/{etag}" in candidates
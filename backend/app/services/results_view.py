@@ -0,0 +1,114 @@
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.database import Database
+
+# One materialized document per student with every analyzed quiz:
+#   {"user_id": "...", "quizzes": {"<quiz_id>": {<entry>}, ...}, "backfilled": true, "updated_at": ...}
+# analyze_quiz $sets one entry per (user, quiz); results endpoints read one document.
+# "backfilled" marks documents that also hold the quizzes analyzed before they existed;
+# analyze_quiz backfills its students (backfill_ops), the CLI everyone, reads never write.
+COLLECTION = "user_results"
+
+
+def results_entry(quiz_id: int, reco: Dict[str, Any]) -> Dict[str, Any]:
+    """Per-quiz entry from the fields analyze_quiz writes to user_recommendations"""
+    return {
+        "quiz_id": quiz_id,
+        "quiz_title": reco.get("quiz_title"),
+        "stress_score": reco.get("avg_stress_score"),
+        "model_label": reco.get("model_label"),
+        "raw_model_label": reco.get("raw_model_label"),
+        "model_confidence": reco.get("model_confidence"),
+        "overridden_by_rules": reco.get("overridden_by_rules"),
+        "recommendation": reco.get("recommendation", ""),
+        "recommendations": reco.get("recommendations", []),
+    }
+
+
+def results_change(user_id: str, entry: Dict[str, Any]):
+    """(filter, update) replacing one quiz's entry in the user's results document"""
+    return (
+        {"user_id": user_id},
+        {"$set": {f"quizzes.{entry['quiz_id']}": entry, "updated_at": datetime.utcnow()}},
+    )
+
+
+def results_update(user_id: str, entry: Dict[str, Any]) -> UpdateOne:
+    return UpdateOne(*results_change(user_id, entry), upsert=True)
+
+
+def entries(doc: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return list((doc or {}).get("quizzes", {}).values())
+
+
+# ——— Response shapes ———
+def user_results_row(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Row of GET /api/quiz/results/{user_id}"""
+    return {
+        "quiz_id": entry["quiz_id"],
+        "stress_score": entry["stress_score"],
+        "recommendations": entry["recommendations"],
+    }
+
+
+def recommendation_row(user_id: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Row of GET /api/recommendations/results/{user_id} (the user_recommendations shape)"""
+    row = {k: v for k, v in entry.items() if k not in ("stress_score", "recommendation", "recommendations")}
+    row.update({
+        "user_id": user_id,
+        "recommendations": [entry["recommendation"]],
+        "stress_score": entry["stress_score"],
+    })
+    return row
+
+
+# ---------------------------
+# Backfill from user_recommendations
+# ---------------------------
+def rebuild_user_results(db: Database, user_id: str) -> Optional[Dict[str, Any]]:
+    """Rebuild one student's document from user_recommendations; None if they have none"""
+    quizzes = {
+        str(reco["quiz_id"]): results_entry(reco["quiz_id"], reco)
+        for reco in db.user_recommendations.find({"user_id": user_id}, {"_id": 0})
+    }
+    if not quizzes:
+        return None
+    doc = {"user_id": user_id, "quizzes": quizzes, "backfilled": True, "updated_at": datetime.utcnow()}
+    db[COLLECTION].replace_one({"user_id": user_id}, doc, upsert=True)
+    return doc
+
+
+def backfill_ops(db: Database, user_ids: Iterable[str]) -> List[UpdateOne]:
+    """
+    Updates merging into each of these students' documents, unless already
+    backfilled, the quizzes from user_recommendations it lacks. Entries
+    analyze_quiz already wrote are as new or newer, so they win the merge.
+    """
+    pending = [
+        doc["user_id"]
+        for doc in db[COLLECTION].find({"user_id": {"$in": list(user_ids)}, "backfilled": {"$ne": True}}, {"user_id": 1})
+    ]
+    if not pending:
+        return []
+    missing: Dict[str, Dict[str, Any]] = {}
+    for reco in db.user_recommendations.find({"user_id": {"$in": pending}}, {"_id": 0}):
+        missing.setdefault(reco["user_id"], {})[str(reco["quiz_id"])] = results_entry(reco["quiz_id"], reco)
+    return [
+        UpdateOne({"user_id": user_id, "backfilled": {"$ne": True}}, [{"$set": {
+            # one pipeline update, so an entry analyze_quiz writes meanwhile is not overwritten
+            "quizzes": {"$mergeObjects": [{"$literal": missing.get(user_id, {})}, "$quizzes"]},
+            "backfilled": True,
+            "updated_at": datetime.utcnow(),
+        }}])
+        for user_id in pending
+    ]
+
+
+def rebuild_results(db: Database) -> int:
+    """Rebuild every student's document; returns the number of students"""
+    return sum(
+        1 for user_id in db.user_recommendations.distinct("user_id")
+        if rebuild_user_results(db, user_id) is not None
+    )
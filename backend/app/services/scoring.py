@@ -0,0 +1,93 @@
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from app.core.startup import lazy_import
+
+HIGH_CONTENT_GAP = "HIGH_CONTENT_GAP"
+LOW_STRESS_GOOD_PROGRESS = "LOW_STRESS_GOOD_PROGRESS"
+BALANCED_IMPROVEMENT_NEEDED = "BALANCED_IMPROVEMENT_NEEDED"
+
+
+def model_classes(model, default_labels: Sequence[str]) -> List[str]:
+    """Class order of the classifier step, used to read predict_proba columns"""
+    if hasattr(model, "named_steps") and "classifier" in model.named_steps:
+        return model.named_steps["classifier"].classes_.tolist()
+    classes = getattr(model, "classes_", None)
+    return list(classes) if classes is not None else list(default_labels)
+
+
+def decide_final_labels(
+    wrong_ratio: np.ndarray,
+    avg_time: np.ndarray,
+    t_ratio: np.ndarray,
+    avg_stress: np.ndarray,
+    raw_labels: np.ndarray,
+    raw_conf: np.ndarray,
+):
+    """
+    Vectorized form of analysis.decide_final_label (same rules, same priority).
+    Returns (final_labels, overridden_by_rules) arrays.
+    """
+    # Strong content-gap overrides
+    gap = (wrong_ratio >= 0.8) | (
+        (wrong_ratio >= 0.6) & ((avg_time >= 20) | (t_ratio >= 0.4) | (avg_stress >= 2.5))
+    )
+    # Very strong performance
+    good = ~gap & (wrong_ratio <= 0.2) & (avg_stress < 2.0) & (t_ratio <= 0.3)
+    # Low confidence → safer middle class
+    unsure = (
+        ~gap & ~good & (raw_conf < 0.65)
+        & ~np.isin(raw_labels, [HIGH_CONTENT_GAP, LOW_STRESS_GOOD_PROGRESS])
+    )
+
+    final = np.where(gap, HIGH_CONTENT_GAP,
+             np.where(good, LOW_STRESS_GOOD_PROGRESS,
+             np.where(unsure, BALANCED_IMPROVEMENT_NEEDED, raw_labels)))
+    return final, gap | good | unsure
+
+
+def score_batch(
+    model,
+    feature_rows: List[Dict[str, Any]],
+    num_features: Sequence[str],
+    cat_features: Sequence[str],
+    labels: Sequence[str] = (),
+) -> List[Dict[str, Any]]:
+    """
+    Score many students with a single predict_proba call.
+
+    ``feature_rows`` are the "features" dicts produced by the aggregation step.
+    Returns one dict per row with raw_model_label, raw_model_confidence,
+    model_label and overridden_by_rules, in input order.
+    """
+    if not feature_rows:
+        return []
+
+    pd = lazy_import("pandas")
+    columns = list(num_features) + list(cat_features)
+    X = pd.DataFrame(feature_rows, columns=columns)
+
+    proba = np.asarray(model.predict_proba(X))
+    best = proba.argmax(axis=1)
+    classes = np.asarray(model_classes(model, labels), dtype=object)
+    raw_labels = classes[best]
+    raw_conf = proba[np.arange(len(best)), best]
+
+    def col(name):
+        return np.array([float(r.get(name, 0)) for r in feature_rows])
+
+    final, overridden = decide_final_labels(
+        col("wrong_ratio"), col("avg_time"), col("time_over_15_ratio"), col("avg_stress"),
+        raw_labels, raw_conf,
+    )
+
+    return [
+        {
+            "raw_model_label": str(raw_labels[i]),
+            "raw_model_confidence": float(raw_conf[i]),
+            "model_label": str(final[i]),
+            "overridden_by_rules": bool(overridden[i]),
+        }
+        for i in range(len(feature_rows))
+    ]
@@ -0,0 +1,104 @@
+"""
+Per-stage request timing.
+
+A StageTimer measures the stages of one request (multipart read, decode, face
+detection, inference, ...); its timings are stored with the document the
+request writes and folded into process-wide histograms, which /metrics renders
+in the Prometheus text format.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageTimer:
+    def __init__(self, endpoint: str, started: Optional[float] = None):
+        self.endpoint = endpoint
+        # perf_counter() at which the request arrived, if known (request.state.started_at, set by profiling.RequestTimingMiddleware)
+        self.started = started if started is not None else time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - started) * 1000)
+
+    def mark(self, name: str):
+        """Record the time since the previous mark (or since the timer was created) as ``name``"""
+        now = time.perf_counter()
+        self.add(name, (now - self._last) * 1000)
+        self._last = now
+
+    def add(self, name: str, ms: float):
+        self.stages[name] = round(self.stages.get(name, 0.0) + ms, 3)
+
+    def update(self, stages: Dict[str, float]):
+        for name, ms in stages.items():
+            self.add(name, ms)
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 3)
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(self.stages)
+
+    def observe(self):
+        """Fold this request's stages (and its total) into the histograms"""
+        for name, ms in self.stages.items():
+            stage_histograms.observe(self.endpoint, name, ms / 1000)
+        stage_histograms.observe(self.endpoint, "total", self.elapsed_ms() / 1000)
+
+
+class StageHistograms:
+    """Cumulative-bucket histograms keyed by (endpoint, stage)"""
+
+    def __init__(self, buckets: Iterable[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # (endpoint, stage) -> [bucket counts..., +Inf count], sum
+        self._counts: Dict[Tuple[str, str], List[int]] = {}
+        self._sums: Dict[Tuple[str, str], float] = {}
+
+    def observe(self, endpoint: str, stage: str, seconds: float):
+        key = (endpoint, stage)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    counts[i] += 1
+            counts[-1] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + seconds
+
+    def render(self, name: str = "quiz_stage_duration_seconds") -> List[str]:
+        lines = [
+            f"# HELP {name} Time spent per request stage",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for (endpoint, stage), counts in sorted(self._counts.items()):
+                labels = f'endpoint="{endpoint}",stage="{stage}"'
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {counts[-1]}')
+                lines.append(f"{name}_sum{{{labels}}} {self._sums[(endpoint, stage)]:.6f}")
+                lines.append(f"{name}_count{{{labels}}} {counts[-1]}")
+        return lines
+
+
+stage_histograms = StageHistograms()
+
+
+def gauge_lines(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+
+
+def counter_lines(name: str, help_text: str, value: float) -> List[str]:
+    return [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
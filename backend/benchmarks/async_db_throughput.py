@@ -0,0 +1,93 @@
+"""
+Concurrent throughput of a DB-bound async route on one worker: blocking pymongo
+calls inside ``async def`` (the old pattern) vs. the async repository layer.
+
+Both variants run the same student lookup that /api/auth/login performs, in one
+event loop, through httpx's ASGI transport. Needs the MongoDB from .env.
+
+Usage (from backend/):
+    python -m benchmarks.async_db_throughput --requests 2000 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+from fastapi import Depends, FastAPI, Form, HTTPException
+
+from app.models.database import get_db, close_async_client
+from app.models.repositories import Repositories, get_repos
+
+
+def blocking_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(username: str = Form(...)):
+        student = get_db().students.find_one({"username": username})  # blocks the loop
+        if not student:
+            raise HTTPException(401)
+        return {"user_id": student["user_id"]}
+
+    return app
+
+
+def async_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login")
+    async def login(username: str = Form(...), repos: Repositories = Depends(get_repos)):
+        student = await repos.students.by_username(username)
+        if not student:
+            raise HTTPException(401)
+        return {"user_id": student["user_id"]}
+
+    return app
+
+
+async def drive(app: FastAPI, total: int, concurrency: int, username: str):
+    latencies = []
+    sem = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one():
+            async with sem:
+                started = time.perf_counter()
+                await client.post("/login", data={"username": username})
+                latencies.append((time.perf_counter() - started) * 1000)
+
+        # warm both pools before timing
+        await asyncio.gather(*(one() for _ in range(concurrency)))
+        latencies.clear()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        elapsed = time.perf_counter() - started
+
+    lat = np.asarray(latencies)
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "req_per_s": round(total / elapsed, 1),
+        "p50_ms": round(float(np.percentile(lat, 50)), 2),
+        "p99_ms": round(float(np.percentile(lat, 99)), 2),
+    }
+
+
+async def main(args):
+    report = {
+        "before_blocking_pymongo": await drive(blocking_app(), args.requests, args.concurrency, args.username),
+        "after_async_repository": await drive(async_app(), args.requests, args.concurrency, args.username),
+    }
+    await close_async_client()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--username", default="bench-user")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,250 @@
+"""
+Classroom load simulation: a whole class takes one quiz at the same time.
+
+Drives the real app (app.main:app, lifespan included) in-process through
+httpx's ASGI transport. Every simulated student does
+    login -> get_quiz -> submit-answer per question (generated frames, think time)
+and once the class is done the lecturer runs analyze_quiz.
+
+The database is a throwaway local mongod (or --mongo-uri), seeded with the
+students and the quiz. FER is the real EmotionCapture with --real-fer,
+otherwise FakeEmotionCapture with --fer-latency-ms / --fer-jitter-ms.
+
+Reports throughput, p50/p95/p99 per endpoint, status codes and CPU per
+answer. With --out the report is written as JSON; --compare prints p95 and
+throughput deltas against an earlier report.
+
+Usage (from backend/):
+    python -m benchmarks.classroom_load --students 40 --questions 10 --out bench.json
+    python -m benchmarks.classroom_load --students 40 --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime
+
+import numpy as np
+from pymongo import MongoClient
+
+from benchmarks.local_mongo import local_mongod
+
+
+def make_frames(n: int, seed: int):
+    """Small grayscale JPEGs shaped like what the quiz page sends"""
+    import cv2
+
+    rng = np.random.default_rng(seed)
+    frames = []
+    for _ in range(n):
+        img = rng.integers(0, 255, (180, 240), dtype=np.uint8)
+        ok, buf = cv2.imencode(".jpg", cv2.GaussianBlur(img, (9, 9), 0), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        frames.append(buf.tobytes())
+    return frames
+
+
+def seed_class(db, students: int, questions: int) -> int:
+    """Insert the students and one quiz; returns the quiz id"""
+    from app.models.counters import allocate_question_ids, allocate_quiz_id
+
+    db.students.insert_many([
+        {"user_id": f"s{i}", "username": f"student{i}", "password": "pw", "name": f"Student {i}"}
+        for i in range(students)
+    ])
+    quiz_id = allocate_quiz_id(db)
+    db.quizzes.insert_one({
+        "quizId": quiz_id,
+        "title": "Load test quiz",
+        "question_count": questions,
+        "createdAt": datetime.utcnow(),
+        "questions": [],
+    })
+    first = allocate_question_ids(db, quiz_id, questions)
+    db.quizzes.update_one({"quizId": quiz_id}, {"$push": {"questions": {"$each": [
+        {
+            "questionId": first + i,
+            "text": f"Question {i}",
+            "options": {"a": "1", "b": "2", "c": "3", "d": "4"},
+            "correct": "a",
+            "topic": f"topic{i % 3}",
+        }
+        for i in range(questions)
+    ]}}})
+    return quiz_id
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    async def call(self, name: str, request):
+        started = time.perf_counter()
+        response = await request
+        self.latencies[name].append((time.perf_counter() - started) * 1000)
+        self.statuses[name][response.status_code] += 1
+        return response
+
+    def summary(self):
+        out = {}
+        for name, values in self.latencies.items():
+            lat = np.asarray(values)
+            out[name] = {
+                "count": len(values),
+                "p50_ms": round(float(np.percentile(lat, 50)), 2),
+                "p95_ms": round(float(np.percentile(lat, 95)), 2),
+                "p99_ms": round(float(np.percentile(lat, 99)), 2),
+                "max_ms": round(float(lat.max()), 2),
+                "status": dict(self.statuses[name]),
+            }
+        return out
+
+
+async def student(client, rec: Recorder, index: int, quiz_id: int, frames, args, rng: random.Random):
+    await asyncio.sleep(rng.uniform(0, args.ramp_s))
+    await rec.call("login", client.post("/api/auth/login", data={"username": f"student{index}", "password": "pw"}))
+    quiz = (await rec.call("get_quiz", client.get(f"/api/quizzes/{quiz_id}"))).json()
+
+    for question in quiz["questions"]:
+        await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_s)
+        picks = rng.sample(frames, args.frames)
+        files = [("images", (f"frame_{i}.jpg", data, "image/jpeg")) for i, data in enumerate(picks)]
+        answer = rng.choice(list(question["options"]))
+        await rec.call("submit_answer", client.post(
+            "/api/quiz/submit-answer",
+            data={
+                "quiz_id": quiz_id,
+                "user_id": f"s{index}",
+                "question_id": question["questionId"],
+                "selected_answer": answer,
+                "is_correct": str(answer == question["correct"]).lower(),
+                "topic": question["topic"],
+                "time_taken": rng.randint(3, 30),
+            },
+            files=files,
+        ))
+
+
+async def simulate(args):
+    import httpx
+
+    if not args.real_fer:
+        from benchmarks.fake_fer import FakeEmotionCapture, install
+        install(FakeEmotionCapture(args.fer_latency_ms, args.fer_jitter_ms, args.fer_cpu_ms, args.seed))
+
+    from app.main import app
+    from app.models.database import get_db
+
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    frames = make_frames(16, args.seed)
+
+    async with app.router.lifespan_context(app):
+        db = get_db()
+        quiz_id = await asyncio.to_thread(seed_class, db, args.students, args.questions)
+
+        transport = httpx.ASGITransport(app=app)
+        limits = httpx.Limits(max_connections=None)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120, limits=limits) as client:
+            cpu_start, wall_start = time.process_time(), time.perf_counter()
+            await asyncio.gather(*(
+                student(client, rec, i, quiz_id, frames, args, random.Random(rng.random()))
+                for i in range(args.students)
+            ))
+            wall = time.perf_counter() - wall_start
+            cpu = time.process_time() - cpu_start
+
+            # pending emotions (FER_ASYNC_MODE) must land before the lecturer analyzes
+            from app.routers import quiz as quiz_router
+            while quiz_router.emotion_pipeline.pending():
+                await asyncio.sleep(0.05)
+            await rec.call("analyze_quiz", client.post(f"/api/quizzes/analyze/{quiz_id}"))
+
+    answers = len(rec.latencies["submit_answer"])
+    return {
+        "answers": answers,
+        "wall_s": round(wall, 3),
+        "answers_per_s": round(answers / wall, 2) if wall else None,
+        # API process CPU, including the in-process HTTP client
+        "cpu_ms_per_answer": round(cpu * 1000 / answers, 2) if answers else None,
+        "endpoints": rec.summary(),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    print(f"vs {baseline.get('revision')} ({baseline.get('started_at')})")
+    old, new = baseline["results"], report["results"]
+    if old.get("answers_per_s") and new.get("answers_per_s"):
+        print(f"  answers/s       {old['answers_per_s']:>10} -> {new['answers_per_s']:>10} "
+              f"({(new['answers_per_s'] / old['answers_per_s'] - 1) * 100:+.1f}%)")
+    for name, stats in new["endpoints"].items():
+        before = old["endpoints"].get(name)
+        if before:
+            print(f"  {name:<15} p95 {before['p95_ms']:>8} -> {stats['p95_ms']:>8} ms "
+                  f"({(stats['p95_ms'] / before['p95_ms'] - 1) * 100:+.1f}%)")
+
+
+def main(args):
+    storage = tempfile.mkdtemp(prefix="bench-storage-")
+    mongo = nullcontext(args.mongo_uri) if args.mongo_uri else local_mongod()
+    with mongo as uri:
+        # Settings are read when app modules are first imported
+        os.environ.update({
+            "MONGODB_URI": uri,
+            "DATABASE_NAME": args.database,
+            "STORAGE_PATH": storage,
+            "MODEL_PATH": os.environ.get("MODEL_PATH", "app/model_artifacts"),
+        })
+        if not args.real_fer:
+            os.environ["FER_WORKERS"] = "0"
+        # every run starts from an empty database
+        MongoClient(uri).drop_database(args.database)
+        started_at = datetime.utcnow().isoformat()
+        results = asyncio.run(simulate(args))
+
+    report = {
+        "benchmark": "classroom_load",
+        "revision": git_revision(),
+        "started_at": started_at,
+        "config": vars(args),
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, default=str))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--frames", type=int, default=3, help="frames per answer")
+    parser.add_argument("--think-s", type=float, default=1.0, help="mean think time per question")
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="students join over this many seconds")
+    parser.add_argument("--real-fer", action="store_true", help="use the real EmotionCapture (FER_* settings)")
+    parser.add_argument("--fer-latency-ms", type=float, default=150)
+    parser.add_argument("--fer-jitter-ms", type=float, default=50)
+    parser.add_argument("--fer-cpu-ms", type=float, default=0, help="CPU burned per fake FER call")
+    parser.add_argument("--mongo-uri", default=None, help="existing server instead of a throwaway mongod")
+    parser.add_argument("--database", default="quiz_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="write the JSON report here")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to diff against")
+    main(parser.parse_args())
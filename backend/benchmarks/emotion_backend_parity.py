@@ -0,0 +1,135 @@
+"""
+Parity and cost of the emotion model backends (FER_MODEL_BACKEND).
+
+Each backend runs in its own spawned process so the reported RSS is that
+backend alone (what one FER worker would hold). All backends score the same
+48x48 face crops; agreement is measured against the first backend listed
+(the current Keras model by default):
+  - dominant_agreement: share of crops with the same top emotion
+  - max_abs_diff / mean_abs_diff: on the 7 normalized scores
+
+Crops come from a directory of face images (detected with the serving path's
+detector) or, with --synthetic, from random noise (latency/RSS only).
+
+Usage (from backend/):
+    python -m app.cli export-emotion-onnx --quantize
+    python -m benchmarks.emotion_backend_parity --faces samples/faces
+    python -m benchmarks.emotion_backend_parity --synthetic 512 \
+        --backend keras --backend onnx:app/model_artifacts/emotion.onnx \
+        --backend onnx:app/model_artifacts/emotion.int8.onnx
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+FACE_SIZE = 48
+
+
+def _rss_mb() -> float:
+    # ru_maxrss is KiB on Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def load_crops(path: str) -> np.ndarray:
+    from app.services.fer_service import EmotionCapture
+
+    capture = EmotionCapture(tracking="off")
+    crops = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), "rb") as f:
+            data = f.read()
+        try:
+            crop, _, _ = capture._detect_face(capture._decode(data))
+        except ValueError:
+            continue
+        crops.append(crop)
+    return np.stack(crops)[..., np.newaxis].astype(np.float32)
+
+
+def measure(spec: str, crops: np.ndarray, batch_size: int, repeats: int):
+    """Runs in a fresh process: load one backend, score every crop, report time and RSS"""
+    from app.services.emotion_backends import KerasEmotionBackend, OnnxEmotionBackend
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    name, _, path = spec.partition(":")
+    backend = OnnxEmotionBackend(path or None) if name == "onnx" else KerasEmotionBackend()
+    load_ms = (time.perf_counter() - started) * 1000
+
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+    backend.predict(batches[0])  # warm-up
+
+    per_batch = []
+    probs = None
+    for _ in range(repeats):
+        out = []
+        for batch in batches:
+            t = time.perf_counter()
+            out.append(backend.predict(batch))
+            per_batch.append((time.perf_counter() - t) * 1000)
+        probs = np.concatenate(out)
+    probs = probs / probs.sum(axis=1, keepdims=True)
+
+    return probs, {
+        "load_ms": round(load_ms, 1),
+        "batch_size": batch_size,
+        "p50_batch_ms": round(float(np.percentile(per_batch, 50)), 2),
+        "p95_batch_ms": round(float(np.percentile(per_batch, 95)), 2),
+        "ms_per_face": round(float(np.sum(per_batch)) / (repeats * len(crops)), 3),
+        "rss_mb_before_load": rss_before,
+        "rss_mb_peak": _rss_mb(),
+    }
+
+
+def main(args):
+    if args.faces:
+        crops = load_crops(args.faces)
+    else:
+        rng = np.random.default_rng(0)
+        crops = rng.random((args.synthetic, FACE_SIZE, FACE_SIZE, 1), dtype=np.float32)
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {}
+    for spec in args.backend:
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[spec] = pool.submit(measure, spec, crops, args.batch_size, args.repeats).result()
+
+    reference_spec = args.backend[0]
+    reference, _ = results[reference_spec]
+    report = {"faces": int(len(crops)), "reference": reference_spec, "backends": {}}
+    for spec, (probs, stats) in results.items():
+        diff = np.abs(probs - reference)
+        stats.update({
+            "dominant_agreement": round(float(np.mean(probs.argmax(1) == reference.argmax(1))), 4),
+            "max_abs_diff": round(float(diff.max()), 5),
+            "mean_abs_diff": round(float(diff.mean()), 5),
+        })
+        report["backends"][spec] = stats
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--faces", help="directory of face images")
+    source.add_argument("--synthetic", type=int, help="number of random 48x48 crops")
+    parser.add_argument(
+        "--backend", action="append",
+        help="keras | onnx[:path]; repeatable, the first is the reference "
+             "(default: keras, onnx, onnx int8 next to FER_ONNX_PATH)",
+    )
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    if not args.backend:
+        from app.core.config import settings
+
+        root, ext = os.path.splitext(settings.FER_ONNX_PATH)
+        args.backend = ["keras", "onnx", f"onnx:{root}.int8{ext}"]
+    main(args)
@@ -0,0 +1,126 @@
+"""
+Face detection per answer: full detection on every frame vs. the tracker-assisted
+paths of EmotionCapture ("roi" re-detects near the previous box, "reuse" crops it).
+
+Each answer is a short run of consecutive frames, like the 3 webcam shots the
+quiz page sends. Frames come either from a directory (one sub-directory of
+images per answer) or from a video cut into runs of --group frames.
+Accuracy is measured against full detection with the same detector:
+dominant-emotion agreement and mean absolute difference of the 7 scores.
+
+Usage (from backend/):
+    python -m benchmarks.face_tracking --video clip.mp4 --group 3
+    python -m benchmarks.face_tracking --frames samples/ --detectors opencv ssd
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from app.services.fer_service import EmotionCapture
+
+
+def groups_from_dir(path: str):
+    groups = []
+    for name in sorted(os.listdir(path)):
+        sub = os.path.join(path, name)
+        if not os.path.isdir(sub):
+            continue
+        frames = []
+        for fname in sorted(os.listdir(sub)):
+            with open(os.path.join(sub, fname), "rb") as f:
+                frames.append(f.read())
+        if frames:
+            groups.append(frames)
+    return groups
+
+
+def groups_from_video(path: str, group: int, step: int, limit: int):
+    cap = cv2.VideoCapture(path)
+    groups, current, index = [], [], 0
+    while len(groups) < limit:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        index += 1
+        if index % step:
+            continue
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+        current.append(buf.tobytes())
+        if len(current) == group:
+            groups.append(current)
+            current = []
+    cap.release()
+    return groups
+
+
+def run(detector: str, tracking: str, groups):
+    capture = EmotionCapture(detector_backend=detector, tracking=tracking)
+    capture.warm_up()
+    capture.detections = {k: 0 for k in capture.detections}
+
+    outputs, latencies = [], []
+    for frames in groups:
+        started = time.perf_counter()
+        outputs.append(capture.capture_batch(frames))
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    n_frames = sum(len(g) for g in groups)
+    stats = dict(capture.detections)
+    return outputs, {
+        "answers": len(groups),
+        "frames": n_frames,
+        "ms_per_answer": round(float(np.mean(latencies)), 2),
+        "detect_ms_per_frame": round(stats.pop("detect_s") * 1000 / n_frames, 2),
+        "detections": stats,
+    }
+
+
+def compare(reference, candidate):
+    agree, diffs = [], []
+    for ref_answer, cand_answer in zip(reference, candidate):
+        # one row of 7 probabilities per frame
+        for a, b in zip(ref_answer, cand_answer):
+            agree.append(a.argmax() == b.argmax())
+            diffs.append(np.abs(a - b).mean())
+    return {
+        "dominant_agreement": round(float(np.mean(agree)), 4) if agree else None,
+        "mean_abs_score_diff": round(float(np.mean(diffs)), 4) if diffs else None,
+    }
+
+
+def main(args):
+    if args.frames:
+        groups = groups_from_dir(args.frames)
+    else:
+        groups = groups_from_video(args.video, args.group, args.step, args.limit)
+    if not groups:
+        raise SystemExit("no frames found")
+
+    report = {}
+    for detector in args.detectors:
+        reference, baseline = run(detector, "off", groups)
+        report[detector] = {"off": baseline}
+        for tracking in ("roi", "reuse"):
+            outputs, result = run(detector, tracking, groups)
+            result.update(compare(reference, outputs))
+            result["detect_speedup"] = round(
+                baseline["detect_ms_per_frame"] / max(result["detect_ms_per_frame"], 1e-6), 2
+            )
+            report[detector][tracking] = result
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--frames", help="directory with one sub-directory of images per answer")
+    source.add_argument("--video", help="video file cut into answers of --group frames")
+    parser.add_argument("--group", type=int, default=3, help="frames per answer (video)")
+    parser.add_argument("--step", type=int, default=5, help="keep every Nth video frame")
+    parser.add_argument("--limit", type=int, default=100, help="max answers (video)")
+    parser.add_argument("--detectors", nargs="+", default=["opencv"])
+    main(parser.parse_args())
@@ -0,0 +1,70 @@
+"""
+Stand-in for EmotionCapture with configurable latency, so load tests measure
+the API and database rather than the emotion model.
+
+It keeps the real admission control (FER_MAX_QUEUE / InferenceQueueFull) and
+returns the same (n_frames, 7) probability arrays.
+"""
+import asyncio
+import random
+import time
+import numpy as np
+
+from app.core.config import settings
+from app.services.fer_service import EMOTION_LABELS, EmotionCapture
+from app.services.inference_executor import InferenceQueueFull
+
+
+class FakeEmotionCapture(EmotionCapture):
+    def __init__(self, latency_ms: float = 150, jitter_ms: float = 50, cpu_ms: float = 0, seed: int = 0):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.cpu_ms = cpu_ms
+        self._rng = random.Random(seed)
+
+    def start(self):
+        pass
+
+    def shutdown(self):
+        pass
+
+    def warm_up(self):
+        pass
+
+    def _burn(self):
+        # stands in for in-process inference (FER_WORKERS=0)
+        end = time.process_time() + self.cpu_ms / 1000
+        while time.process_time() < end:
+            pass
+
+    def _fake_probs(self, n: int) -> np.ndarray:
+        weights = np.array([[self._rng.random() for _ in EMOTION_LABELS] for _ in range(n)], dtype=np.float32)
+        return weights / weights.sum(axis=1, keepdims=True)
+
+    async def analyze_frames_timed(self, frames):
+        with self._lock:
+            if self._inflight >= settings.FER_MAX_QUEUE:
+                raise InferenceQueueFull(settings.FER_RETRY_AFTER_S)
+            self._inflight += 1
+        try:
+            delay = max(0.0, self.latency_ms + self._rng.uniform(-self.jitter_ms, self.jitter_ms))
+            await asyncio.sleep(delay / 1000)
+            if self.cpu_ms:
+                await asyncio.to_thread(self._burn)
+            self.metrics.observe_batch(1, len(frames), 0.0)
+            timing = {"emotion_inference": round(delay + self.cpu_ms, 3)}
+            return self._fake_probs(len(frames)), timing
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+
+def install(capture: EmotionCapture):
+    """Swap the FER engine used by every route (call before the app starts)"""
+    from app.routers import metrics, quiz
+
+    quiz.emotion_capture = capture
+    quiz.emotion_pipeline.capture = capture
+    quiz.emotion_streams.capture = capture
+    metrics.emotion_capture = capture
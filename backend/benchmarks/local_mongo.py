@@ -0,0 +1,55 @@
+"""
+Throwaway local mongod for benchmarks.
+
+mongomock only emulates the synchronous MongoClient, while the async routes go
+through pymongo's AsyncMongoClient, so the stand-in is a real mongod on a
+temporary dbpath and free port, removed again on exit.
+"""
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+from pymongo import MongoClient
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def local_mongod(binary: str = "mongod", startup_timeout_s: float = 30):
+    """Yield the URI of a fresh mongod; its data directory is deleted afterwards"""
+    if shutil.which(binary) is None:
+        raise SystemExit(f"{binary} not found on PATH; pass --mongo-uri to use an existing server")
+
+    dbpath = tempfile.mkdtemp(prefix="bench-mongod-")
+    port = _free_port()
+    proc = subprocess.Popen(
+        [binary, "--dbpath", dbpath, "--port", str(port), "--bind_ip", "127.0.0.1", "--quiet"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.STDOUT,
+    )
+    uri = f"mongodb://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + startup_timeout_s
+        while True:
+            try:
+                MongoClient(uri, serverSelectionTimeoutMS=500).admin.command("ping")
+                break
+            except Exception:
+                if proc.poll() is not None or time.monotonic() > deadline:
+                    raise SystemExit(f"mongod did not start on port {port}")
+                time.sleep(0.2)
+        yield uri
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        shutil.rmtree(dbpath, ignore_errors=True)
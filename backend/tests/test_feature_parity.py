@@ -0,0 +1,165 @@
+"""
+DB-free parity check: accumulate_responses over one quiz's response stream
+must give every user exactly what the original per-user loop computed, except
+that dominant-emotion count ties now go to the earlier label in EMOTION_LABELS
+instead of the first one answered.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.emotion_codec import EMOTION_CODES
+from app.services.feature_store import EMOTION_WEIGHTS, NEG_EMOTIONS, FeatureAccumulator, accumulate_responses
+
+
+def baseline_user_features(responses: List[Dict[str, Any]], user_id: str) -> Dict[str, Any]:
+      """Copy of aggregate_user_quiz_features before the single-pass rewrite, fed from a list"""
+      attempts = [a for a in responses if a.get("user_id") == user_id and a.get("emotion_status") != "pending"]
+      pending = sum(1 for a in responses if a.get("user_id") == user_id and a.get("emotion_status") == "pending")
+      if not attempts:
+            return {}
+
+      total = len(attempts)
+      wrong = 0
+      total_time = 0.0
+      over15 = 0
+      neg_count = 0
+
+      emo_counts: Dict[str, int] = {}
+      per_q_stress: List[float] = []
+
+      for a in attempts:
+            dom_emo = "neutral"
+            de = a.get("dominant_emotion")
+            if isinstance(de, dict):
+                  dom_emo = de.get("emotion", "neutral") or "neutral"
+            elif isinstance(de, str):
+                  dom_emo = de or "neutral"
+
+            time_taken = float(a.get("time_taken", 0))
+            is_correct = bool(a.get("is_correct", False))
+
+            total_time += time_taken
+            if time_taken > 15:
+                  over15 += 1
+            if not is_correct:
+                  wrong += 1
+            if dom_emo in NEG_EMOTIONS:
+                  neg_count += 1
+
+            emo_counts[dom_emo] = emo_counts.get(dom_emo, 0) + 1
+
+            base = EMOTION_WEIGHTS.get(dom_emo, 1)
+            stress = base + (0.5 if time_taken > 15 else 0) + (0 if is_correct else 1)
+            per_q_stress.append(stress)
+
+      avg_stress = round(float(np.mean(per_q_stress)), 4) if per_q_stress else 0.0
+      avg_time = round(total_time / total, 4) if total else 0.0
+      wrong_ratio = round(wrong / total, 4) if total else 0.0
+      time_over_15_ratio = round(over15 / total, 4) if total else 0.0
+      neg_emotion_ratio = round(neg_count / total, 4) if total else 0.0
+
+      dominant_emotion = max(emo_counts.items(), key=lambda kv: kv[1])[0] if emo_counts else "neutral"
+
+      return {
+            "features": {
+                  "avg_stress": avg_stress,
+                  "wrong_ratio": wrong_ratio,
+                  "avg_time": avg_time,
+                  "time_over_15_ratio": time_over_15_ratio,
+                  "neg_emotion_ratio": neg_emotion_ratio,
+                  "dominant_emotion": dominant_emotion,
+            },
+            "summary": {
+                  "avg_stress_score": avg_stress,
+                  "avg_time": avg_time,
+                  "wrong_answers": wrong,
+                  "emotion_counts": emo_counts if emo_counts else {},
+                  "total_questions": total,
+                  "pending_responses": pending
+            }
+      }
+
+
+def single_pass(responses: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+      """What analyze_quiz computes: accumulate_responses, dropping users with no finished answers"""
+      return {uid: acc.result() for uid, acc in accumulate_responses(responses).items() if acc.result()}
+
+
+def response(user_id, dominant, time_taken=10.0, is_correct=True, **extra) -> Dict[str, Any]:
+      doc = {"quiz_id": 1, "user_id": user_id, "time_taken": time_taken, "is_correct": is_correct, **extra}
+      if dominant is not None:
+            doc["dominant_emotion"] = dominant
+      return doc
+
+
+def assert_parity(responses: List[Dict[str, Any]]):
+      got = single_pass(responses)
+      for uid in {a["user_id"] for a in responses}:
+            expected = baseline_user_features(responses, uid)
+            if expected:
+                  counts = expected["summary"]["emotion_counts"]
+                  tied = [label for label, n in counts.items() if n == max(counts.values())]
+                  expected["features"]["dominant_emotion"] = min(tied, key=lambda l: (EMOTION_CODES.get(l, 99), l))
+            assert got.get(uid, {}) == expected, uid
+
+
+def test_legacy_dict_and_string_dominant_emotion():
+      assert_parity([
+            response("u1", {"emotion": "sad", "confidence": 0.8}, 20.0, False),
+            response("u1", "happy", 5.0),
+            response("u1", {"emotion": "", "confidence": 0.1}),
+            response("u1", ""),
+            response("u1", None, 16.0, False),
+            response("u1", {"confidence": 0.4}),
+            response("u2", "fear", 30.5, False),
+            response("u2", {"emotion": "disgust"}, 15.0),
+      ])
+
+
+def test_dominant_emotion_ties_use_label_order():
+      # two users interleaved in one stream, each with a count tie
+      responses = [
+            response("u1", "angry"),
+            response("u2", {"emotion": "happy"}),
+            response("u1", {"emotion": "sad"}),
+            response("u2", "neutral"),
+            response("u1", "sad"),
+            response("u2", "happy"),
+            response("u1", {"emotion": "angry"}),
+            response("u2", "neutral"),
+      ]
+      assert_parity(responses)
+      got = single_pass(responses)
+      assert got["u1"]["features"]["dominant_emotion"] == "angry"
+      assert got["u2"]["features"]["dominant_emotion"] == "happy"
+      # the stored $inc rows see completion order, so the answer must not depend on it
+      assert single_pass(responses[::-1]) == got
+
+
+def test_pending_rows_are_counted_not_aggregated():
+      assert_parity([
+            response("u1", None, emotion_status="pending"),
+            response("u1", "sad", 18.0, False),
+            response("u1", None, 40.0, False, emotion_status="pending"),
+            response("u1", "happy", emotion_status="done"),
+            # only pending answers: no features at all, as before
+            response("u2", None, emotion_status="pending"),
+            response("u2", None, emotion_status="pending"),
+      ])
+      assert "u2" not in single_pass([response("u2", None, emotion_status="pending")])
+
+
+def test_compact_dominant_code_matches_legacy_label():
+      legacy = [response("u1", "fear", 12.0, False), response("u1", {"emotion": "happy"}, 17.0)]
+      compact = [
+            response("u1", None, 12.0, False, dominant_code=2),
+            response("u1", None, 17.0, dominant_code=3),
+      ]
+      assert single_pass(compact) == single_pass(legacy)
+
+
+def test_stored_accumulator_round_trip():
+      responses = [response("u1", "sad", 16.5, False), response("u1", "neutral"), response("u1", None, emotion_status="pending")]
+      acc = accumulate_responses(responses)["u1"]
+      assert FeatureAccumulator.from_doc(acc.to_doc()).result() == baseline_user_features(responses, "u1")
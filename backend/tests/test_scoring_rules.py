@@ -0,0 +1,96 @@
+"""
+Parity of scoring.decide_final_labels / score_batch with the per-student
+decide_final_label and predict/predict_proba path they replaced.
+"""
+import itertools
+from typing import Any, Dict
+
+import numpy as np
+
+from app.services.scoring import decide_final_labels, score_batch
+
+LABELS = ["BALANCED_IMPROVEMENT_NEEDED", "HIGH_CONTENT_GAP", "LOW_STRESS_GOOD_PROGRESS"]
+
+
+def baseline_decide_final_label(feats: Dict[str, Any], raw_label: str, raw_conf: float) -> Dict[str, Any]:
+    """Copy of analysis.decide_final_label before it was vectorized"""
+    wrong_ratio = float(feats.get("wrong_ratio", 0))
+    avg_time = float(feats.get("avg_time", 0))
+    t_ratio = float(feats.get("time_over_15_ratio", 0))
+    avg_stress = float(feats.get("avg_stress", 0))
+
+    # Strong content-gap overrides
+    if wrong_ratio >= 0.8:
+        return {"final_label": "HIGH_CONTENT_GAP", "overridden_by_rules": True}
+    if wrong_ratio >= 0.6 and (avg_time >= 20 or t_ratio >= 0.4 or avg_stress >= 2.5):
+        return {"final_label": "HIGH_CONTENT_GAP", "overridden_by_rules": True}
+
+    # Very strong performance
+    if wrong_ratio <= 0.2 and avg_stress < 2.0 and t_ratio <= 0.3:
+        return {"final_label": "LOW_STRESS_GOOD_PROGRESS", "overridden_by_rules": True}
+
+    # Low confidence → safer middle class
+    if raw_conf < 0.65 and raw_label not in {"HIGH_CONTENT_GAP", "LOW_STRESS_GOOD_PROGRESS"}:
+        return {"final_label": "BALANCED_IMPROVEMENT_NEEDED", "overridden_by_rules": True}
+
+    return {"final_label": raw_label, "overridden_by_rules": False}
+
+
+def test_rules_match_scalar_version_at_every_threshold():
+    # each rule's threshold, and values just either side of it
+    grid = list(itertools.product(
+        [0.0, 0.2, 0.2001, 0.5999, 0.6, 0.7999, 0.8, 1.0],    # wrong_ratio
+        [0.0, 19.9999, 20.0, 45.0],                         # avg_time
+        [0.0, 0.3, 0.3001, 0.3999, 0.4, 1.0],               # time_over_15_ratio
+        [0.0, 1.9999, 2.0, 2.4999, 2.5, 6.5],               # avg_stress
+        LABELS,                                             # raw model label
+        [0.34, 0.6499, 0.65, 0.99],                         # raw model confidence
+    ))
+    columns = [np.array(values) for values in zip(*grid)]
+    final, overridden = decide_final_labels(*columns[:4], np.array(columns[4], dtype=object), columns[5])
+
+    for i, (wrong, avg_time, t_ratio, stress, label, conf) in enumerate(grid):
+        feats = {"wrong_ratio": wrong, "avg_time": avg_time, "time_over_15_ratio": t_ratio, "avg_stress": stress}
+        expected = baseline_decide_final_label(feats, label, conf)
+        assert (str(final[i]), bool(overridden[i])) == (expected["final_label"], expected["overridden_by_rules"]), feats
+
+
+class FakeModel:
+    """predict_proba from a fixed table, one row per input row"""
+
+    def __init__(self, proba, classes):
+        self.proba = np.asarray(proba, dtype=float)
+        self.classes_ = np.asarray(classes, dtype=object)
+
+    def predict_proba(self, X):
+        return self.proba[: len(X)]
+
+
+def test_score_batch_matches_per_row_path_including_probability_ties():
+    # classes_ in a different order than LABELS, and rows with tied top probabilities
+    classes = ["LOW_STRESS_GOOD_PROGRESS", "BALANCED_IMPROVEMENT_NEEDED", "HIGH_CONTENT_GAP"]
+    proba = [
+        [0.5, 0.5, 0.0],
+        [0.0, 0.5, 0.5],
+        [1 / 3, 1 / 3, 1 / 3],
+        [0.2, 0.7, 0.1],
+        [0.1, 0.25, 0.65],
+    ]
+    rows = [
+        {"avg_stress": 2.0, "wrong_ratio": 0.4, "avg_time": 12.0, "time_over_15_ratio": 0.5,
+         "neg_emotion_ratio": 0.25, "dominant_emotion": "neutral"}
+        for _ in proba
+    ]
+    model = FakeModel(proba, classes)
+    num = ["avg_stress", "wrong_ratio", "avg_time", "time_over_15_ratio", "neg_emotion_ratio"]
+    scored = score_batch(model, rows, num, ["dominant_emotion"], LABELS)
+
+    for i, (feats, got) in enumerate(zip(rows, scored)):
+        # what sklearn's predict() returned for the row: the first class on a tie
+        raw_pred = classes[int(np.argmax(proba[i]))]
+        raw_conf = float(model.proba[i][classes.index(raw_pred)])
+        expected = baseline_decide_final_label(feats, raw_pred, raw_conf)
+        assert got["raw_model_label"] == raw_pred
+        assert got["raw_model_confidence"] == raw_conf
+        assert got["model_label"] == expected["final_label"]
+        assert got["overridden_by_rules"] == expected["overridden_by_rules"]
@@ -6,11 +6,17 @@ const AdminQuizList = () => {
   const [quizzes, setQuizzes] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  const [nextAfter, setNextAfter] = useState(null);
 
-  useEffect(() => {
-    axios.get('/api/quizzes')
+  // Summary pages: no embedded questions, cursor on quizId
+  function loadPage(after) {
+    const params = { view: 'summary', limit: 50 };
+    if (after !== null) params.after = after;
+
+    return axios.get('/api/quizzes/catalog', { params })
       .then(res => {
-        setQuizzes(res.data);
+        setQuizzes(prev => (after === null ? res.data.items : [...prev, ...res.data.items]));
+        setNextAfter(res.data.next_after);
         setError(null);
       })
       .catch(err => {
@@ -20,6 +26,10 @@ const AdminQuizList = () => {
       .finally(() => {
         setLoading(false);
       });
+  }
+
+  useEffect(() => {
+    loadPage(null);
   }, []);
 
   function handleDelete(quizId) {
@@ -73,7 +83,7 @@ const AdminQuizList = () => {
               <td>{q.quizId}</td>
               <td>{q.title}</td>
               <td>{new Date(q.createdAt).toLocaleString()}</td>
-              <td>{q.questions.length}</td>
+              <td>{q.questions_added}</td>
               <td>
                 <button
                   onClick={() => handleAnalyze(q.quizId)}
@@ -92,6 +102,11 @@ const AdminQuizList = () => {
           ))}
         </tbody>
       </table>
+      {nextAfter !== null && (
+        <button onClick={() => loadPage(nextAfter)} className="load-more-btn">
+          Load more
+        </button>
+      )}
     </div>
   );
 };
@@ -5,6 +5,47 @@ import ProgressBar from './ProgressBar';
 import { useNavigate, useLocation } from 'react-router-dom';
 import axios from 'axios';
 
+// Downscale a screenshot and re-encode it as a small grayscale JPEG.
+// The server only needs luminance for the 48x48 emotion crop.
+const MAX_FRAME_WIDTH = 240;
+
+const compactFrame = (imageSrc) =>
+  new Promise((resolve, reject) => {
+    const img = new Image();
+    img.onload = () => {
+      const scale = Math.min(1, MAX_FRAME_WIDTH / img.width);
+      const canvas = document.createElement('canvas');
+      canvas.width = Math.round(img.width * scale);
+      canvas.height = Math.round(img.height * scale);
+      const ctx = canvas.getContext('2d');
+      ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
+
+      const pixels = ctx.getImageData(0, 0, canvas.width, canvas.height);
+      const d = pixels.data;
+      for (let p = 0; p < d.length; p += 4) {
+        const y = 0.299 * d[p] + 0.587 * d[p + 1] + 0.114 * d[p + 2];
+        d[p] = d[p + 1] = d[p + 2] = y;
+      }
+      ctx.putImageData(pixels, 0, 0);
+
+      canvas.toBlob(
+        (blob) => (blob && blob.size ? resolve(blob) : reject(new Error('Empty image blob'))),
+        'image/jpeg',
+        0.8
+      );
+    };
+    img.onerror = () => reject(new Error('Failed to load image'));
+    img.src = imageSrc;
+  });
+
+// While a question is on screen, frames are streamed so emotions are ready on submit
+const STREAM_INTERVAL_MS = 700;
+
+const emotionStreamUrl = (quizId, userId, questionId) => {
+  const proto = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+  return `${proto}//${window.location.host}/api/quiz/emotion-stream/${quizId}/${encodeURIComponent(userId)}/${questionId}`;
+};
+
 const Quiz = ({ questions,userId ,quizId  }) => {
   const [currentQuestion, setCurrentQuestion] = useState(0);
   const [selectedAnswer, setSelectedAnswer] = useState('');
@@ -15,10 +56,50 @@ const Quiz = ({ questions,userId ,quizId  }) => {
   const navigate = useNavigate();
   
 
+  // analyzed: frames the server reports as analyzed for this question's session
+  const streamRef = useRef({ socket: null, analyzed: 0 });
+  // bumped after a failed submit so a fresh session is registered for the retry
+  const [streamEpoch, setStreamEpoch] = useState(0);
+
   useEffect(() => {
     setQuestionStartTime(Date.now());
   }, [currentQuestion]);
 
+  // Stream compact frames for the current question over a WebSocket
+  useEffect(() => {
+    const question = questions[currentQuestion];
+    if (!question || typeof WebSocket === 'undefined') return undefined;
+
+    const socket = new WebSocket(emotionStreamUrl(quizId, userId, question.id));
+    const stream = { socket, analyzed: 0 };
+    streamRef.current = stream;
+
+    socket.onmessage = (event) => {
+      try {
+        const progress = JSON.parse(event.data);
+        if (typeof progress.frames === 'number') stream.analyzed = progress.frames;
+      } catch (parseErr) {
+        console.warn('Stream progress error:', parseErr.message);
+      }
+    };
+
+    const timer = setInterval(async () => {
+      if (socket.readyState !== WebSocket.OPEN || !webcamRef.current) return;
+      const imageSrc = webcamRef.current.getScreenshot();
+      if (!imageSrc) return;
+      try {
+        socket.send(await compactFrame(imageSrc));
+      } catch (streamErr) {
+        console.warn('Stream frame error:', streamErr.message);
+      }
+    }, STREAM_INTERVAL_MS);
+
+    return () => {
+      clearInterval(timer);
+      socket.close();
+    };
+  }, [currentQuestion, questions, quizId, userId, streamEpoch]);
+
   const captureEmotionSamples = async () => {
     if (!webcamRef.current || isSubmitting) return;
 
@@ -27,20 +108,24 @@ const Quiz = ({ questions,userId ,quizId  }) => {
     const formData = new FormData();
     const timeTaken = Math.floor((Date.now() - questionStartTime) / 1000); // in seconds
 
+    // The server confirmed analyzed frames: it will most likely just finalize them.
+    // Frames are attached regardless, since the session may live on another worker.
+    const stream = streamRef.current;
+    const confirmed = stream.analyzed > 0;
+    // This question's session is finalized by the submit; stop feeding it
+    if (stream.socket) stream.socket.close();
+    const fallbackFrames = confirmed ? 1 : 3;
+
     try {
-      // Capture 3 frames
-      for (let i = 0; i < 3; i++) {
+      for (let i = 0; i < fallbackFrames; i++) {
         try {
           const imageSrc = webcamRef.current.getScreenshot();
           if (!imageSrc) throw new Error('Webcam capture failed');
 
-          const response = await fetch(imageSrc);
-          if (!response.ok) throw new Error('Failed to fetch image');
-          const blob = await response.blob();
-          if (!blob || blob.size === 0) throw new Error('Empty image blob');
+          const blob = await compactFrame(imageSrc);
 
           formData.append('images', blob, `frame_${i}.jpg`);
-          await new Promise((resolve) => setTimeout(resolve, 1000));
+          if (i < fallbackFrames - 1) await new Promise((resolve) => setTimeout(resolve, 1000));
         } catch (captureErr) {
           console.warn(`Capture error (frame ${i}):`, captureErr.message);
         }
@@ -79,6 +164,8 @@ const Quiz = ({ questions,userId ,quizId  }) => {
     } catch (err) {
       console.error('Submit error:', err);
       setError(err.response?.data?.detail || err.message || 'Submission failed.');
+      // the old session was finalized (or never existed here): stream into a new one
+      setStreamEpoch((epoch) => epoch + 1);
     } finally {
       setIsSubmitting(false);
     }